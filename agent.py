@@ -1,7 +1,7 @@
 # agent.py - Hybrid Jarvis (voice + memory + crawler + offline LLM + OpenAI fallback)
 
-import os, asyncio, logging, json
-from typing import List, Tuple, Dict, Any
+import os, sys, asyncio, logging, json
+from typing import List, Tuple, Dict, Any, Iterator
 from dotenv import load_dotenv
 
 logging.basicConfig(level=logging.INFO)
@@ -10,65 +10,84 @@ logger = logging.getLogger("jarvis")
 # Load environment variables
 load_dotenv()
 WEATHERAPI_KEY = os.getenv("WEATHERAPI_KEY")
+# Wikipedia's API sends no cache validators; reuse its answers for this long
+WIKI_CACHE_TTL = float(os.getenv("WIKI_CACHE_TTL", str(24 * 3600)))
+
+import startup
+from startup import LazyResource, timed
 
 # Voice libraries
-try:
-    import pyttsx3, speech_recognition as sr
-except Exception:
-    pyttsx3 = None
-    sr = None
+with timed("import voice libs"):
+    try:
+        import pyttsx3, speech_recognition as sr
+    except Exception:
+        pyttsx3 = None
+        sr = None
 
 # Repo modules
-from key_manager import APIKeyManager
-from utils import clean_text, chunk_text, embed_text
-from crawler import crawl_web
-from memory import MemoryManager
-from memory_store import ConversationMemory
-from memory_loop import MemoryExtractor
-from llm_offline import OfflineLLM
-
-# OpenAI fallback
-try:
-    import openai
-except Exception:
-    openai = None
+with timed("import repo modules"):
+    from key_manager import APIKeyManager
+    from utils import clean_text, chunk_text, embed_text, get_embed_model
+    from crawler import crawl_web
+    from http_cache import cached_get
+    from memory import MemoryManager
+    from memory_store import ConversationMemory
+    from memory_loop import MemoryExtractor
+    from llm_offline import OfflineLLM
+    from llm_server import get_server
+    from streaming import sentences, apipelined, first_nonempty
+    from response_cache import ResponseCache
+    from context_packer import ContextPacker, token_counter
+    from llm_router import LLMRouter, Provider, RouterError
+    from openai_client import get_openai_client
 
 # Key manager
 key_manager = APIKeyManager()
 
-# Initialize TTS
-TTS_ENGINE = None
-if pyttsx3:
-    try:
-        TTS_ENGINE = pyttsx3.init()
-        TTS_ENGINE.setProperty("rate", 150)
-    except Exception as e:
-        logger.warning("TTS init failed: %s", e)
+# OpenAI fallback: async client on a shared keep-alive connection pool (None without aiohttp)
+openai_client = get_openai_client(key_manager)
+
+# Heavy resources load behind readiness futures (JARVIS_STARTUP=background|lazy|eager);
+# attribute access on a LazyResource blocks only until that resource is ready.
+
+def _init_tts():
+    if not pyttsx3:
+        return None
+    engine = pyttsx3.init()
+    engine.setProperty("rate", 150)
+    return engine
+
+# TTS is created lazily on the main thread by the greeting (SAPI engines are thread-bound)
+TTS_ENGINE = LazyResource("tts", _init_tts, mode="lazy")
 
 def speak(text: str):
     print("Jarvis:", text)
-    if TTS_ENGINE:
+    engine = TTS_ENGINE.get()
+    if engine:
         try:
-            TTS_ENGINE.say(text)
-            TTS_ENGINE.runAndWait()
+            engine.say(text)
+            engine.runAndWait()
         except Exception:
             pass
 
+# speak each sentence as soon as it is generated (STREAM_TTS=0 waits for the full answer)
+STREAM_TTS = os.getenv("STREAM_TTS", "1") != "0"
+
+async def speak_stream(tokens: Iterator[str]) -> str:
+    """Speak a token stream sentence by sentence while it is still being generated; returns the full text."""
+    return await apipelined(sentences(tokens), speak)
+
 # STT setup
 RECOGNIZER = sr.Recognizer() if sr else None
-MIC = None
-if sr:
-    try:
-        MIC = sr.Microphone()
-    except Exception:
-        MIC = None
+MIC = LazyResource("microphone", lambda: sr.Microphone() if sr else None)
 
 def listen(timeout: int = None, phrase_time_limit: int = 8) -> str:
     """Return user speech as text, fallback to input"""
-    if RECOGNIZER is None or MIC is None:
+    mic = MIC.get()
+    if RECOGNIZER is None or mic is None:
         return input("You (type): ")
     try:
-        with MIC as source:
+        with mic as source:
             RECOGNIZER.adjust_for_ambient_noise(source, duration=0.6)
             print("Listening...")
             audio = RECOGNIZER.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
@@ -76,50 +95,113 @@ def listen(timeout: int = None, phrase_time_limit: int = 8) -> str:
     except Exception:
         return input("You (type): ")
 
+# Embedding model (memory in vector mode needs it; warm it up early)
+EMBED_MODEL = LazyResource("embed_model", get_embed_model)
+
+# Answers to repeated / paraphrased questions, invalidated when the memories behind them change
+FALLBACK_ANSWER = "Sorry, mujhe iska answer nahi mila."
+INTERRUPTED_ANSWER = "Sorry, answer beech mein ruk gaya."
+response_cache = ResponseCache(
+    embed_fn=embed_text if os.getenv("MEMORY_MODE", "vector") == "vector" else None,
+    max_items=int(os.getenv("RESPONSE_CACHE_ITEMS", "1000")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600))),
+    threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92")),
+    path=os.path.join("memories", "response_cache.json"),
+) if os.getenv("RESPONSE_CACHE", "on") != "off" else None
+
+def _init_memory() -> MemoryManager:
+    mm = MemoryManager(
+        mode=os.getenv("MEMORY_MODE", "vector"),
+        max_items=int(os.getenv("MEMORY_MAX_ITEMS", "50000")),
+        max_bytes=int(os.getenv("MEMORY_MAX_BYTES", str(200 * 1024 * 1024))),
+        ttl=float(os.getenv("MEMORY_TTL")) if os.getenv("MEMORY_TTL") else None,
+    )
+    if response_cache is not None:
+        mm.add_listener(response_cache.on_memory_change)
+    return mm
+
 # Memory
-memory = MemoryManager()
-conv_mem = ConversationMemory(user_id="Gaurav")
+memory = LazyResource("memory", _init_memory)
+conv_mem = ConversationMemory(user_id="Gaurav", max_messages=int(os.getenv("CONV_MAX_MESSAGES", "200")))
 session_history: List[Dict[str, Any]] = []
 
 # Memory extractor
 mem_extractor = MemoryExtractor(session_history, user_id="Gaurav")
 
-# Offline LLM
-offline = OfflineLLM(model_name=os.getenv("OFFLINE_MODEL") or None)
+# Offline LLM, shared by every caller through one batching inference server
+offline = LazyResource("offline_llm", lambda: OfflineLLM(model_name=os.getenv("OFFLINE_MODEL") or None))
+llm_server = LazyResource("llm_server", lambda: get_server(offline.get()), mode="lazy")
+
+# Retrieved memories are packed into a token budget (they contain earlier turns, which snowball)
+packer = ContextPacker(budget=int(os.getenv("CONTEXT_TOKENS", "1024")),
+                       max_passage_tokens=int(os.getenv("CONTEXT_PASSAGE_TOKENS", "384")))
+_openai_token_count = token_counter(model="gpt-3.5-turbo")
 
-# OpenAI helper
-def call_openai_chat(prompt: str, max_tokens: int = 500) -> str:
-    key = key_manager.get_key()
-    if not key:
+def prompt_token_counter():
+    """Token counter of the model that will answer: the offline model's tokenizer, else OpenAI's."""
+    server = llm_server.get()
+    return server.llm.count_tokens if server else _openai_token_count
+
+# OpenAI helper (retries, key rotation and timeouts live in the client)
+def call_openai_chat(prompt: str, max_tokens: int = 500, cancel=None) -> str:
+    if openai_client is None:
         return ""
     try:
-        openai.api_key = key
-        resp = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=max_tokens
-        )
-        return resp["choices"][0]["message"]["content"].strip()
-    except Exception:
-        key_manager.rotate_key()
+        return openai_client.chat_sync(prompt, max_tokens, cancel=cancel).strip()
+    except Exception as e:
+        logger.warning("OpenAI chat failed: %s", e)
         return ""
 
+def call_openai_chat_stream(prompt: str, max_tokens: int = 500, cancel=None) -> Iterator[str]:
+    """Streamed chat completion, yielding content deltas; ends early on error."""
+    if openai_client is None:
+        return
+    try:
+        yield from openai_client.stream_sync(prompt, max_tokens, cancel=cancel)
+    except Exception as e:
+        logger.warning("OpenAI stream failed: %s", e)
+
+# LLM providers: offline first; OpenAI is hedged in when the offline model is slow or failing
+def _offline_server():
+    server = llm_server.get()
+    if not server:
+        raise RuntimeError("offline model not loaded")
+    return server
+
+def _openai_client():
+    if openai_client is None:
+        raise RuntimeError("aiohttp not installed")
+    return openai_client
+
+router = LLMRouter(
+    [Provider("offline", generate=lambda p, cancel: _offline_server().generate(p, cancelled=cancel),
+              stream=lambda p, cancel: _offline_server().stream(p, cancelled=cancel)),
+     Provider("openai", generate=lambda p, cancel: _openai_client().chat_sync(p, cancel=cancel),
+              stream=lambda p, cancel: _openai_client().stream_sync(p, cancel=cancel))],
+    hedge_after=float(os.getenv("LLM_HEDGE_AFTER", "2.0")),
+    deadline=float(os.getenv("LLM_DEADLINE", "30")),
+)
+
 # LLM wrapper
+def call_llm_stream(prompt: str) -> Iterator[str]:
+    """
+    Token stream from the first provider to start answering, else the
+    fallback message; a provider failing mid-answer ends it with an apology.
+    """
+    def fallback():
+        yield FALLBACK_ANSWER
+    try:
+        yield from first_nonempty(lambda: router.stream(prompt), fallback)
+    except Exception as e:
+        logger.warning("LLM answer cut off: %s", e)
+        yield "\n" + INTERRUPTED_ANSWER
+
 def call_llm(prompt: str) -> str:
-    # Offline first
-    if offline and getattr(offline, "model", None):
-        try:
-            ans = offline.generate(prompt)
-            if ans:
-                return ans
-        except Exception:
-            pass
-    # Online fallback
-    if openai:
-        ans = call_openai_chat(prompt)
-        if ans:
-            return ans
-    return "Sorry, mujhe iska answer nahi mila."
+    try:
+        return router.generate(prompt)
+    except RouterError as e:
+        logger.warning("No LLM answer: %s", e)
+        return FALLBACK_ANSWER
 
 # Weather
 def get_weather_city(city: str) -> str:
@@ -141,20 +223,40 @@ def get_weather_city(city: str) -> str:
 
 # Brain answer
 def brain_answer(query: str, chat_history: List[Tuple[str, str]]) -> str:
-    # Memory retrieval
-    docs = memory.retrieve(query, top_k=4)
-    if docs:
-        context = "\n\n".join(docs)
-        prompt = f"Use context:\n{context}\n\nQuestion: {query}"
-        ans = call_llm(prompt)
-        if ans:
-            return ans
+    return "".join(brain_answer_stream(query, chat_history))
+
+def brain_answer_stream(query: str, chat_history: List[Tuple[str, str]]) -> Iterator[str]:
+    # Cached answer: no retrieval, no model, no API key
+    if response_cache is not None:
+        cached = response_cache.get(query)
+        if cached is not None:
+            yield cached
+            return
+    deps: List[int] = []
+    parts: List[str] = []
+    for tok in _answer_stream(query, deps):
+        parts.append(tok)
+        yield tok
+    ans = "".join(parts)
+    if response_cache is not None and ans and ans != FALLBACK_ANSWER and not ans.endswith(INTERRUPTED_ANSWER):
+        response_cache.put(query, ans, deps)
+
+def _answer_stream(query: str, deps: List[int]) -> Iterator[str]:
+    """Uncached answer; ids of the memories it is based on are appended to deps."""
+    # Memory retrieval (skipped if the memory store failed to load)
+    mem = memory.get()
+    hits = mem.search_records(query, top_k=int(os.getenv("CONTEXT_CANDIDATES", "8"))) if mem is not None else []
+    prompt = packer.build_prompt(query, [(rec["text"], score) for rec, score in hits],
+                                 prompt_token_counter()) if hits else None
+    if prompt:
+        deps.extend(rec["id"] for rec, _ in hits)
+        yield from call_llm_stream(prompt)
+        return
 
     # Wikipedia fallback
     try:
-        import requests
         params = {"action": "opensearch", "search": query, "limit": 1, "format": "json"}
-        r = requests.get("https://en.wikipedia.org/w/api.php", params=params, timeout=6)
+        r = cached_get("https://en.wikipedia.org/w/api.php", params=params, timeout=6, min_ttl=WIKI_CACHE_TTL)
         data = r.json()
         if data and len(data) > 1 and data[1]:
             title = data[1][0]
@@ -166,23 +268,30 @@ def brain_answer(query: str, chat_history: List[Tuple[str, str]]) -> str:
                 "titles": title,
                 "format": "json"
             }
-            r2 = requests.get("https://wikipedia.org/w/api.php", params=q, timeout=6)
+            r2 = cached_get("https://wikipedia.org/w/api.php", params=q, timeout=6, min_ttl=WIKI_CACHE_TTL)
             j = r2.json()
             for _, page in j["query"]["pages"].items():
                 extract = page.get("extract", "")
                 if extract:
-                    memory.add_text(extract)
-                    return f"{title}: {extract[:300]}..."
+                    if mem is not None:
+                        deps.append(mem.add_text(extract, meta={"source": "wikipedia"}))
+                    yield f"{title}: {extract[:300]}..."
+                    return
     except Exception:
         pass
 
     # Final fallback
-    return call_llm(query)
+    yield from call_llm_stream(query)
 
 # Main assistant loop
-async def assistant_loop():
+async def assistant_loop(profile_startup: bool = False):
     task = asyncio.create_task(mem_extractor.run(check_interval=1.0))
-    speak("Hello, main Jarvis hoon. Boliye.")
+    with timed("greeting"):
+        speak("Hello, main Jarvis hoon. Boliye.")
+    if profile_startup:
+        for res in (MIC, EMBED_MODEL, memory, offline):
+            res.get()
+        print(startup.report())
     learning_enabled = True
     chat_history: List[Tuple[str, str]] = []
 
@@ -205,7 +314,8 @@ async def assistant_loop():
 
             # Clear memory
             if "clear memory" in u:
-                memory.clear()
+                if memory.get() is not None:
+                    memory.clear()
                 conv_mem.clear()
                 speak("Memory cleared.")
                 continue
@@ -220,16 +330,40 @@ async def assistant_loop():
                 continue
 
             # General Q&A
-            ans = brain_answer(user_text, chat_history)
-            speak(ans)
+            # the answer is produced off the event loop so the memory extractor keeps running
+            # one failed turn must not end the session
+            try:
+                if STREAM_TTS:
+                    ans = await speak_stream(brain_answer_stream(user_text, chat_history))
+                else:
+                    ans = await asyncio.to_thread(brain_answer, user_text, chat_history)
+                    speak(ans)
+            except Exception as e:
+                logger.exception("Answering failed: %s", e)
+                ans = FALLBACK_ANSWER
+                speak(ans)
             session_history.append({"role": "assistant", "content": ans})
             conv_mem.append_message("assistant", ans)
             chat_history.append((user_text, ans))
 
-            if learning_enabled:
-                memory.add_text(f"Q: {user_text}\nA: {ans}")
+            if learning_enabled and memory.get() is not None:
+                memory.add_text(f"Q: {user_text}\nA: {ans}", meta={"source": "conversation"})
 
     finally:
+        if memory.get() is not None:
+            memory.close()
+        if response_cache is not None:
+            response_cache.save()
+            logger.info("Response cache: %s (hit rate %.0f%%)", response_cache.stats, 100 * response_cache.hit_rate())
+        logger.info("LLM providers: %s", router.report())
+        if packer.stats["turns"]:
+            logger.info("Prompts: %d turns, mean %.0f / max %d tokens", packer.stats["turns"],
+                        packer.mean_prompt_tokens(), packer.stats["max_prompt_tokens"])
+        if llm_server.ready() and llm_server.get():
+            llm_server.close()
+        if openai_client is not None:
+            logger.info("OpenAI client: %s; keys: %s", openai_client.stats, key_manager.report())
+            openai_client.close()
         mem_extractor.stop()
         task.cancel()
         try:
@@ -240,6 +374,6 @@ async def assistant_loop():
 # Start
 if __name__ == "__main__":
     try:
-        asyncio.run(assistant_loop())
+        asyncio.run(assistant_loop(profile_startup="--profile-startup" in sys.argv))
     except Exception as e:
         logger.exception("Error: %s", e)
@@ -0,0 +1,308 @@
+# async_crawler.py
+import os, re, time, asyncio, logging
+from typing import AsyncIterator, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+
+from crawler import COURSE_DIR, EXTRACTOR, MAX_PAGE_SECONDS, extract_page
+from http_cache import HTTPCache, content_charset, get_http_cache
+if EXTRACTOR == "lxml":
+    from html_extract import StreamingExtractor, extract_stream
+from utils import chunk_text, save_chunked_content
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "JarvisCrawler/1.0"
+
+def normalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    """
+    Canonical form used for frontier dedup: absolute, http(s) only, lowercase
+    scheme/host, default port and fragment dropped, query params sorted.
+    """
+    if base:
+        url = urljoin(base, url)
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        return None
+    host = parts.hostname.lower()
+    if parts.port and parts.port != {"http": 80, "https": 443}[scheme]:
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path) or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+def host_of(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+class Page(NamedTuple):
+    url: str
+    depth: int
+    status: int
+    text: str
+    links: List[str]
+
+
+class HostLimiter:
+    """Per-host concurrency cap plus a minimum interval between request starts."""
+    def __init__(self, per_host: int = 2, delay: float = 0.5):
+        self.per_host = per_host
+        self.delay = delay
+        self._sems: Dict[str, asyncio.Semaphore] = {}
+        self._delays: Dict[str, float] = {}
+        self._next: Dict[str, float] = {}
+
+    def set_delay(self, host: str, delay: float) -> None:
+        """Slow a host down (e.g. robots.txt Crawl-delay); never below the default."""
+        self._delays[host] = max(delay, self.delay)
+
+    async def acquire(self, host: str) -> asyncio.Semaphore:
+        """Wait for a slot and the host's next start time; release the returned semaphore when done."""
+        sem = self._sems.setdefault(host, asyncio.Semaphore(self.per_host))
+        await sem.acquire()
+        now = time.monotonic()
+        start = max(now, self._next.get(host, 0.0))
+        self._next[host] = start + self._delays.get(host, self.delay)
+        if start > now:
+            await asyncio.sleep(start - now)
+        return sem
+
+
+class RobotsCache:
+    """robots.txt per host, fetched once through the crawler's session."""
+    def __init__(self, user_agent: str = USER_AGENT):
+        self.user_agent = user_agent
+        self._parsers: Dict[str, Optional[RobotFileParser]] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    async def get(self, session: aiohttp.ClientSession, url: str) -> Optional[RobotFileParser]:
+        parts = urlsplit(url)
+        key = f"{parts.scheme}://{parts.netloc}"
+        if key in self._parsers:
+            return self._parsers[key]
+        if key in self._pending:
+            return await self._pending[key]
+        fut = self._pending[key] = asyncio.get_running_loop().create_future()
+        parser: Optional[RobotFileParser] = None
+        try:
+            async with session.get(key + "/robots.txt") as r:
+                if r.status == 200:
+                    parser = RobotFileParser()
+                    parser.parse((await r.text(errors="replace")).splitlines())
+                elif r.status in (401, 403):
+                    parser = RobotFileParser()
+                    parser.disallow_all = True
+        except Exception as e:
+            logger.debug("robots.txt fetch failed for %s: %s", key, e)
+        self._parsers[key] = parser
+        fut.set_result(parser)
+        del self._pending[key]
+        return parser
+
+    async def allowed(self, session: aiohttp.ClientSession, url: str) -> Tuple[bool, Optional[float]]:
+        parser = await self.get(session, url)
+        if parser is None:
+            return True, None
+        return parser.can_fetch(self.user_agent, url), parser.crawl_delay(self.user_agent)
+
+
+class AsyncCrawler:
+    """
+    Concurrent crawler over one shared aiohttp connection pool.
+
+    A frontier queue of normalized, deduplicated URLs is drained by
+    `concurrency` workers; each host gets at most per_host requests in
+    flight and `delay` seconds between request starts (or its robots.txt
+    Crawl-delay, if larger). Links are followed up to max_depth within
+    allowed_domains (default: the start URLs' hosts). Pages are yielded by
+    crawl() as they arrive. With an HTTPCache, fresh pages are not refetched
+    and stale ones are revalidated with a conditional GET.
+    """
+    def __init__(self, start_urls: Iterable[str], max_pages: int = 100, max_depth: int = 2,
+                 allowed_domains: Optional[Iterable[str]] = None, concurrency: int = 16,
+                 per_host: int = 2, delay: float = 0.5, timeout: float = 10.0,
+                 respect_robots: bool = True, user_agent: str = USER_AGENT,
+                 max_bytes: int = 5 * 1024 * 1024, cache: Optional[HTTPCache] = None):
+        self.start_urls = [u for u in (normalize_url(u) for u in start_urls) if u]
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        domains = allowed_domains or {urlsplit(u).hostname for u in self.start_urls}
+        self.allowed_domains = {d.lower() for d in domains}
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.respect_robots = respect_robots
+        self.user_agent = user_agent
+        self.max_bytes = max_bytes
+        self.cache = cache
+        self.limiter = HostLimiter(per_host, delay)
+        self.robots = RobotsCache(user_agent)
+        self.per_host = per_host
+        self.seen: Set[str] = set()
+        self.stats: Dict[str, int] = {"fetched": 0, "cached": 0, "revalidated": 0, "errors": 0,
+                                       "skipped": 0, "robots_blocked": 0}
+
+    def in_scope(self, url: str) -> bool:
+        host = urlsplit(url).hostname or ""
+        return any(host == d or host.endswith("." + d) for d in self.allowed_domains)
+
+    def _schedule(self, frontier: asyncio.Queue, url: str, depth: int) -> None:
+        if url in self.seen or len(self.seen) >= self.max_pages or not self.in_scope(url):
+            return
+        self.seen.add(url)
+        frontier.put_nowait((url, depth))
+
+    def _extract(self, body: bytes, charset: Optional[str]) -> Tuple[str, List[str]]:
+        if EXTRACTOR == "lxml":
+            return extract_stream([body], self.max_bytes, MAX_PAGE_SECONDS, charset)
+        return extract_page(body.decode(charset or "utf-8", errors="replace"))
+
+    async def _read(self, r: aiohttp.ClientResponse) -> Tuple[str, List[str], Optional[bytes]]:
+        """
+        Stream the body into the extractor, keeping a copy for the cache.
+        Returns (text, hrefs, body); body is None if a size or time limit cut it short.
+        """
+        ex = StreamingExtractor(self.max_bytes, MAX_PAGE_SECONDS, r.charset) if EXTRACTOR == "lxml" else None
+        buf = bytearray() if self.cache or ex is None else None
+        size, complete = 0, True
+        async for chunk in r.content.iter_chunked(65536):
+            if size + len(chunk) > self.max_bytes:
+                chunk, complete = chunk[:self.max_bytes - size], False
+            size += len(chunk)
+            if buf is not None:
+                buf += chunk
+            if ex is not None and not ex.feed(chunk):
+                complete = False
+            if not complete:
+                break
+        if ex is not None:
+            text, hrefs = ex.close()
+        else:
+            text, hrefs = extract_page(bytes(buf).decode(r.charset or "utf-8", errors="replace"))
+        return text, hrefs, bytes(buf) if complete and buf is not None else None
+
+    async def _fetch(self, session: aiohttp.ClientSession, url: str, depth: int) -> Optional[Page]:
+        entry = self.cache.lookup(url) if self.cache else None
+        if entry is not None and (self.cache.offline or self.cache.is_fresh(entry)):
+            self.stats["cached"] += 1
+            return self._page(url, depth, 200, *self._extract(entry.body, content_charset(entry.headers)))
+        if self.cache and self.cache.offline:
+            self.stats["skipped"] += 1
+            return None
+        if self.respect_robots:
+            ok, crawl_delay = await self.robots.allowed(session, url)
+            if not ok:
+                self.stats["robots_blocked"] += 1
+                return None
+            if crawl_delay:
+                self.limiter.set_delay(host_of(url), crawl_delay)
+        headers = self.cache.conditional_headers(entry) if entry is not None else None
+        sem = await self.limiter.acquire(host_of(url))
+        try:
+            async with session.get(url, allow_redirects=True, headers=headers) as r:
+                if r.status == 304 and entry is not None:
+                    self.stats["revalidated"] += 1
+                    self.cache.refresh(entry, r.headers)
+                    return self._page(url, depth, 200, *self._extract(entry.body, content_charset(entry.headers)))
+                ctype = r.headers.get("Content-Type", "")
+                if r.status != 200 or "html" not in ctype:
+                    self.stats["skipped"] += 1
+                    return None
+                final = normalize_url(str(r.url)) or url
+                text, hrefs, body = await self._read(r)
+                if self.cache:
+                    if body is not None:
+                        self.cache.store(url, r.status, r.headers, body)
+                    else:
+                        logger.info("Not caching %s: body cut at %d bytes / %.0fs", url, self.max_bytes,
+                                    MAX_PAGE_SECONDS)
+        finally:
+            sem.release()
+        self.stats["fetched"] += 1
+        return self._page(final, depth, r.status, text, hrefs)
+
+    @staticmethod
+    def _page(url: str, depth: int, status: int, text: str, hrefs: List[str]) -> Page:
+        return Page(url, depth, status, text, [l for l in (normalize_url(h, url) for h in hrefs) if l])
+
+    async def _worker(self, session, frontier: asyncio.Queue, out: asyncio.Queue) -> None:
+        while True:
+            url, depth = await frontier.get()
+            try:
+                page = await self._fetch(session, url, depth)
+                if page:
+                    if depth < self.max_depth:
+                        for link in page.links:
+                            self._schedule(frontier, link, depth + 1)
+                    await out.put(page)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning("crawl failed for %s: %s", url, e)
+            finally:
+                frontier.task_done()
+
+    async def crawl(self) -> AsyncIterator[Page]:
+        """Yield pages as they are fetched until the frontier is exhausted or max_pages is reached."""
+        frontier: asyncio.Queue = asyncio.Queue()
+        out: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(connector=connector, headers={"User-Agent": self.user_agent},
+                                         timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            for url in self.start_urls:
+                self._schedule(frontier, url, 0)
+            workers = [asyncio.create_task(self._worker(session, frontier, out)) for _ in range(self.concurrency)]
+
+            async def _done():
+                await frontier.join()
+                await out.put(None)
+            watcher = asyncio.create_task(_done())
+            try:
+                while True:
+                    page = await out.get()
+                    if page is None:
+                        break
+                    yield page
+            finally:
+                watcher.cancel()
+                for w in workers:
+                    w.cancel()
+                await asyncio.gather(watcher, *workers, return_exceptions=True)
+
+
+def _slug(url: str) -> str:
+    parts = urlsplit(url)
+    return re.sub(r"[^A-Za-z0-9]+", "_", parts.netloc + parts.path).strip("_")[:120] or "index"
+
+async def crawl_site(start_urls: Iterable[str], out_dir: str = COURSE_DIR, **kwargs) -> List[str]:
+    """Crawl and save each page's chunks to out_dir/<slug>.json; returns the written paths."""
+    kwargs.setdefault("cache", get_http_cache())
+    crawler = AsyncCrawler(start_urls, **kwargs)
+    written = []
+    async for page in crawler.crawl():
+        if not page.text:
+            continue
+        path = os.path.join(out_dir, _slug(page.url) + ".json")
+        save_chunked_content(chunk_text(page.text), path)
+        written.append(path)
+    logger.info("crawl_site: %s", crawler.stats)
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(description="Crawl a site into chunked course files.")
+    ap.add_argument("urls", nargs="+")
+    ap.add_argument("--max-pages", type=int, default=100)
+    ap.add_argument("--max-depth", type=int, default=2)
+    ap.add_argument("--per-host", type=int, default=2)
+    ap.add_argument("--delay", type=float, default=0.5)
+    ap.add_argument("--out", default=COURSE_DIR)
+    args = ap.parse_args()
+    paths = asyncio.run(crawl_site(args.urls, args.out, max_pages=args.max_pages, max_depth=args.max_depth,
+                                   per_host=args.per_host, delay=args.delay))
+    print(f"Saved {len(paths)} pages to {args.out}")
@@ -0,0 +1,186 @@
+# bm25_index.py
+import os, re, json, math, heapq, logging
+from array import array
+from bisect import bisect_left
+from typing import List, Dict, Tuple, Optional, Set
+
+from utils import clean_text
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text: str) -> List[str]:
+    """clean_text() + lowercase word tokens."""
+    return _TOKEN_RE.findall(clean_text(text).lower())
+
+
+class _Postings:
+    """Doc ids (ascending) and term frequencies for one term; df counts live docs."""
+    __slots__ = ("docs", "tfs", "max_tf", "df")
+
+    def __init__(self):
+        self.docs = array("q")
+        self.tfs = array("i")
+        self.max_tf = 0
+        self.df = 0
+
+
+class BM25Index:
+    """
+    Incremental in-memory inverted index with BM25 scoring.
+    Documents are appended with increasing integer ids, so posting lists stay
+    sorted without re-sorting. search() uses MaxScore dynamic pruning: terms
+    whose upper-bound contribution cannot lift a document into the current
+    top-k are only probed (by bisect) for documents found via the others.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, _Postings] = {}
+        self._doc_len: Dict[int, int] = {}
+        self._total_len = 0
+        self._deleted: Set[int] = set()
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def ids(self) -> List[int]:
+        return list(self._doc_len)
+
+    def add(self, doc_id: int, text: str) -> None:
+        """Index one document; doc_id must be larger than any id added before."""
+        tokens = tokenize(text)
+        counts: Dict[str, int] = {}
+        for tok in tokens:
+            counts[tok] = counts.get(tok, 0) + 1
+        for tok, tf in counts.items():
+            p = self._postings.get(tok)
+            if p is None:
+                p = self._postings[tok] = _Postings()
+            p.docs.append(doc_id)
+            p.tfs.append(tf)
+            p.df += 1
+            if tf > p.max_tf:
+                p.max_tf = tf
+        self._doc_len[doc_id] = len(tokens)
+        self._total_len += len(tokens)
+
+    def remove(self, doc_id: int, text: Optional[str] = None) -> None:
+        """Tombstone a document; its postings are skipped at query time.
+        Pass the document's text to take it out of df right away; otherwise
+        it still counts towards df until the index is saved and reloaded."""
+        n = self._doc_len.pop(doc_id, None)
+        if n is not None:
+            self._total_len -= n
+            self._deleted.add(doc_id)
+            if text is not None:
+                for tok in set(tokenize(text)):
+                    p = self._postings.get(tok)
+                    if p is not None and p.df:
+                        p.df -= 1
+
+    def _idf(self, df: int) -> float:
+        # clamped: a stale df can exceed the live doc count, and a negative
+        # idf would break the MaxScore upper bounds
+        n = len(self._doc_len)
+        return max(0.0, math.log(1.0 + (n - df + 0.5) / (df + 0.5)))
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Return up to top_k (doc_id, bm25 score) pairs, best first."""
+        if not self._doc_len or top_k <= 0:
+            return []
+        k1, b = self.k1, self.b
+        avgdl = self._total_len / len(self._doc_len) or 1.0
+        terms = []
+        for tok in set(tokenize(query)):
+            p = self._postings.get(tok)
+            if p is None:
+                continue
+            idf = self._idf(p.df)
+            ub = idf * (k1 + 1) * p.max_tf / (p.max_tf + k1 * (1 - b))
+            terms.append((ub, idf, p))
+        if not terms:
+            return []
+        terms.sort(key=lambda t: t[0])
+        prefix, acc = [], 0.0
+        for ub, _, _ in terms:
+            acc += ub
+            prefix.append(acc)
+
+        def term_score(idf, tf, dl):
+            return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+
+        pos = [0] * len(terms)
+        heap: List[Tuple[float, int]] = []
+        threshold = 0.0
+        first_essential = 0
+        while True:
+            # next candidate = smallest current doc among essential lists
+            doc = None
+            for i in range(first_essential, len(terms)):
+                p = terms[i][2]
+                if pos[i] < len(p.docs) and (doc is None or p.docs[pos[i]] < doc):
+                    doc = p.docs[pos[i]]
+            if doc is None:
+                break
+            dl = self._doc_len.get(doc)
+            score = 0.0
+            for i in range(first_essential, len(terms)):
+                _, idf, p = terms[i]
+                if pos[i] < len(p.docs) and p.docs[pos[i]] == doc:
+                    if dl is not None:
+                        score += term_score(idf, p.tfs[pos[i]], dl)
+                    pos[i] += 1
+            if dl is None:
+                continue
+            # non-essential terms, highest bound first, while they can still matter
+            for i in range(first_essential - 1, -1, -1):
+                if score + prefix[i] <= threshold:
+                    break
+                _, idf, p = terms[i]
+                pos[i] = bisect_left(p.docs, doc, pos[i])
+                if pos[i] < len(p.docs) and p.docs[pos[i]] == doc:
+                    score += term_score(idf, p.tfs[pos[i]], dl)
+            if len(heap) < top_k:
+                heapq.heappush(heap, (score, doc))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, doc))
+            else:
+                continue
+            if len(heap) == top_k:
+                threshold = heap[0][0]
+                while first_essential < len(terms) and prefix[first_essential] <= threshold:
+                    first_essential += 1
+                if first_essential == len(terms):
+                    break
+        return [(doc, score) for score, doc in sorted(heap, key=lambda x: (-x[0], x[1]))]
+
+    # ---- persistence ----
+    def save(self, path: str) -> None:
+        """Write the index as JSON (tombstoned docs are dropped)."""
+        postings = {}
+        for tok, p in self._postings.items():
+            keep = [(d, tf) for d, tf in zip(p.docs, p.tfs) if d not in self._deleted]
+            if keep:
+                postings[tok] = [[d for d, _ in keep], [tf for _, tf in keep]]
+        data = {"k1": self.k1, "b": self.b, "doc_len": self._doc_len, "postings": postings}
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        idx = cls(data["k1"], data["b"])
+        idx._doc_len = {int(d): n for d, n in data["doc_len"].items()}
+        idx._total_len = sum(idx._doc_len.values())
+        for tok, (docs, tfs) in data["postings"].items():
+            p = idx._postings[tok] = _Postings()
+            p.docs.extend(docs)
+            p.tfs.extend(tfs)
+            p.max_tf = max(tfs)
+            p.df = len(docs)
+        return idx
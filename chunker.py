@@ -0,0 +1,128 @@
+# chunker.py
+import re, logging
+from collections import deque
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# sentence end (punctuation incl. Devanagari danda, optional closing quote/bracket, whitespace)
+# or a paragraph break (blank line)
+_BOUNDARY = re.compile(r'[.!?।]+["\'\)\]]*\s+|\n[ \t]*\n\s*')
+_WORD = re.compile(r'\S+')
+
+class Sentence(NamedTuple):
+    text: str
+    start: int          # character offsets into the source stream
+    end: int
+    paragraph_end: bool
+
+class Chunk(NamedTuple):
+    text: str
+    start: int
+    end: int
+
+Source = Union[str, Iterable[str]]
+
+def _pieces(source: Source, read_size: int) -> Iterator[str]:
+    """Text pieces from a string, a file-like object (read()) or any iterable of strings (e.g. lines)."""
+    if isinstance(source, str):
+        for i in range(0, len(source), read_size):
+            yield source[i:i + read_size]
+    elif hasattr(source, "read"):
+        while True:
+            piece = source.read(read_size)
+            if not piece:
+                break
+            yield piece
+    else:
+        yield from source
+
+def _sentence(buf: str, lo: int, hi: int, base: int, paragraph_end: bool) -> Optional[Sentence]:
+    raw = buf[lo:hi]
+    text = raw.strip()
+    if not text:
+        return None
+    start = base + lo + (len(raw) - len(raw.lstrip()))
+    return Sentence(" ".join(text.split()), start, start + len(text), paragraph_end)
+
+def iter_sentences(source: Source, read_size: int = 65536, max_chars: int = 8192) -> Iterator[Sentence]:
+    """
+    Stream sentences out of source with their character offsets. Only the
+    unfinished tail is buffered; text with no boundary for max_chars is cut at
+    the last whitespace so memory stays bounded.
+    """
+    buf, base = "", 0
+    for piece in _pieces(source, read_size):
+        buf += piece
+        pos = 0
+        for m in _BOUNDARY.finditer(buf):
+            if m.end() == len(buf):
+                break                       # the whitespace run may continue in the next piece
+            s = _sentence(buf, pos, m.end(), base, m.group().count("\n") >= 2)
+            if s:
+                yield s
+            pos = m.end()
+        while len(buf) - pos > max_chars:
+            cut = buf.rfind(" ", pos, pos + max_chars)
+            cut = cut if cut > pos else pos + max_chars
+            s = _sentence(buf, pos, cut, base, False)
+            if s:
+                yield s
+            pos = cut
+        buf, base = buf[pos:], base + pos
+    s = _sentence(buf, 0, len(buf), base, True)
+    if s:
+        yield s
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+def _split_long(sent: Sentence, max_tokens: int, count: Callable[[str], int]) -> Iterator[Sentence]:
+    """Word windows of a sentence that alone exceeds the budget."""
+    words = list(_WORD.finditer(sent.text))
+    per_word = max(count(sent.text) / max(len(words), 1), 1e-6)
+    step = max(1, int(max_tokens / per_word))
+    offset = sent.start
+    for i in range(0, len(words), step):
+        part = words[i:i + step]
+        lo, hi = part[0].start(), part[-1].end()
+        last = i + step >= len(words)
+        yield Sentence(sent.text[lo:hi], offset + lo, offset + hi, sent.paragraph_end and last)
+
+def iter_chunks(source: Source, max_tokens: int = 256, overlap: int = 32,
+                count_tokens: Optional[Callable[[str], int]] = None,
+                min_fill: float = 0.5) -> Iterator[Chunk]:
+    """
+    Pack whole sentences into chunks of at most max_tokens (words by default,
+    or model tokens via count_tokens). Consecutive chunks share up to overlap
+    tokens of trailing sentences; a paragraph break ends the chunk once it is
+    min_fill full. Runs in memory proportional to one chunk.
+    """
+    count = count_tokens or count_words
+    overlap = min(overlap, max_tokens // 2)
+    window: deque = deque()                 # (Sentence, tokens)
+    size = fresh = 0
+
+    def flush() -> Chunk:
+        nonlocal size, fresh
+        chunk = Chunk(" ".join(s.text for s, _ in window), window[0][0].start, window[-1][0].end)
+        while window and size > overlap:
+            size -= window.popleft()[1]
+        fresh = 0
+        return chunk
+
+    for sent in iter_sentences(source):
+        n = count(sent.text)
+        parts = [(sent, n)] if n <= max_tokens else [(p, count(p.text)) for p in _split_long(sent, max_tokens, count)]
+        for s, n in parts:
+            if fresh and size + n > max_tokens:
+                yield flush()
+            while window and size + n > max_tokens:     # overlap tail must leave room
+                size -= window.popleft()[1]
+            window.append((s, n))
+            size += n
+            fresh += 1
+            if s.paragraph_end and size >= max_tokens * min_fill:
+                yield flush()
+    if fresh:
+        yield flush()
@@ -0,0 +1,141 @@
+# context_packer.py
+import re, math, logging
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from chunker import iter_sentences
+
+logger = logging.getLogger(__name__)
+
+# scaffolding of our own earlier prompts echoed back into stored answers
+_ECHO = re.compile(r"^(?:A:\s*)?(?:Offline LLM response:\s*)?(?:Use )?context:\s*$|^Question:\s", re.IGNORECASE)
+
+def heuristic_count(text: str) -> int:
+    """Rough token count (~1.3 tokens per word) when no tokenizer is at hand."""
+    return math.ceil(len(text.split()) * 1.3)
+
+def token_counter(tokenizer=None, model: Optional[str] = None) -> Callable[[str], int]:
+    """
+    Token counter for the model that will see the prompt: an HF tokenizer,
+    else tiktoken for an OpenAI model name (if installed), else heuristic_count.
+    """
+    if tokenizer is not None:
+        return lambda text: len(tokenizer(text, add_special_tokens=False).input_ids)
+    if model:
+        try:
+            import tiktoken
+            enc = tiktoken.encoding_for_model(model)
+            return lambda text: len(enc.encode(text))
+        except Exception:
+            pass
+    return heuristic_count
+
+def _units(text: str) -> Iterable[str]:
+    """Sentences of text, never crossing a line break."""
+    for line in text.split("\n"):
+        if line.strip() and not _ECHO.search(line.strip()):
+            for s in iter_sentences(line):
+                yield s.text
+
+def _key(unit: str) -> str:
+    return " ".join(re.findall(r"\w+", unit.lower()))
+
+def _fit(unit: str, room: int, count: Callable[[str], int]) -> str:
+    """Longest word-boundary prefix of unit that counts at most room tokens ("" if none)."""
+    words = unit.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count(" ".join(words[:mid])) <= room:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo])
+
+
+class PackStats(NamedTuple):
+    candidates: int
+    used: int
+    truncated: int
+    duplicate_units: int
+    context_tokens: int
+    prompt_tokens: int
+
+
+class ContextPacker:
+    """
+    Fits retrieved passages into a token budget. Passages are taken best
+    score first; sentences already present (repeated turns, nested earlier
+    contexts) are dropped, each passage is capped at max_passage_tokens and
+    the last one is cut at a sentence boundary to fit. A passage whose first
+    sentence alone does not fit (unpunctuated captions or crawled text) is
+    cut at a word boundary instead of being dropped. Per-turn stats are
+    logged and accumulated in self.stats.
+    """
+    def __init__(self, budget: int = 1024, max_passage_tokens: int = 384, min_tokens: int = 16,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        self.budget = budget
+        self.max_passage_tokens = max_passage_tokens
+        self.min_tokens = min_tokens
+        self.count_tokens = count_tokens or heuristic_count
+        self.last: Optional[PackStats] = None
+        self.stats: Dict[str, float] = {"turns": 0, "prompt_tokens": 0, "max_prompt_tokens": 0,
+                                        "context_tokens": 0, "dropped_tokens": 0}
+
+    def pack(self, passages: List[Tuple[str, float]], count_tokens: Optional[Callable[[str], int]] = None
+             ) -> Tuple[List[str], Tuple[int, int, int, int]]:
+        """Packed passage texts in rank order, and (used, truncated, duplicate sentences, tokens)."""
+        count = count_tokens or self.count_tokens
+        seen = set()
+        out: List[str] = []
+        used_tokens = truncated = dups = 0
+        for text, _ in sorted(passages, key=lambda p: p[1], reverse=True):
+            room = min(self.budget - used_tokens, self.max_passage_tokens)
+            if room < self.min_tokens:
+                break
+            kept, tokens, cut = [], 0, False
+            for unit in _units(text):
+                k = _key(unit)
+                if not k or k in seen:
+                    dups += 1
+                    continue
+                n = count(unit) + 1
+                if tokens + n > room:
+                    cut = True
+                    if not kept:
+                        head = _fit(unit, room - 1, count)
+                        if head:
+                            seen.add(k)
+                            kept.append(head)
+                            tokens += count(head) + 1
+                    break
+                seen.add(k)
+                kept.append(unit)
+                tokens += n
+            if kept:
+                out.append(" ".join(kept))
+                used_tokens += tokens
+                truncated += cut
+        return out, (len(out), truncated, dups, used_tokens)
+
+    def build_prompt(self, query: str, passages: List[Tuple[str, float]],
+                     count_tokens: Optional[Callable[[str], int]] = None) -> Optional[str]:
+        """The "Use context" prompt for query, or None when no passage survives packing."""
+        count = count_tokens or self.count_tokens
+        packed, (used, truncated, dups, context_tokens) = self.pack(passages, count)
+        if not packed:
+            return None
+        prompt = "Use context:\n" + "\n\n".join(packed) + f"\n\nQuestion: {query}"
+        prompt_tokens = count(prompt)
+        raw_tokens = sum(count(text) for text, _ in passages)
+        self.last = PackStats(len(passages), used, truncated, dups, context_tokens, prompt_tokens)
+        self.stats["turns"] += 1
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["max_prompt_tokens"] = max(self.stats["max_prompt_tokens"], prompt_tokens)
+        self.stats["context_tokens"] += context_tokens
+        self.stats["dropped_tokens"] += max(0, raw_tokens - context_tokens)
+        logger.info("Prompt %d tokens: %d/%d passages, %d truncated, %d duplicate sentences, "
+                    "context %d/%d tokens (raw %d)", prompt_tokens, used, len(passages), truncated, dups,
+                    context_tokens, self.budget, raw_tokens)
+        return prompt
+
+    def mean_prompt_tokens(self) -> float:
+        return self.stats["prompt_tokens"] / self.stats["turns"] if self.stats["turns"] else 0.0
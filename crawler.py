@@ -1,19 +1,32 @@
 # crawler.py
 import os, requests, logging, re
+from typing import Any, Dict, List, Tuple
 from bs4 import BeautifulSoup
 from utils import clean_text, chunk_text, save_chunked_content
+from http_cache import cached_get
+from transcripts import Segment, chunk_by_time, cite, parse_captions
 
 logger = logging.getLogger(__name__)
 COURSE_DIR = "courses"
 os.makedirs(COURSE_DIR, exist_ok=True)
 
-# (optional) yt-dlp transcript function if yt_dlp installed
-def get_youtube_transcript(url: str) -> str:
+# "lxml": stream the body through html_extract (bounded time/memory), "bs4": BeautifulSoup tree
+try:
+    from html_extract import extract_stream
+    EXTRACTOR = os.getenv("CRAWL_EXTRACTOR", "lxml")
+except Exception:
+    EXTRACTOR = "bs4"
+MAX_PAGE_BYTES = int(os.getenv("CRAWL_MAX_BYTES", str(5 * 1024 * 1024)))
+MAX_PAGE_SECONDS = float(os.getenv("CRAWL_MAX_SECONDS", "5"))
+
+# (optional) yt-dlp transcript functions if yt_dlp installed
+def get_youtube_segments(url: str) -> List[Segment]:
+    """Deduplicated, time-aligned caption segments of a YouTube video ([] if unavailable)."""
     try:
         from yt_dlp import YoutubeDL
     except Exception:
         logger.warning("yt_dlp not installed; can't fetch youtube transcripts.")
-        return ""
+        return []
     ydl_opts = {"skip_download": True, "quiet": True, "writesubtitles": True, "writeautomaticsub": True}
     try:
         with YoutubeDL(ydl_opts) as ydl:
@@ -21,30 +34,54 @@ def get_youtube_transcript(url: str) -> str:
             # try automatic captions
             subs = info.get("automatic_captions") or info.get("subtitles") or {}
             if not subs:
-                return ""
+                return []
             en = subs.get("en") or subs.get("en-US") or subs.get(next(iter(subs.keys())))
             if not en:
-                return ""
-            # en could be a list of dicts with 'url'
-            urlm = en[0].get("url")
-            if urlm:
-                r = requests.get(urlm, timeout=10)
-                text = re.sub(r'<.*?>', '', r.text)
-                return clean_text(text)
+                return []
+            # en is a list of {"ext", "url"} tracks; take a format we can stream-parse
+            tracks = {t.get("ext"): t for t in en if t.get("url")}
+            fmt = next((f for f in ("json3", "vtt", "srt") if f in tracks), None)
+            if fmt is None:
+                return []
+            # signed caption URLs change per request, so they bypass the HTTP cache
+            with requests.get(tracks[fmt]["url"], timeout=10, stream=True) as r:
+                r.raise_for_status()
+                r.encoding = r.encoding or "utf-8"
+                src = r.iter_content(65536, decode_unicode=True) if fmt == "json3" else r.iter_lines(decode_unicode=True)
+                return list(parse_captions(src, fmt))
     except Exception as e:
         logger.warning("YouTube transcript fetch failed: %s", e)
-    return ""
+    return []
+
+def get_youtube_transcript(url: str) -> str:
+    return clean_text(" ".join(seg.text for seg in get_youtube_segments(url)))
+
+def get_youtube_chunks(url: str, window: float = 60.0) -> List[Dict[str, Any]]:
+    """Transcript chunks of about `window` seconds with start/end times and a timestamped link."""
+    return [{"text": c.text, "start": c.start, "end": c.end, "url": cite(url, c.start)}
+            for c in chunk_by_time(get_youtube_segments(url), window)]
+
+def extract_page(html: str) -> Tuple[str, List[str]]:
+    """Paragraph text and raw link hrefs of an HTML page."""
+    soup = BeautifulSoup(html, "html.parser")
+    links = [a["href"] for a in soup.find_all("a", href=True)]
+    for s in soup(["script", "style", "noscript", "header", "footer", "nav", "aside"]):
+        s.decompose()
+    texts = [p.get_text(separator=" ", strip=True) for p in soup.find_all("p")]
+    joined = "\n\n".join(t for t in texts if t)
+    return clean_text(joined), links
 
 def crawl_web(url: str) -> str:
     try:
-        r = requests.get(url, timeout=10, headers={"User-Agent":"Mozilla/5.0"})
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
-        for s in soup(["script", "style", "noscript", "header", "footer", "nav", "aside"]):
-            s.decompose()
-        texts = [p.get_text(separator=" ", strip=True) for p in soup.find_all("p")]
-        joined = "\n\n".join(t for t in texts if t)
-        return clean_text(joined)
+        # recrawls are served from the HTTP cache or cost a conditional GET; a fetched body
+        # streams into the extractor and is cached only if the extractor read all of it
+        with cached_get(url, timeout=10, headers={"User-Agent":"Mozilla/5.0"}, stream=True) as r:
+            r.raise_for_status()
+            if EXTRACTOR == "lxml":
+                return extract_stream(r.iter_content(65536), max_bytes=MAX_PAGE_BYTES,
+                                      max_seconds=MAX_PAGE_SECONDS,
+                                      encoding=r.encoding if "charset" in r.headers.get("Content-Type", "") else None)[0]
+            return extract_page(r.text)[0]
     except Exception as e:
         logger.warning("crawl_web failed for %s: %s", url, e)
         return ""
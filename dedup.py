@@ -0,0 +1,195 @@
+# dedup.py
+import os, re, json, zlib, logging, argparse
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX32 = np.uint64(0xFFFFFFFF)
+
+def shingles(text: str, size: int = 3) -> np.ndarray:
+    """Distinct crc32 hashes of lowercase word n-grams."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) > size:
+        grams = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    else:
+        grams = {" ".join(words)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHashIndex:
+    """
+    MinHash-LSH index for near-duplicate and nested-duplicate detection.
+
+    Each text gets a num_perm MinHash signature plus its shingle count, which
+    lets us estimate containment (|A & B| / |A|) and not just Jaccard. LSH
+    banding means a lookup only verifies ids sharing a band bucket, so ingest
+    cost stays sub-linear in the number of stored memories.
+
+    Containment is only trusted when both texts have at least min_shingles
+    shingles and their sizes are within max_ratio of each other: short Q/A
+    pairs share most shingles through boilerplate answers, and the estimate
+    is too noisy across very different sizes. Other pairs must match on
+    Jaccard similarity instead.
+    """
+    def __init__(self, num_perm: int = 128, bands: int = 32, threshold: float = 0.8, seed: int = 1,
+                 min_shingles: int = 20, max_ratio: float = 20.0):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.min_shingles = min_shingles
+        self.max_ratio = max_ratio
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+        self._tables: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self._sigs: Dict[int, Tuple[np.ndarray, int]] = {}
+
+    def __len__(self):
+        return len(self._sigs)
+
+    def ids(self) -> List[int]:
+        return list(self._sigs)
+
+    def signature(self, text: str) -> Tuple[np.ndarray, int]:
+        """(MinHash signature, shingle count) for a text."""
+        x = shingles(text)
+        phv = ((x[None, :] * self._a[:, None] + self._b[:, None]) % _PRIME) & _MAX32
+        return phv.min(axis=1).astype(np.uint32), len(x)
+
+    def _keys(self, sig: np.ndarray):
+        for band in range(self.bands):
+            yield band, sig[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def match(self, sig: np.ndarray, size: int) -> Tuple[Optional[str], Optional[int]]:
+        """
+        Compare against stored texts:
+          ("duplicate", id)  - the new text is (nearly) contained in id
+          ("supersedes", id) - id is (nearly) contained in the new text
+          (None, None)       - nothing above threshold
+        """
+        seen = set()
+        best: Tuple[Optional[str], Optional[int]] = (None, None)
+        for band, key in self._keys(sig):
+            for doc_id in self._tables[band].get(key, ()):
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                other, osize = self._sigs[doc_id]
+                j = float(np.mean(sig == other))
+                if (min(size, osize) < self.min_shingles
+                        or max(size, osize) > self.max_ratio * max(1, min(size, osize))):
+                    if j >= self.threshold:
+                        return "duplicate", doc_id
+                    continue
+                inter = j * (size + osize) / (1.0 + j)
+                if size and inter / size >= self.threshold:
+                    return "duplicate", doc_id
+                if best[0] is None and osize and inter / osize >= self.threshold:
+                    best = ("supersedes", doc_id)
+        return best
+
+    def add(self, doc_id: int, sig: np.ndarray, size: int) -> None:
+        self._sigs[doc_id] = (sig, size)
+        for band, key in self._keys(sig):
+            self._tables[band].setdefault(key, []).append(doc_id)
+
+    def remove(self, doc_id: int) -> None:
+        entry = self._sigs.pop(doc_id, None)
+        if entry is None:
+            return
+        for band, key in self._keys(entry[0]):
+            bucket = self._tables[band].get(key)
+            if bucket and doc_id in bucket:
+                bucket.remove(doc_id)
+                if not bucket:
+                    del self._tables[band][key]
+
+    # ---- persistence ----
+    def save(self, path: str) -> None:
+        ids = np.fromiter(self._sigs, dtype=np.int64, count=len(self._sigs))
+        sigs = np.stack([s for s, _ in self._sigs.values()]) if len(ids) else np.zeros((0, self.num_perm), np.uint32)
+        sizes = np.fromiter((n for _, n in self._sigs.values()), dtype=np.int64, count=len(ids))
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, ids=ids, sigs=sigs, sizes=sizes,
+                     params=np.array([self.num_perm, self.bands], dtype=np.int64),
+                     threshold=np.array(self.threshold), min_shingles=np.array(self.min_shingles),
+                     max_ratio=np.array(self.max_ratio))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "MinHashIndex":
+        data = np.load(path)
+        num_perm, bands = (int(v) for v in data["params"])
+        idx = cls(num_perm, bands, float(data["threshold"]))
+        if "min_shingles" in data:
+            idx.min_shingles = int(data["min_shingles"])
+            idx.max_ratio = float(data["max_ratio"])
+        for doc_id, sig, size in zip(data["ids"].tolist(), data["sigs"], data["sizes"].tolist()):
+            idx.add(doc_id, sig, size)
+        return idx
+
+
+def _text_of(item) -> str:
+    return item if isinstance(item, str) else item["text"]
+
+
+def dedup_file(path: str, out: Optional[str] = None, threshold: float = 0.8,
+               index_path: Optional[str] = None, index_out: Optional[str] = None) -> Dict[str, int]:
+    """
+    Deduplicate a memory.json (list or journal snapshot) or faiss_text.json.
+    Near-duplicates keep the first copy; when a later entry contains an
+    earlier one (the nested "Q: ... A: ... Context: ..." pattern) only the
+    larger entry is kept. With index_path, rows of that flat faiss index are
+    filtered to match the kept texts.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    items = data["memories"] if isinstance(data, dict) else data
+    index = MinHashIndex(threshold=threshold)
+    kept = set()
+    for pos, item in enumerate(items):
+        sig, size = index.signature(_text_of(item))
+        verdict, other = index.match(sig, size)
+        if verdict == "duplicate":
+            continue
+        if verdict == "supersedes":
+            index.remove(other)
+            kept.discard(other)
+        index.add(pos, sig, size)
+        kept.add(pos)
+    keep_pos = sorted(kept)
+    result = [items[p] for p in keep_pos]
+    out = out or path
+    before = os.path.getsize(path)
+    tmp = out + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dict(data, memories=result) if isinstance(data, dict) else result, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, out)
+    if index_path:
+        from vector_index import read_flat_index, write_flat_index
+        vecs = read_flat_index(index_path)
+        write_flat_index(index_out or index_path, vecs[keep_pos])
+    return {"items_before": len(items), "items_after": len(result),
+            "bytes_before": before, "bytes_after": os.path.getsize(out)}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Remove near-duplicate memories from a JSON memory file.")
+    ap.add_argument("path", help="memories/memory.json or faiss_text.json")
+    ap.add_argument("--out", help="write result here instead of in place")
+    ap.add_argument("--threshold", type=float, default=0.8, help="containment needed to count as duplicate (default 0.8)")
+    ap.add_argument("--index", help="flat faiss index whose rows follow the texts (e.g. faiss.index)")
+    ap.add_argument("--index-out", help="write the filtered index here instead of in place")
+    args = ap.parse_args()
+    stats = dedup_file(args.path, args.out, args.threshold, args.index, args.index_out)
+    saved = stats["bytes_before"] - stats["bytes_after"]
+    pct = 100.0 * saved / stats["bytes_before"] if stats["bytes_before"] else 0.0
+    print(f"{stats['items_before']} -> {stats['items_after']} memories, "
+          f"{stats['bytes_before']} -> {stats['bytes_after']} bytes (saved {saved}, {pct:.1f}%)")
@@ -0,0 +1,106 @@
+# embed_cache.py
+import os, hashlib, sqlite3, threading, logging
+from collections import OrderedDict
+from typing import List, Optional, Dict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def normalize_text(text: str) -> str:
+    """Whitespace-insensitive form used for cache keys."""
+    return " ".join(text.split())
+
+def cache_key(model_name: str, text: str) -> bytes:
+    return hashlib.sha256((model_name + "\0" + normalize_text(text)).encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: key = sha256(model name + normalized text).
+    An in-memory LRU sits in front of a SQLite table of float32 blobs, so the
+    same Q/A strings, crawled chunks or Wikipedia extracts are encoded once.
+    """
+    def __init__(self, path: str = "cache/embeddings.sqlite", lru_size: int = 10000):
+        self.path = path
+        self.lru_size = lru_size
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS emb (k BLOB PRIMARY KEY, dim INTEGER, v BLOB)")
+        self._lru: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _remember(self, key: bytes, vec: np.ndarray) -> None:
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        """Cached vectors (None for misses), in key order."""
+        out: List[Optional[np.ndarray]] = [None] * len(keys)
+        with self._lock:
+            todo = []
+            for i, k in enumerate(keys):
+                vec = self._lru.get(k)
+                if vec is not None:
+                    self._lru.move_to_end(k)
+                    out[i] = vec
+                    self.stats["memory_hits"] += 1
+                else:
+                    todo.append(i)
+            # one round trip per 500 keys (SQLite's host parameter limit is 999)
+            for start in range(0, len(todo), 500):
+                part = todo[start:start + 500]
+                wanted = list({keys[i] for i in part})
+                rows = self._db.execute(
+                    "SELECT k, dim, v FROM emb WHERE k IN (%s)" % ",".join("?" * len(wanted)), wanted).fetchall()
+                found = {k: np.frombuffer(v, dtype=np.float32).reshape(dim) for k, dim, v in rows}
+                for i in part:
+                    vec = found.get(keys[i])
+                    if vec is not None:
+                        out[i] = vec
+                        self._remember(keys[i], vec)
+                        self.stats["disk_hits"] += 1
+                    else:
+                        self.stats["misses"] += 1
+        return out
+
+    def put_many(self, keys: List[bytes], vecs) -> None:
+        vecs = np.asarray(vecs, dtype=np.float32)
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO emb (k, dim, v) VALUES (?, ?, ?)",
+                                 [(k, v.shape[0], v.tobytes()) for k, v in zip(keys, vecs)])
+            self._db.commit()
+            for k, v in zip(keys, vecs):
+                self._remember(k, v)
+
+    def hit_rate(self) -> float:
+        total = sum(self.stats.values())
+        return (self.stats["memory_hits"] + self.stats["disk_hits"]) / total if total else 0.0
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def cached_encode(cache: EmbeddingCache, model_name: str, encode, texts: List[str]) -> np.ndarray:
+    """Encode texts through the cache; only misses (deduplicated) reach encode()."""
+    keys = [cache_key(model_name, t) for t in texts]
+    vecs = cache.get_many(keys)
+    miss: Dict[bytes, List[int]] = {}
+    for i, v in enumerate(vecs):
+        if v is None:
+            miss.setdefault(keys[i], []).append(i)
+    if miss:
+        miss_keys = list(miss)
+        encoded = np.asarray(encode([texts[miss[k][0]] for k in miss_keys]), dtype=np.float32)
+        cache.put_many(miss_keys, encoded)
+        for k, v in zip(miss_keys, encoded):
+            for i in miss[k]:
+                vecs[i] = v
+    if not vecs:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack(vecs)
@@ -0,0 +1,128 @@
+# embed_service.py
+import asyncio, time, threading, logging
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple, Dict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBatcher:
+    """
+    Asyncio micro-batcher in front of an encode(List[str]) function.
+
+    Concurrent embed() calls (ingest) and embed_sync() calls (retrieval
+    from plain threads) are queued on the batcher's own event-loop thread
+    and coalesced into one encode() call of up to max_batch texts, waiting
+    at most max_wait seconds for a batch to fill. encode() runs on a worker
+    executor (one thread by default; a ProcessPoolExecutor also works if
+    encode is picklable) so no event loop blocks on the model.
+    """
+    def __init__(self, encode: Callable[[List[str]], Optional[np.ndarray]], max_batch: int = 64,
+                 max_wait: float = 0.005, executor: Optional[Executor] = None):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.stats: Dict[str, float] = {"requests": 0, "texts": 0, "batches": 0, "encode_seconds": 0.0}
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="embed-batcher", daemon=True).start()
+            return self._loop
+
+    async def embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Embed texts as part of the next batch; None if the model is unavailable."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._submit(texts), self._ensure_loop()))
+
+    def embed_sync(self, texts: List[str], timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """Blocking embed() for threads outside any event loop (same batches)."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return asyncio.run_coroutine_threadsafe(self._submit(texts), self._ensure_loop()).result(timeout)
+
+    async def _submit(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Runs on the batcher loop."""
+        self._ensure_worker()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((list(texts), fut))
+        self.stats["requests"] += 1
+        return await fut
+
+    async def _collect(self) -> List[Tuple[List[str], asyncio.Future]]:
+        """First waiting request, then whatever arrives until the batch is full or max_wait passes."""
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            batch = [(texts, fut) for texts, fut in batch if not fut.cancelled()]
+            if not batch:
+                continue
+            flat = [t for texts, _ in batch for t in texts]
+            start = time.perf_counter()
+            try:
+                vecs = await loop.run_in_executor(self._executor, self.encode, flat)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.stats["encode_seconds"] += time.perf_counter() - start
+            self.stats["batches"] += 1
+            self.stats["texts"] += len(flat)
+            pos = 0
+            for texts, fut in batch:
+                part = None if vecs is None else np.asarray(vecs[pos:pos + len(texts)])
+                pos += len(texts)
+                if not fut.done():
+                    fut.set_result(part)
+
+    def mean_batch_size(self) -> float:
+        return self.stats["texts"] / self.stats["batches"] if self.stats["batches"] else 0.0
+
+    def close(self) -> None:
+        if self._loop is not None:
+            loop, worker = self._loop, self._worker
+            if worker is not None:
+                loop.call_soon_threadsafe(worker.cancel)
+            loop.call_soon_threadsafe(loop.stop)
+            self._loop = self._worker = None
+        self._executor.shutdown(wait=False)
+
+
+_BATCHER: Optional[EmbeddingBatcher] = None
+
+def get_batcher() -> EmbeddingBatcher:
+    """Shared batcher over utils.embed_text (which also applies the embedding cache)."""
+    global _BATCHER
+    if _BATCHER is None:
+        from utils import embed_text
+        _BATCHER = EmbeddingBatcher(embed_text)
+    return _BATCHER
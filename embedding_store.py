@@ -0,0 +1,229 @@
+# embedding_store.py
+import os, json, logging
+from typing import List, Tuple, Iterable, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_DTYPES = {"float16": np.float16, "int8": np.int8}
+
+class EmbeddingStore:
+    """
+    Compact on-disk vector store opened with numpy.memmap.
+
+    Layout of the store directory (all files are append-only row arrays):
+      meta.json    dim and dtype
+      vecs.bin     float16 rows, or int8 rows with a float32 scale in scales.bin
+      ids.bin      int64 id per row
+      flags.bin    uint8 per row, 1 = deleted (tombstones are written in place)
+      texts.bin    utf-8 texts back to back, offsets.bin holds int64 end offsets
+
+    Opening only maps the files, so startup cost does not depend on the number
+    of vectors, and search streams over the mapping in blocks so resident
+    memory grows with the pages it touches rather than the whole matrix.
+    Once tombstones pass compact_ratio of the stored rows, remove() rewrites
+    the files without them.
+    Offers the same add/remove/search/ids/save/load surface as VectorIndex.
+    """
+    def __init__(self, path: str, dim: Optional[int] = None, dtype: str = "float16", block_rows: int = 8192,
+                 compact_ratio: float = 0.2):
+        self.path = path
+        self.compact_ratio = compact_ratio
+        os.makedirs(path, exist_ok=True)
+        meta_file = os.path.join(path, "meta.json")
+        if os.path.exists(meta_file):
+            with open(meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            dim, dtype = meta["dim"], meta["dtype"]
+        else:
+            if dim is None:
+                raise ValueError("dim is required to create a new EmbeddingStore")
+            with open(meta_file, "w", encoding="utf-8") as f:
+                json.dump({"dim": dim, "dtype": dtype}, f)
+        if dtype not in _DTYPES:
+            raise ValueError(f"dtype must be one of {list(_DTYPES)}")
+        self.dim = dim
+        self.dtype = dtype
+        self.block_rows = block_rows
+        self._np_dtype = _DTYPES[dtype]
+        self._files = {name: os.path.join(path, name + ".bin")
+                       for name in ("vecs", "ids", "flags", "scales", "texts", "offsets")}
+        for p in self._files.values():
+            open(p, "ab").close()
+        self._maps = {}
+        self._count = self._rows_on_disk()
+        self._truncate_torn()
+        self._deleted = int(self._map("flags").sum()) if self._count else 0
+
+    # ---- file helpers ----
+    def _row_bytes(self, name: str) -> int:
+        return {"vecs": self.dim * np.dtype(self._np_dtype).itemsize, "ids": 8, "flags": 1,
+                "scales": 4, "offsets": 8}[name]
+
+    def _rows_on_disk(self) -> int:
+        """Rows fully present in every file (a torn append is ignored)."""
+        names = ["vecs", "ids", "flags", "offsets"] + (["scales"] if self.dtype == "int8" else [])
+        return min(os.path.getsize(self._files[n]) // self._row_bytes(n) for n in names)
+
+    def _truncate_torn(self) -> None:
+        """Cut any partially appended row so the next append lines up again."""
+        for name, p in self._files.items():
+            if name == "texts":
+                size = int(self._map("offsets")[-1]) if self._count else 0
+            elif name == "scales" and self.dtype != "int8":
+                continue
+            else:
+                size = self._count * self._row_bytes(name)
+            if os.path.getsize(p) > size:
+                with open(p, "r+b") as f:
+                    f.truncate(size)
+
+    def _map(self, name: str) -> np.ndarray:
+        """Read-only memmap of the first _count rows of a file (remapped after appends)."""
+        m = self._maps.get(name)
+        if m is None or len(m) != self._count:
+            if self._count == 0:
+                return np.zeros((0, self.dim) if name == "vecs" else 0)
+            dtype = {"vecs": self._np_dtype, "ids": np.int64, "flags": np.uint8,
+                     "scales": np.float32, "offsets": np.int64}[name]
+            shape = (self._count, self.dim) if name == "vecs" else (self._count,)
+            m = self._maps[name] = np.memmap(self._files[name], dtype=dtype, mode="r", shape=shape)
+        return m
+
+    def __len__(self):
+        return self._count - self._deleted
+
+    # ---- writes ----
+    def add(self, ids: Iterable[int], vectors, texts: Optional[List[str]] = None) -> None:
+        """Append rows without touching existing data."""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        vecs = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        if not len(ids):
+            return
+        if self.dtype == "int8":
+            scales = np.abs(vecs).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            rows = np.round(vecs / scales[:, None]).astype(np.int8)
+            with open(self._files["scales"], "ab") as f:
+                f.write(scales.astype(np.float32).tobytes())
+        else:
+            rows = vecs.astype(np.float16)
+        blobs = [(t or "").encode("utf-8") for t in (texts or [""] * len(ids))]
+        end = int(self._map("offsets")[-1]) if self._count else 0
+        offsets = end + np.cumsum([len(b) for b in blobs], dtype=np.int64)
+        with open(self._files["texts"], "ab") as f:
+            f.write(b"".join(blobs))
+        with open(self._files["vecs"], "ab") as f:
+            f.write(rows.tobytes())
+        with open(self._files["ids"], "ab") as f:
+            f.write(ids.tobytes())
+        with open(self._files["flags"], "ab") as f:
+            f.write(bytes(len(ids)))
+        with open(self._files["offsets"], "ab") as f:
+            f.write(offsets.tobytes())
+        self._count += len(ids)
+
+    def _rows_for(self, ids: Iterable[int]) -> List[int]:
+        all_ids = self._map("ids")
+        wanted = np.asarray(list(ids), dtype=np.int64)
+        if not len(wanted) or not self._count:
+            return []
+        return np.nonzero(np.isin(all_ids, wanted))[0].tolist()
+
+    def remove(self, ids: Iterable[int]) -> None:
+        """Tombstone ids by flipping their flag byte in place."""
+        flags = self._map("flags")
+        with open(self._files["flags"], "r+b") as f:
+            for row in self._rows_for(ids):
+                if flags[row]:
+                    continue
+                f.seek(row)
+                f.write(b"\x01")
+                self._deleted += 1
+        self._maps.pop("flags", None)
+        if self._deleted > self.compact_ratio * self._count:
+            self.compact()
+
+    # ---- reads ----
+    def ids(self) -> List[int]:
+        if not self._count:
+            return []
+        return self._map("ids")[self._map("flags") == 0].tolist()
+
+    def text(self, row: int) -> str:
+        offsets = self._map("offsets")
+        start = int(offsets[row - 1]) if row else 0
+        with open(self._files["texts"], "rb") as f:
+            f.seek(start)
+            return f.read(int(offsets[row]) - start).decode("utf-8")
+
+    def texts(self, ids: Iterable[int]) -> List[str]:
+        """Texts stored for ids (in the given order)."""
+        live = self._map("ids").copy()
+        live[self._map("flags") != 0] = -1
+        out = []
+        for i in ids:
+            rows = np.nonzero(live == i)[0]
+            out.append(self.text(int(rows[-1])) if len(rows) else "")
+        return out
+
+    def search(self, vector, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Return up to top_k (id, inner product) pairs, best first."""
+        if len(self) == 0 or top_k <= 0:
+            return []
+        q = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        vecs, ids, flags = self._map("vecs"), self._map("ids"), self._map("flags")
+        scales = self._map("scales") if self.dtype == "int8" else None
+        best_s = np.empty(0, dtype=np.float32)
+        best_r = np.empty(0, dtype=np.int64)
+        for lo in range(0, self._count, self.block_rows):
+            hi = min(lo + self.block_rows, self._count)
+            sims = vecs[lo:hi].astype(np.float32) @ q
+            if scales is not None:
+                sims *= scales[lo:hi]
+            sims[flags[lo:hi] != 0] = -np.inf
+            best_s = np.concatenate([best_s, sims])
+            best_r = np.concatenate([best_r, np.arange(lo, hi)])
+            if len(best_s) > top_k:
+                keep = np.argpartition(-best_s, top_k - 1)[:top_k]
+                best_s, best_r = best_s[keep], best_r[keep]
+        order = np.argsort(-best_s)
+        return [(int(ids[best_r[i]]), float(best_s[i])) for i in order if np.isfinite(best_s[i])]
+
+    # ---- VectorIndex-compatible persistence ----
+    def save(self, path: Optional[str] = None) -> None:
+        """Appends are already on disk; just fsync them."""
+        for p in self._files.values():
+            with open(p, "rb+") as f:
+                os.fsync(f.fileno())
+
+    @classmethod
+    def load(cls, path: str) -> "EmbeddingStore":
+        return cls(path)
+
+    def compact(self) -> None:
+        """Rewrite the files without tombstoned rows (the only full rewrite)."""
+        if not self._deleted:
+            return
+        live = np.nonzero(self._map("flags") == 0)[0]
+        vecs = self._map("vecs")[live].astype(np.float32)
+        if self.dtype == "int8":
+            vecs *= self._map("scales")[live][:, None]
+        ids = self._map("ids")[live]
+        texts = [self.text(int(r)) for r in live]
+        self._maps = {}
+        for p in self._files.values():
+            open(p, "wb").close()
+        self._count = self._deleted = 0
+        self.add(ids.tolist(), vecs, texts)
+
+
+def corpus_to_store(store_path: str, index_path: str = "faiss.index", text_path: str = "faiss_text.json",
+                    dtype: str = "float16") -> EmbeddingStore:
+    """Convert the faiss.index / faiss_text.json corpus into an EmbeddingStore (ids = row numbers)."""
+    from vector_index import load_corpus, normalize
+    texts, vecs = load_corpus(index_path, text_path)
+    store = EmbeddingStore(store_path, dim=vecs.shape[1], dtype=dtype)
+    start = len(store._map("ids"))
+    store.add(range(start, start + len(texts)), normalize(vecs), texts)
+    return store
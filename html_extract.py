@@ -0,0 +1,174 @@
+# html_extract.py
+import time, logging
+from typing import Iterable, List, Optional, Tuple, Union
+
+from lxml import etree
+
+from utils import clean_text
+
+logger = logging.getLogger(__name__)
+
+# subtrees dropped entirely (boilerplate / non-content)
+SKIP_TAGS = {"script", "style", "noscript", "header", "footer", "nav", "aside",
+             "form", "template", "svg", "iframe", "button", "select"}
+# elements whose text is kept, one block each
+BLOCK_TAGS = {"p", "h1", "h2", "h3", "h4", "h5", "h6", "li", "blockquote", "pre", "dt", "dd", "figcaption"}
+
+
+class StreamingExtractor:
+    """
+    Incremental HTML text extraction with lxml's pull parser.
+
+    Feed the response body chunk by chunk; paragraphs, headings and list items
+    outside boilerplate containers are collected as they close and the parsed
+    tree is pruned behind them, so memory stays flat on large pages. Stops
+    consuming input after max_bytes or max_seconds.
+    """
+    def __init__(self, max_bytes: int = 5 * 1024 * 1024, max_seconds: float = 5.0,
+                 encoding: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self._parser = etree.HTMLPullParser(events=("start", "end"), encoding=encoding,
+                                            remove_comments=True, remove_pis=True)
+        self._start = time.monotonic()
+        self._skip = 0          # open SKIP_TAGS elements
+        self._blocks = 0        # open BLOCK_TAGS elements (outside skipped subtrees)
+        self.bytes = 0
+        self.truncated = False
+        self.texts: List[str] = []
+        self.links: List[str] = []
+
+    def feed(self, data: bytes) -> bool:
+        """Parse another chunk; False once a limit is hit and further input is ignored."""
+        if self.truncated:
+            return False
+        if self.bytes + len(data) > self.max_bytes:
+            data = data[:self.max_bytes - self.bytes]
+            self.truncated = True
+        self.bytes += len(data)
+        if data:
+            self._parser.feed(data)
+            self._drain()
+        if time.monotonic() - self._start > self.max_seconds:
+            self.truncated = True
+        return not self.truncated
+
+    def _drain(self) -> None:
+        for event, el in self._parser.read_events():
+            tag = el.tag if isinstance(el.tag, str) else ""
+            if event == "start":
+                if tag == "a":
+                    href = el.get("href")
+                    if href:
+                        self.links.append(href)
+                if tag in SKIP_TAGS:
+                    self._skip += 1
+                elif tag in BLOCK_TAGS and not self._skip:
+                    self._blocks += 1
+                continue
+            if tag in SKIP_TAGS:
+                self._skip -= 1
+            elif tag in BLOCK_TAGS and not self._skip:
+                self._blocks -= 1
+                if self._blocks == 0:
+                    text = " ".join("".join(self._content(el)).split())
+                    if text:
+                        self.texts.append(text)
+            if self._blocks == 0 and not self._skip:
+                self._prune(el)
+            elif self._skip and tag in SKIP_TAGS:
+                self._prune(el)
+
+    @staticmethod
+    def _content(el) -> Iterable[str]:
+        """Text of el without nested boilerplate subtrees (tails of those still count)."""
+        if el.text:
+            yield el.text
+        for child in el:
+            if isinstance(child.tag, str) and child.tag in SKIP_TAGS:
+                pass
+            else:
+                yield from StreamingExtractor._content(child)
+            if child.tail:
+                yield child.tail
+
+    @staticmethod
+    def _prune(el) -> None:
+        """Free a finished element and the already-processed siblings before it."""
+        tail = el.tail
+        el.clear()
+        el.tail = tail                      # tail text may belong to an open block
+        parent = el.getparent()
+        if parent is not None:
+            while el.getprevious() is not None:
+                del parent[0]
+
+    def close(self) -> Tuple[str, List[str]]:
+        """Finish parsing; returns (text, raw hrefs) like crawler.extract_page."""
+        try:
+            self._parser.close()
+            self._drain()
+        except etree.XMLSyntaxError:
+            pass                            # truncated / empty documents
+        return clean_text("\n\n".join(self.texts)), self.links
+
+
+def extract_stream(chunks: Iterable[bytes], max_bytes: int = 5 * 1024 * 1024, max_seconds: float = 5.0,
+                   encoding: Optional[str] = None) -> Tuple[str, List[str]]:
+    """Extract (text, hrefs) from an iterable of body chunks, e.g. requests' iter_content()."""
+    ex = StreamingExtractor(max_bytes, max_seconds, encoding)
+    for chunk in chunks:
+        if not ex.feed(chunk):
+            break
+    return ex.close()
+
+def extract_html(html: Union[str, bytes], **limits) -> Tuple[str, List[str]]:
+    if isinstance(html, str):
+        return extract_stream([html.encode("utf-8")], encoding="utf-8", **limits)
+    return extract_stream([html], **limits)
+
+
+# ---- benchmark: python html_extract.py [page.html ...] ----
+def _synthetic_page(paragraphs: int = 4000) -> bytes:
+    body = []
+    for i in range(paragraphs):
+        body.append(f"<h2>Section {i}</h2><p>Paragraph {i} with <b>bold</b> and <a href='/p{i}'>a link</a>. "
+                    + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 5 + "</p>")
+        body.append(f"<ul><li>item {i}a</li><li>item {i}b</li></ul><script>var x{i} = {i};</script>")
+    return ("<html><head><style>p{}</style></head><body><nav>menu</nav>"
+            + "".join(body) + "<footer>footer</footer></body></html>").encode("utf-8")
+
+def _bench_child(method: str, paths: List[str], rounds: int, q) -> None:
+    import resource
+    pages = [open(p, "rb").read() for p in paths] if paths else [_synthetic_page()]
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    n = 0
+    for _ in range(rounds):
+        for page in pages:
+            if method == "lxml-stream":
+                extract_stream(page[i:i + 65536] for i in range(0, len(page), 65536))
+            else:
+                from crawler import extract_page
+                extract_page(page.decode("utf-8", errors="replace"))
+            n += 1
+    took = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    q.put((n / took, (peak - base) / 1024, sum(map(len, pages)) / len(pages) / 1e6))
+
+def benchmark(paths: List[str], rounds: int = 5) -> None:
+    """pages/sec and peak RSS growth for each extractor, each in a fresh process."""
+    import multiprocessing as mp
+    ctx = mp.get_context("spawn")
+    for method in ("bs4", "lxml-stream"):
+        q = ctx.Queue()
+        p = ctx.Process(target=_bench_child, args=(method, paths, rounds, q))
+        p.start()
+        rate, peak_mb, size_mb = q.get()
+        p.join()
+        print(f"{method:<12}{rate:>9.2f} pages/s   peak +{peak_mb:>7.1f} MB   (avg page {size_mb:.2f} MB)")
+
+
+if __name__ == "__main__":
+    import sys
+    benchmark(sys.argv[1:])
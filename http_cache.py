@@ -0,0 +1,316 @@
+# http_cache.py
+import os, re, json, time, zlib, sqlite3, threading, logging, email.utils
+from typing import Dict, Iterator, NamedTuple, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# heuristic freshness for responses with Last-Modified but no explicit lifetime (RFC 9111 4.2.2)
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX = 24 * 3600
+
+class Entry(NamedTuple):
+    url: str
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    stored: float
+    expires: float
+
+
+def _parse_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except Exception:
+        return None
+
+def content_charset(headers) -> Optional[str]:
+    """charset parameter of a Content-Type header, if any."""
+    m = re.search(r"charset=[\"']?([\w-]+)", headers.get("Content-Type", "") or "", re.IGNORECASE)
+    return m.group(1) if m else None
+
+def cache_control(headers) -> Dict[str, Optional[str]]:
+    out = {}
+    for part in (headers.get("Cache-Control") or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            out[name.lower()] = value.strip('"') or None
+    return out
+
+def freshness_lifetime(headers, now: float) -> float:
+    """Seconds a response stays fresh: max-age, then Expires, then the Last-Modified heuristic."""
+    cc = cache_control(headers)
+    if "no-cache" in cc:
+        return 0.0
+    for name in ("s-maxage", "max-age"):
+        if cc.get(name) and cc[name].isdigit():
+            return float(cc[name]) - float(headers.get("Age", "0") or 0)
+    expires = _parse_date(headers.get("Expires"))
+    if expires is not None:
+        return expires - (_parse_date(headers.get("Date")) or now)
+    modified = _parse_date(headers.get("Last-Modified"))
+    if modified is not None:
+        return min(HEURISTIC_MAX, max(0.0, (now - modified) * HEURISTIC_FRACTION))
+    return 0.0
+
+
+class CachedResponse:
+    """
+    The parts of requests.Response our callers use, served from the cache or
+    the network. A network response (raw) streams through iter_content() and
+    is stored in the cache once read to the end, unless it is over max_body.
+    """
+    def __init__(self, entry: Entry, from_cache: bool, revalidated: bool = False, stale: bool = False,
+                 raw: Optional[requests.Response] = None, cache: Optional["HTTPCache"] = None, min_ttl: float = 0.0):
+        self.url = entry.url
+        self.status_code = entry.status
+        self.headers = requests.structures.CaseInsensitiveDict(entry.headers)
+        self.from_cache = from_cache
+        self.revalidated = revalidated
+        self.stale = stale
+        self._content: Optional[bytes] = entry.body if raw is None else None
+        self._raw = raw
+        self._cache = cache
+        self._min_ttl = min_ttl
+
+    @property
+    def content(self) -> bytes:
+        if self._raw is not None:
+            self._content = b"".join(self.iter_content(65536))
+        return self._content if self._content is not None else b""
+
+    def iter_content(self, chunk_size: int = 65536) -> Iterator[bytes]:
+        """Body chunks as they arrive; a network body is copied into the cache on the way."""
+        if self._raw is None:
+            body = self._content or b""
+            for i in range(0, len(body), chunk_size):
+                yield body[i:i + chunk_size]
+            return
+        raw, self._raw = self._raw, None
+        buf: Optional[bytearray] = bytearray()
+        done = False
+        try:
+            for chunk in raw.iter_content(chunk_size):
+                if buf is not None:
+                    buf += chunk
+                    if len(buf) > self._cache.max_body:
+                        logger.info("HTTP cache not storing %s: body over %d bytes", self.url, self._cache.max_body)
+                        buf = None
+                yield chunk
+            done = True
+        finally:
+            raw.close()
+            if done and buf is not None:
+                self._content = bytes(buf)
+                self._cache.store(self.url, self.status_code, raw.headers, self._content, self._min_ttl)
+            elif not done:
+                logger.debug("HTTP cache not storing %s: body not read to the end", self.url)
+
+    def close(self) -> None:
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
+
+    def __enter__(self) -> "CachedResponse":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def encoding(self) -> str:
+        return content_charset(self.headers) or "utf-8"
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} for {self.url}")
+
+
+class HTTPCache:
+    """
+    Shared on-disk HTTP cache (SQLite, zlib-compressed bodies, LRU-bounded).
+
+    Fresh entries (Cache-Control max-age / Expires / Last-Modified heuristic)
+    are served without touching the network; stale ones are revalidated with
+    If-None-Match / If-Modified-Since so an unchanged resource costs a 304.
+    In offline mode, or when the network fails, whatever is cached is served
+    stale.
+    """
+    def __init__(self, path: str = "cache/http.sqlite", max_bytes: int = 256 * 1024 * 1024,
+                 offline: bool = False, max_body: int = 10 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.max_body = max_body
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS http (url TEXT PRIMARY KEY, status INTEGER, headers TEXT, "
+                         "body BLOB, size INTEGER, stored REAL, expires REAL, accessed REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS http_accessed ON http (accessed)")
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM http").fetchone()[0]
+        self.stats: Dict[str, int] = {"fresh": 0, "revalidated": 0, "fetched": 0, "stale": 0}
+
+    # ---- storage ----
+    def lookup(self, url: str) -> Optional[Entry]:
+        with self._lock:
+            row = self._db.execute("SELECT status, headers, body, stored, expires FROM http WHERE url = ?",
+                                   (url,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE http SET accessed = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+        status, headers, body, stored, expires = row
+        return Entry(url, status, json.loads(headers), zlib.decompress(body), stored, expires)
+
+    def store(self, url: str, status: int, headers, body: bytes, min_ttl: float = 0.0) -> Optional[Entry]:
+        """
+        Cache a 200 response unless it is no-store or too large; returns the
+        entry if stored. min_ttl keeps it fresh at least that long regardless
+        of its headers (for APIs that send none, like Wikipedia's api.php).
+        """
+        cc = cache_control(headers)
+        if status != 200 or "no-store" in cc:
+            return None
+        if len(body) > self.max_body:
+            logger.info("HTTP cache not storing %s: %d bytes over max_body", url, len(body))
+            return None
+        now = time.time()
+        keep = {k: v for k, v in headers.items()
+                if k.lower() in ("content-type", "etag", "last-modified", "cache-control", "expires", "date")}
+        entry = Entry(url, status, keep, body, now, now + max(freshness_lifetime(headers, now), min_ttl))
+        blob = zlib.compress(body, 6)
+        with self._lock:
+            old = self._db.execute("SELECT size FROM http WHERE url = ?", (url,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO http VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (url, status, json.dumps(keep), blob, len(blob), now, entry.expires, now))
+            self._size += len(blob) - (old[0] if old else 0)
+            self._evict()
+            self._db.commit()
+        return entry
+
+    def refresh(self, entry: Entry, headers) -> Entry:
+        """Apply a 304's headers: new validators / lifetime, same body."""
+        merged = requests.structures.CaseInsensitiveDict(entry.headers)
+        for k, v in headers.items():
+            if k.lower() in ("etag", "last-modified", "cache-control", "expires", "date"):
+                merged[k] = v
+        now = time.time()
+        entry = entry._replace(headers=dict(merged), stored=now, expires=now + freshness_lifetime(merged, now))
+        with self._lock:
+            self._db.execute("UPDATE http SET headers = ?, stored = ?, expires = ?, accessed = ? WHERE url = ?",
+                             (json.dumps(entry.headers), now, entry.expires, now, entry.url))
+            self._db.commit()
+        return entry
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until under max_bytes (caller holds the lock)."""
+        while self._size > self.max_bytes:
+            rows = self._db.execute("SELECT url, size FROM http ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                self._db.execute("DELETE FROM http WHERE url = ?", (url,))
+                self._size -= size
+                if self._size <= self.max_bytes:
+                    break
+
+    @staticmethod
+    def is_fresh(entry: Entry) -> bool:
+        return time.time() < entry.expires
+
+    @staticmethod
+    def conditional_headers(entry: Entry) -> Dict[str, str]:
+        h = requests.structures.CaseInsensitiveDict(entry.headers)
+        out = {}
+        if h.get("ETag"):
+            out["If-None-Match"] = h["ETag"]
+        if h.get("Last-Modified"):
+            out["If-Modified-Since"] = h["Last-Modified"]
+        return out
+
+    # ---- fetching ----
+    def get(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+            timeout: float = 10, min_ttl: float = 0.0, stream: bool = False) -> CachedResponse:
+        """
+        GET through the cache. Raises like requests.get if nothing usable is
+        cached and the fetch fails. With stream=True a fetched body is not
+        read up front: consume iter_content() (e.g. into an extractor) and
+        close the response; it is cached only if read to the end.
+        """
+        if params:
+            url = requests.Request("GET", url, params=params).prepare().url
+        entry = self.lookup(url)
+        if entry is not None and (self.offline or self.is_fresh(entry)):
+            fresh = self.is_fresh(entry)
+            self.stats["fresh" if fresh else "stale"] += 1
+            return CachedResponse(entry, from_cache=True, stale=not fresh)
+        if self.offline:
+            raise requests.ConnectionError(f"offline and not cached: {url}")
+        send = dict(headers or {})
+        if entry is not None:
+            send.update(self.conditional_headers(entry))
+        try:
+            r = self._session.get(url, headers=send, timeout=timeout, stream=True)
+        except requests.RequestException:
+            if entry is None:
+                raise
+            logger.info("HTTP cache serving stale %s (network error)", url)
+            self.stats["stale"] += 1
+            return CachedResponse(entry, from_cache=True, stale=True)
+        if r.status_code == 304 and entry is not None:
+            r.close()
+            self.stats["revalidated"] += 1
+            return CachedResponse(self.refresh(entry, r.headers), from_cache=True, revalidated=True)
+        self.stats["fetched"] += 1
+        resp = CachedResponse(Entry(url, r.status_code, dict(r.headers), b"", time.time(), 0.0),
+                              from_cache=False, raw=r, cache=self, min_ttl=min_ttl)
+        if not stream:
+            resp.content
+        return resp
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+        self._session.close()
+
+
+# shared cache; HTTP_CACHE=off disables it, HTTP_CACHE_OFFLINE=1 serves only cached (possibly stale) data
+HTTP_CACHE_PATH = os.getenv("HTTP_CACHE", os.path.join("cache", "http.sqlite"))
+HTTP_CACHE_OFFLINE = os.getenv("HTTP_CACHE_OFFLINE", "0").lower() in ("1", "true", "yes")
+_HTTP_CACHE = None
+_HTTP_CACHE_LOCK = threading.Lock()
+
+def get_http_cache() -> Optional[HTTPCache]:
+    """Shared HTTPCache, or None when disabled / unavailable."""
+    global _HTTP_CACHE
+    if _HTTP_CACHE is None and HTTP_CACHE_PATH.lower() not in ("off", "0", "none", ""):
+        with _HTTP_CACHE_LOCK:
+            if _HTTP_CACHE is None:
+                try:
+                    _HTTP_CACHE = HTTPCache(HTTP_CACHE_PATH, offline=HTTP_CACHE_OFFLINE)
+                except Exception as e:
+                    logger.warning("HTTP cache unavailable: %s", e)
+                    _HTTP_CACHE = False
+    return _HTTP_CACHE or None
+
+def cached_get(url: str, params: Optional[dict] = None, headers: Optional[dict] = None, timeout: float = 10,
+               min_ttl: float = 0.0, stream: bool = False):
+    """requests.get through the shared cache (plain requests.get if the cache is disabled)."""
+    cache = get_http_cache()
+    if cache is None:
+        return requests.get(url, params=params, headers=headers, timeout=timeout, stream=stream)
+    return cache.get(url, params=params, headers=headers, timeout=timeout, min_ttl=min_ttl, stream=stream)
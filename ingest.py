@@ -0,0 +1,336 @@
+# ingest.py
+import os, json, time, asyncio, hashlib, logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from chunker import iter_chunks
+from utils import save_chunked_content
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()        # end-of-stream marker, one per downstream worker
+
+
+class StageMetrics:
+    """Throughput counters for one pipeline stage."""
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.busy = 0.0             # summed worker seconds spent in the stage function
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def row(self) -> str:
+        wall = (self.finished or time.perf_counter()) - self.started
+        rate = self.items_out / wall if wall > 0 else 0.0
+        util = self.busy / (wall * self.workers) if wall > 0 else 0.0
+        return (f"{self.name:<8}{self.workers:>4}{self.items_in:>9}{self.items_out:>9}{self.errors:>7}"
+                f"{rate:>11.1f}{util:>8.0%}")
+
+
+class Checkpoint:
+    """
+    Resumable ingest state: URLs whose chunks are all indexed, with a hash of
+    the text they had. Written atomically every `every` pages and at the end.
+    """
+    def __init__(self, path: Optional[str], every: int = 20):
+        self.path = path
+        self.every = every
+        self.done: Dict[str, str] = {}
+        self._dirty = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.done = json.load(f).get("done", {})
+            except Exception as e:
+                logger.warning("Ignoring unreadable checkpoint %s: %s", path, e)
+
+    def is_done(self, url: str, digest: str) -> bool:
+        return self.done.get(url) == digest
+
+    def mark(self, url: str, digest: str) -> None:
+        self.done[url] = digest
+        self._dirty += 1
+        if self._dirty >= self.every:
+            self.save()
+
+    def save(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"done": self.done}, f)
+        os.replace(tmp, self.path)
+        self._dirty = 0
+
+
+_COUNTERS: Dict[str, Callable[[str], int]] = {}
+
+def _chunk_doc(url: str, text: str, max_tokens: int, overlap: int,
+               tokenizer: Optional[Tuple[str, Optional[int]]] = None) -> List[Tuple[str, int, int]]:
+    """
+    Parse-pool job: (chunk text, start, end) for one document. With a
+    (tokenizer path, max length) from utils.embed_tokenizer_spec(), chunks
+    are measured in embedding-model tokens and kept within its sequence
+    length, so the encoder does not cut their tails. Each worker loads only
+    the tokenizer, once.
+    """
+    count = None
+    if tokenizer is not None:
+        path, max_len = tokenizer
+        if path not in _COUNTERS:
+            from utils import load_token_counter
+            _COUNTERS[path] = load_token_counter(path)
+        count = _COUNTERS[path]
+        if max_len:
+            max_tokens = min(max_tokens, max_len - 2)   # room for [CLS]/[SEP]
+    return [(c.text, c.start, c.end)
+            for c in iter_chunks(text, max_tokens=max_tokens, overlap=overlap, count_tokens=count)]
+
+def _urls(item) -> str:
+    """URLs a stage item belongs to, for error messages."""
+    items = item if isinstance(item, list) else [item]
+    return ", ".join(sorted({i[0][0] if isinstance(i[0], tuple) else i[0] for i in items}))
+
+
+class IngestPipeline:
+    """
+    Streaming ingest: documents -> chunk -> embed -> index, as asyncio stages
+    joined by bounded queues so a slow stage applies backpressure upstream.
+
+    Documents come from an async iterator of (url, text) (e.g. AsyncCrawler
+    pages, network I/O on the event loop). Chunking runs on a process pool,
+    embedding goes through the shared EmbeddingBatcher (batched together
+    with retrieval queries; a custom embed_fn runs on a thread pool), and
+    a single writer adds chunks with their vectors to the MemoryManager.
+    With the shared batcher, chunks are sized in the embedding model's tokens.
+    Pages already indexed with the same text (per the checkpoint) are
+    skipped, so an interrupted run resumes; repeated URLs are ingested
+    once, and a document that fails is logged and left for the next run.
+    """
+    def __init__(self, memory, embed_fn: Optional[Callable] = None, max_tokens: int = 256, overlap: int = 32,
+                 parse_workers: int = 2, embed_workers: int = 1, embed_batch: int = 64, queue_size: int = 64,
+                 checkpoint: Optional[str] = None, checkpoint_every: int = 20,
+                 save_dir: Optional[str] = None, source: str = "course",
+                 parse_executor: Optional[Executor] = None):
+        self.memory = memory
+        self._batcher = None
+        self._tokenizer: Optional[Tuple[str, Optional[int]]] = None     # for parse workers, see run()
+        if embed_fn is None and getattr(memory, "_index", None) is not None:
+            from embed_service import get_batcher
+            self._batcher = get_batcher()
+        self.embed_fn = embed_fn                # None and no batcher: index without vectors (keyword memory)
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.parse_workers = parse_workers
+        self.embed_workers = embed_workers
+        self.embed_batch = embed_batch
+        self.queue_size = queue_size
+        self.checkpoint = Checkpoint(checkpoint, checkpoint_every)
+        self.save_dir = save_dir
+        self.source = source
+        self._parse_pool = parse_executor
+        self._embed_pool = ThreadPoolExecutor(max_workers=embed_workers, thread_name_prefix="ingest-embed")
+        self._index_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-index")
+        self._pending: Dict[str, List] = {}     # url -> [chunks left to index, digest]
+        self.metrics: Dict[str, StageMetrics] = {}
+
+    # ---- stages ----
+    async def _parse(self, doc) -> List:
+        url, text = doc
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if not text or self.checkpoint.is_done(url, digest):
+            return []
+        loop = asyncio.get_running_loop()
+        chunks = await loop.run_in_executor(self._parse_pool, _chunk_doc, url, text, self.max_tokens, self.overlap,
+                                            self._tokenizer)
+        if not chunks:
+            self.checkpoint.mark(url, digest)
+            return []
+        if self.save_dir:
+            from async_crawler import _slug
+            save_chunked_content((c[0] for c in chunks), os.path.join(self.save_dir, _slug(url) + ".json"))
+        self._pending[url] = [len(chunks), digest]
+        return [(url, i, c[0], c[1], c[2]) for i, c in enumerate(chunks)]
+
+    async def _embed(self, batch: List) -> List:
+        texts = [item[2] for item in batch]
+        if self._batcher is not None:
+            vecs = await self._batcher.embed(texts)
+        elif self.embed_fn is not None:
+            vecs = await asyncio.get_running_loop().run_in_executor(self._embed_pool, self.embed_fn, texts)
+        else:
+            return [(item, None) for item in batch]
+        return [(item, None if vecs is None else vecs[i]) for i, item in enumerate(batch)]
+
+    def _index_batch(self, batch: List) -> None:
+        items = [item for item, _ in batch]
+        vecs = [v for _, v in batch]
+        metas = [{"source": self.source, "url": url, "chunk": i, "start": start, "end": end}
+                 for url, i, _, start, end in items]
+        if all(v is not None for v in vecs):
+            import numpy as np
+            self.memory.add_texts([item[2] for item in items], metas, np.stack(vecs))
+        else:
+            self.memory.add_texts([item[2] for item in items], metas)
+
+    async def _index(self, batch: List) -> List:
+        await asyncio.get_running_loop().run_in_executor(self._index_pool, self._index_batch, batch)
+        for (url, *_), _ in batch:
+            pending = self._pending[url]
+            pending[0] -= 1
+            if pending[0] == 0:
+                del self._pending[url]
+                self.checkpoint.mark(url, pending[1])
+        return batch
+
+    async def _stage(self, name: str, fn, inq: asyncio.Queue, outq: Optional[asyncio.Queue],
+                     workers: int, downstream: int, batch: int = 0) -> None:
+        """Run `workers` copies of fn over inq; batch > 0 hands fn lists of up to batch items."""
+        m = self.metrics[name] = StageMetrics(name, workers)
+
+        async def worker():
+            while True:
+                item = await inq.get()
+                if item is _DONE:
+                    return
+                if batch:
+                    items = [item]
+                    while len(items) < batch and not inq.empty():
+                        nxt = inq.get_nowait()
+                        if nxt is _DONE:
+                            inq.put_nowait(_DONE)       # leave it for this or another worker
+                            break
+                        items.append(nxt)
+                    item = items
+                start = time.perf_counter()
+                try:
+                    results = await fn(item)
+                except Exception as e:
+                    m.errors += 1
+                    logger.warning("Ingest %s failed for %s: %s", name, _urls(item), e)
+                    continue
+                finally:
+                    m.busy += time.perf_counter() - start
+                m.items_in += len(item) if batch else 1
+                if outq is None:
+                    m.items_out += len(results)
+                    continue
+                for r in results:
+                    await outq.put(r)
+                    m.items_out += 1
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        m.finished = time.perf_counter()
+        if outq is not None:
+            for _ in range(downstream):
+                await outq.put(_DONE)
+
+    async def run(self, docs: AsyncIterator[Tuple[str, str]]) -> Dict[str, StageMetrics]:
+        """Ingest every (url, text) from docs; returns per-stage metrics."""
+        if self._batcher is not None and self._tokenizer is None:
+            from utils import embed_tokenizer_spec
+            path, max_len = await asyncio.get_running_loop().run_in_executor(self._embed_pool, embed_tokenizer_spec)
+            self._tokenizer = (path, max_len) if path else None
+        own_pool = self._parse_pool is None
+        if own_pool:
+            self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        docq: asyncio.Queue = asyncio.Queue(self.queue_size)
+        chunkq: asyncio.Queue = asyncio.Queue(self.queue_size * self.embed_batch)
+        vecq: asyncio.Queue = asyncio.Queue(self.queue_size * self.embed_batch)
+        src = self.metrics["source"] = StageMetrics("source", 1)
+
+        async def produce():
+            seen = set()
+            async for url, text in docs:
+                src.items_in += 1
+                if url in seen:
+                    logger.info("Ingest skipping repeated %s", url)
+                    continue
+                seen.add(url)
+                await docq.put((url, text))
+                src.items_out += 1
+            src.finished = time.perf_counter()
+            for _ in range(self.parse_workers):
+                await docq.put(_DONE)
+
+        try:
+            await asyncio.gather(
+                produce(),
+                self._stage("parse", self._parse, docq, chunkq, self.parse_workers, self.embed_workers),
+                self._stage("embed", self._embed, chunkq, vecq, self.embed_workers, 1, batch=self.embed_batch),
+                self._stage("index", self._index, vecq, None, 1, 0, batch=self.embed_batch),
+            )
+        finally:
+            self.checkpoint.save()
+            if own_pool:
+                self._parse_pool.shutdown()
+                self._parse_pool = None
+        self.memory.flush()
+        return self.metrics
+
+    def report(self) -> str:
+        lines = [f"{'stage':<8}{'wrk':>4}{'in':>9}{'out':>9}{'err':>7}{'out/s':>11}{'busy':>8}"]
+        lines += [m.row() for m in self.metrics.values()]
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        self._embed_pool.shutdown()
+        self._index_pool.shutdown()
+
+
+# ---- document sources ----
+async def crawl_docs(start_urls: Iterable[str], **crawler_kwargs) -> AsyncIterator[Tuple[str, str]]:
+    """(url, text) for every page AsyncCrawler fetches (through the shared HTTP cache)."""
+    from async_crawler import AsyncCrawler
+    from http_cache import get_http_cache
+    crawler_kwargs.setdefault("cache", get_http_cache())
+    async for page in AsyncCrawler(start_urls, **crawler_kwargs).crawl():
+        yield page.url, page.text
+
+async def file_docs(paths: Iterable[str]) -> AsyncIterator[Tuple[str, str]]:
+    """(path, text) for local text files, or chunk lists saved by save_chunked_content."""
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        if path.endswith(".json"):
+            try:
+                text = "\n\n".join(json.loads(text))
+            except Exception:
+                pass
+        yield path, text
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(description="Bulk-ingest a site or local files into Jarvis memory.")
+    ap.add_argument("sources", nargs="+", help="start URLs, or files with --files")
+    ap.add_argument("--files", action="store_true")
+    ap.add_argument("--memory-dir", default="memories")
+    ap.add_argument("--mode", default=os.getenv("MEMORY_MODE", "vector"))
+    ap.add_argument("--max-pages", type=int, default=500)
+    ap.add_argument("--max-depth", type=int, default=3)
+    ap.add_argument("--max-tokens", type=int, default=256)
+    ap.add_argument("--overlap", type=int, default=32)
+    ap.add_argument("--parse-workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    ap.add_argument("--checkpoint", default=os.path.join("cache", "ingest_checkpoint.json"))
+    ap.add_argument("--save-dir", default=None)
+    args = ap.parse_args()
+
+    from memory import MemoryManager
+    memory = MemoryManager(memory_dir=args.memory_dir, mode=args.mode)
+    pipe = IngestPipeline(memory, max_tokens=args.max_tokens, overlap=args.overlap,
+                          parse_workers=args.parse_workers, checkpoint=args.checkpoint, save_dir=args.save_dir)
+    docs = file_docs(args.sources) if args.files else crawl_docs(args.sources, max_pages=args.max_pages,
+                                                                  max_depth=args.max_depth)
+    try:
+        asyncio.run(pipe.run(docs))
+    finally:
+        pipe.close()
+        memory.close()
+    print(pipe.report())
@@ -1,15 +1,134 @@
 import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
+logger = logging.getLogger(__name__)
+
+# per-key quotas (the API's x-ratelimit-limit-* headers override them once seen)
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_KEY_CONCURRENCY = int(os.getenv("OPENAI_KEY_CONCURRENCY", "8"))
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """x-ratelimit-reset-* duration ('1s', '6m0s', '120ms', '0.5') -> seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(n) * scale[unit] for n, unit in parts)
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to one minute's worth; may go negative (debt)."""
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, n: float, now: float) -> float:
+        """Seconds until n units are available (never more than a full refill)."""
+        self._refill(now)
+        if self.level >= min(n, self.capacity):
+            return 0.0
+        return (min(n, self.capacity) - self.level) * 60.0 / self.capacity
+
+    def take(self, n: float, now: float) -> None:
+        self._refill(now)
+        self.level -= n
+
+    def headroom(self, now: float) -> float:
+        self._refill(now)
+        return max(0.0, self.level) / self.capacity
+
+    def set_limit(self, per_minute: float) -> None:
+        if per_minute > 0 and per_minute != self.capacity:
+            self.level = self.level * per_minute / self.capacity
+            self.capacity = per_minute
+
+    def clamp(self, remaining: float, now: float) -> None:
+        """The server's count of what is left wins over our estimate."""
+        self._refill(now)
+        self.level = min(self.level, remaining)
+
+
+class KeyState:
+    def __init__(self, key: str, rpm: float, tpm: float, concurrency: int):
+        self.key = key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.rejected_until = 0.0       # 401/403: the key itself is bad, not just busy
+        self.failures = 0
+        self.stats: Dict[str, float] = {"leases": 0, "rate_limited": 0, "errors": 0, "tokens": 0}
+
+    def wait_time(self, tokens: float, now: float) -> float:
+        if self.in_flight >= self.concurrency:
+            return float("inf")
+        return max(self.cooldown_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+    def load(self, now: float) -> float:
+        """0 = idle with full quota, 1 = saturated."""
+        return max(self.in_flight / self.concurrency,
+                   1.0 - self.requests.headroom(now), 1.0 - self.tokens.headroom(now))
+
+
+class KeyLease:
+    """One request's claim on a key; release() with the response status / headers / usage."""
+    def __init__(self, manager: "APIKeyManager", state: KeyState, tokens: float):
+        self.manager = manager
+        self.state = state
+        self.key = state.key
+        self.tokens = tokens
+        self.released = False
+
+    def release(self, status: Optional[int] = None, headers=None, used_tokens: Optional[float] = None) -> None:
+        if not self.released:
+            self.released = True
+            self.manager._release(self, status, headers, used_tokens)
+
+    async def __aenter__(self) -> "KeyLease":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release(status=None if exc is None else -1)
+
 
 class APIKeyManager:
-    def __init__(self):
+    """
+    Pool of OPENAI_KEY_1..15. Each key has token buckets for requests and
+    tokens per minute, a cap on concurrent requests and a cooldown set from
+    429s and x-ratelimit-* / Retry-After headers. acquire() waits for and
+    leases the least-loaded key that can take the request now, so load
+    spreads over every key's quota instead of one key at a time.
+    """
+    def __init__(self, rpm: float = OPENAI_RPM, tpm: float = OPENAI_TPM, concurrency: int = OPENAI_KEY_CONCURRENCY):
         # Load all keys
         self.keys = [os.getenv(f"OPENAI_KEY_{i}") for i in range(1, 16) if os.getenv(f"OPENAI_KEY_{i}")]
         if not self.keys:
             raise ValueError("❌ No API keys found in .env")
         self.index = 0
+        self._states = [KeyState(k, rpm, tpm, concurrency) for k in self.keys]
+        self._lock = threading.Lock()
 
     def get_key(self):
         return self.keys[self.index]
@@ -17,5 +136,97 @@ class APIKeyManager:
     def rotate_key(self):
         # Move to next key for next call
         self.index = (self.index + 1) % len(self.keys)
-        os.environ["OPENAI_API_KEY"] = self.keys[self.index]  # update env variable if code reads it
         return self.keys[self.index]
+
+    # ---- leases ----
+    def try_acquire(self, tokens: float = 1000) -> "KeyLease | float":
+        """A lease on the least-loaded key ready now, else seconds until one may be."""
+        now = time.monotonic()
+        with self._lock:
+            ready = [s for s in self._states if s.wait_time(tokens, now) == 0.0]
+            if not ready:
+                return min(s.wait_time(tokens, now) for s in self._states)
+            state = min(ready, key=lambda s: s.load(now))
+            state.in_flight += 1
+            state.requests.take(1, now)
+            state.tokens.take(tokens, now)
+            state.stats["leases"] += 1
+            return KeyLease(self, state, tokens)
+
+    async def acquire(self, tokens: float = 1000, timeout: Optional[float] = None) -> KeyLease:
+        """
+        Wait for a lease covering one request of about `tokens` tokens
+        (prompt + max_tokens). Use as `async with await pool.acquire(n) as lease`.
+        """
+        end = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            got = self.try_acquire(tokens)
+            if isinstance(got, KeyLease):
+                return got
+            if end is not None and time.monotonic() + min(got, 0.05) > end:
+                raise TimeoutError("no API key available")
+            # concurrency slots free up on release, so poll those; quota waits are exact
+            await asyncio.sleep(min(got, 0.05) if got == float("inf") else max(got, 0.001))
+
+    def _release(self, lease: KeyLease, status: Optional[int], headers, used_tokens: Optional[float]) -> None:
+        now = time.monotonic()
+        s = lease.state
+        with self._lock:
+            s.in_flight -= 1
+            if used_tokens is not None:
+                s.tokens.take(used_tokens - lease.tokens, now)      # settle the estimate
+                s.stats["tokens"] += used_tokens
+            if headers is not None:
+                self._apply_headers(s, headers, now)
+            if status == 429:
+                s.failures += 1
+                s.stats["rate_limited"] += 1
+                wait = _header_seconds(headers, "retry-after-ms", 0.001) or _header_seconds(headers, "retry-after")
+                s.cooldown_until = max(s.cooldown_until, now + (wait or min(60.0, 2.0 ** s.failures)))
+                logger.info("API key %d rate limited, cooling down %.1fs", self._states.index(s) + 1,
+                            s.cooldown_until - now)
+            elif status in (401, 403):
+                s.stats["errors"] += 1
+                s.cooldown_until = s.rejected_until = now + 3600.0
+                logger.warning("API key %d rejected (HTTP %s), disabled for an hour", self._states.index(s) + 1, status)
+            elif status is not None and (status < 0 or status >= 500):
+                s.stats["errors"] += 1
+            elif status is not None:
+                s.failures = 0
+
+    def healthy(self) -> int:
+        """Number of keys the API has not rejected (401/403) within the last hour."""
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for s in self._states if s.rejected_until <= now)
+
+    @staticmethod
+    def _apply_headers(s: KeyState, headers, now: float) -> None:
+        for bucket, kind in ((s.requests, "requests"), (s.tokens, "tokens")):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            try:
+                if limit:
+                    bucket.set_limit(float(limit))
+                if remaining is not None:
+                    bucket.clamp(float(remaining), now)
+                    if float(remaining) <= 0:
+                        reset = parse_reset(headers.get(f"x-ratelimit-reset-{kind}"))
+                        if reset:
+                            s.cooldown_until = max(s.cooldown_until, now + reset)
+            except ValueError:
+                continue
+
+    def report(self) -> List[Dict[str, float]]:
+        now = time.monotonic()
+        with self._lock:
+            return [dict(s.stats, in_flight=s.in_flight, load=round(s.load(now), 3),
+                         cooldown=max(0.0, round(s.cooldown_until - now, 1))) for s in self._states]
+
+
+def _header_seconds(headers, name: str, scale: float = 1.0) -> Optional[float]:
+    try:
+        value = headers.get(name) if headers is not None else None
+        return float(value) * scale if value else None
+    except ValueError:
+        return None
@@ -1,15 +1,22 @@
 # llm.py
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch
+# Kept for older imports: the offline model lives in llm_offline, where OFFLINE_BACKEND
+# picks hf / int8 (CPU) / gguf (llama.cpp). The GPTQ checkpoint needs a GPU, so CPU-only
+# hosts default to a quantized GGUF build of the same model.
+import os
+from llm_offline import OfflineLLM as _OfflineLLM
 
-class OfflineLLM:
-    def __init__(self, model_name="TheBloke/Llama-2-7B-Chat-GPTQ"):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_name, device_map="auto", torch_dtype=torch.float16
-        )
+GPU_MODEL = "TheBloke/Llama-2-7B-Chat-GPTQ"
+CPU_MODEL = "TheBloke/Llama-2-7B-Chat-GGUF/llama-2-7b-chat.Q4_K_M.gguf"
 
-    def generate(self, prompt: str, max_new_tokens=256) -> str:
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
-        outputs = self.model.generate(**inputs, max_new_tokens=max_new_tokens)
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+def default_model() -> str:
+    if os.getenv("OFFLINE_MODEL"):
+        return os.getenv("OFFLINE_MODEL")
+    try:
+        import torch
+        return GPU_MODEL if torch.cuda.is_available() else CPU_MODEL
+    except Exception:
+        return CPU_MODEL
+
+class OfflineLLM(_OfflineLLM):
+    def __init__(self, model_name=None, **kwargs):
+        super().__init__(model_name or default_model(), **kwargs)
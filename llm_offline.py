@@ -1,36 +1,284 @@
 # llm_offline.py
-import logging
+import os, time, logging, threading
+from typing import Callable, Iterator, Dict, Any, Optional, Tuple
 logger = logging.getLogger(__name__)
 
-# try to load a local HF causal model (this is optional / heavy)
-_USE_HF = False
-try:
-    from transformers import AutoTokenizer, AutoModelForCausalLM
-    import torch
-    _USE_HF = True
-except Exception:
-    _USE_HF = False
+# KV cache kept for reuse across prompts sharing a prefix; PREFIX_CACHE_MB=0 disables it
+PREFIX_CACHE_BYTES = int(float(os.getenv("PREFIX_CACHE_MB", "512")) * 1024 * 1024)
+
+# OFFLINE_BACKEND: hf (as published, device_map="auto"), int8 (CPU, torch dynamic int8
+# quantization of Linear layers), gguf (llama.cpp, memory-mapped quantized weights) or
+# auto: gguf for *.gguf models, hf when a GPU is present, int8 otherwise
+OFFLINE_BACKEND = os.getenv("OFFLINE_BACKEND", "auto")
+# CPU threads for int8 / gguf (unset: library default)
+LLM_THREADS = int(os.getenv("LLM_THREADS", "0")) or None
+GGUF_CTX = int(os.getenv("GGUF_CTX", "4096"))
+
+# a local HF causal model is optional / heavy: transformers and torch are only
+# imported when a model is actually requested
+def _import_hf():
+    try:
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+        return AutoTokenizer, AutoModelForCausalLM
+    except Exception:
+        return None
+
+def _import_llama():
+    try:
+        from llama_cpp import Llama
+        return Llama
+    except Exception:
+        return None
+
+def resolve_backend(model_name: str, backend: Optional[str] = None) -> str:
+    backend = backend or OFFLINE_BACKEND
+    if backend != "auto":
+        return backend
+    if model_name.endswith(".gguf"):
+        return "gguf"
+    try:
+        import torch
+        return "hf" if torch.cuda.is_available() else "int8"
+    except Exception:
+        return "hf"
+
+def _split_gguf(model_name: str) -> Tuple[str, str]:
+    """'org/repo/file.gguf' (file may be a glob like '*Q4_K_M.gguf') -> ('org/repo', 'file.gguf')"""
+    parts = model_name.split("/")
+    return "/".join(parts[:2]), "/".join(parts[2:])
 
 class OfflineLLM:
-    def __init__(self, model_name: str = None):
+    def __init__(self, model_name: str = None, prefix_cache_bytes: int = None,
+                 backend: Optional[str] = None, threads: Optional[int] = None):
         self.model = None
         self.tokenizer = None
-        if _USE_HF and model_name:
-            try:
-                self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.prefix_cache = None
+        self.backend = resolve_backend(model_name, backend) if model_name else None
+        self.threads = threads or LLM_THREADS
+        self._lock = threading.Lock()           # llama.cpp contexts are not thread-safe
+        cache_bytes = PREFIX_CACHE_BYTES if prefix_cache_bytes is None else prefix_cache_bytes
+        if self.backend == "gguf":
+            self._load_gguf(model_name, cache_bytes)
+        elif self.backend:
+            self._load_hf(model_name)
+            if self.model is not None and cache_bytes > 0:
+                from prefix_cache import PrefixCache
+                self.prefix_cache = PrefixCache(max_bytes=cache_bytes)
+
+    def _load_hf(self, model_name: str):
+        hf = _import_hf()
+        if not hf:
+            return
+        AutoTokenizer, AutoModelForCausalLM = hf
+        try:
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+            if self.backend == "int8":
+                self.model = self._load_int8(AutoModelForCausalLM, model_name)
+            else:
                 self.model = AutoModelForCausalLM.from_pretrained(model_name, device_map="auto")
-                logger.info("Offline LLM loaded: %s", model_name)
+            logger.info("Offline LLM loaded: %s (%s)", model_name, self.backend)
+        except Exception as e:
+            logger.warning("Failed to load HF model: %s", e)
+            self.model = None
+
+    def _load_int8(self, AutoModelForCausalLM, model_name: str):
+        import torch
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        # safetensors checkpoints are memory-mapped; low_cpu_mem_usage skips the extra random-init copy
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+        model.eval()
+        try:
+            from torch.ao.quantization import quantize_dynamic
+            model = quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        except Exception as e:
+            logger.warning("int8 quantization failed, running fp32 on CPU: %s", e)
+        return model
+
+    def _load_gguf(self, model_name: str, cache_bytes: int):
+        Llama = _import_llama()
+        if Llama is None:
+            logger.warning("llama-cpp-python not installed; GGUF backend unavailable")
+            return
+        kw = dict(n_ctx=GGUF_CTX, n_threads=self.threads, use_mmap=True, verbose=False)
+        try:
+            if os.path.exists(model_name):
+                self.model = Llama(model_path=model_name, **kw)
+            else:
+                repo_id, filename = _split_gguf(model_name)
+                self.model = Llama.from_pretrained(repo_id=repo_id, filename=filename, **kw)
+            if cache_bytes > 0:
+                # llama.cpp's own prefix reuse: saved states keyed by prompt tokens
+                from llama_cpp import LlamaRAMCache
+                self.model.set_cache(LlamaRAMCache(capacity_bytes=cache_bytes))
+            logger.info("Offline LLM loaded: %s (gguf)", model_name)
+        except Exception as e:
+            logger.warning("Failed to load GGUF model: %s", e)
+            self.model = None
+
+    def _ready(self) -> bool:
+        return self.model is not None and (self.backend == "gguf" or self.tokenizer is not None)
+
+    def count_tokens(self, text: str) -> int:
+        """Prompt tokens of text under this model's tokenizer."""
+        if self.backend == "gguf":
+            return len(self.model.tokenize(text.encode("utf-8"), add_bos=False))
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    def _gguf_tokens(self, prompt: str, max_new_tokens: int,
+                     stop: Optional[Callable[[], bool]] = None) -> Iterator[str]:
+        """Completion pieces (about one token each) from llama.cpp; stop() is polled after each."""
+        with self._lock:
+            for part in self.model.create_completion(prompt, max_tokens=max_new_tokens, stream=True):
+                yield part["choices"][0]["text"]
+                if stop is not None and stop():
+                    break
+
+    def _run(self, prompt: str, max_new_tokens: int, streamer=None, **gen_kwargs):
+        """
+        Generate for prompt, reusing cached key/values of the longest known
+        prefix: only the uncached prompt tokens are prefilled, and the
+        prompt + completion KV is kept for the next turn. Returns the output ids.
+        """
+        import torch
+        ids = self.tokenizer(prompt, return_tensors="pt").input_ids.to(self.model.device)
+        if self.prefix_cache is not None:
+            try:
+                return self._run_cached(ids, max_new_tokens, streamer, **gen_kwargs)
             except Exception as e:
-                logger.warning("Failed to load HF model: %s", e)
-                self.model = None
+                logger.warning("Prefix cache unsupported by this model, disabling: %s", e)
+                self.prefix_cache = None
+        return self.model.generate(input_ids=ids, attention_mask=torch.ones_like(ids),
+                                   max_new_tokens=max_new_tokens, streamer=streamer, **gen_kwargs)[0]
+
+    def _run_cached(self, ids, max_new_tokens: int, streamer=None, **gen_kwargs):
+        import torch
+        from transformers import DynamicCache
+        cache, reused = self.prefix_cache.lookup(ids[0].tolist())
+        if cache is None:
+            cache = DynamicCache()
+        start = time.perf_counter()
+        with torch.no_grad():
+            if ids.shape[1] - 1 > reused:
+                # prefill everything but the last prompt token, which generate() feeds itself
+                self.model(input_ids=ids[:, reused:-1], past_key_values=cache, use_cache=True)
+        self.prefix_cache.record_prefill(ids.shape[1] - 1 - reused, time.perf_counter() - start)
+        seq = self.model.generate(input_ids=ids, attention_mask=torch.ones_like(ids), past_key_values=cache,
+                                  max_new_tokens=max_new_tokens, streamer=streamer, **gen_kwargs)[0]
+        self.prefix_cache.store(seq[:cache.get_seq_length()].tolist(), cache)
+        return seq
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Prefix cache hit rate, share of prompt tokens reused and prefill time."""
+        if self.prefix_cache is None:
+            return {}
+        return dict(self.prefix_cache.stats, hit_rate=self.prefix_cache.hit_rate(),
+                    reuse_ratio=self.prefix_cache.reuse_ratio())
 
     def generate(self, prompt: str, max_new_tokens: int = 256) -> str:
-        if self.model is None or self.tokenizer is None:
+        if not self._ready():
             return "Offline LLM not available on this machine."
         try:
-            inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
-            out = self.model.generate(**inputs, max_new_tokens=max_new_tokens)
-            return self.tokenizer.decode(out[0], skip_special_tokens=True)
+            if self.backend == "gguf":
+                return prompt + "".join(self._gguf_tokens(prompt, max_new_tokens))
+            out = self._run(prompt, max_new_tokens)
+            return self.tokenizer.decode(out, skip_special_tokens=True)
         except Exception as e:
             logger.exception("Offline LLM generation failed: %s", e)
             return "Offline LLM error."
+
+    def stream(self, prompt: str, max_new_tokens: int = 256) -> Iterator[str]:
+        """
+        Yield completion text as it is generated (prompt not included);
+        model.generate runs on a worker thread feeding a TextIteratorStreamer.
+        """
+        if not self._ready():
+            raise RuntimeError("Offline LLM not available on this machine.")
+        if self.backend == "gguf":
+            yield from self._gguf_tokens(prompt, max_new_tokens)
+            return
+        from transformers import TextIteratorStreamer
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        error = []
+
+        def run():
+            try:
+                self._run(prompt, max_new_tokens, streamer)
+            except Exception as e:
+                error.append(e)
+                streamer.end()
+
+        worker = threading.Thread(target=run, name="offline-llm-stream", daemon=True)
+        worker.start()
+        yield from streamer
+        worker.join()
+        if error:
+            raise error[0]
+
+
+# ---- benchmark: python llm_offline.py --model <tiny model> [--gguf file.gguf] ----
+_BENCH_PROMPT = "The quick brown fox jumps over the lazy dog. Explain why this sentence is used so often:"
+
+def _rss_mb() -> float:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except Exception:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+def _bench_backend(model_name: str, backend: str, threads: Optional[int], new_tokens: int, runs: int) -> Dict[str, float]:
+    start = time.perf_counter()
+    llm = OfflineLLM(model_name, prefix_cache_bytes=0, backend=backend, threads=threads)
+    load = time.perf_counter() - start
+    if not llm._ready():
+        return {"error": 1.0}
+    prompt_len = 0 if backend == "gguf" else len(llm.tokenizer(_BENCH_PROMPT).input_ids)
+    llm.generate(_BENCH_PROMPT, max_new_tokens=4)           # warm-up
+    produced, took = 0, 0.0
+    for _ in range(runs):
+        start = time.perf_counter()
+        if backend == "gguf":
+            produced += sum(1 for _ in llm._gguf_tokens(_BENCH_PROMPT, new_tokens))
+        else:
+            out = llm._run(_BENCH_PROMPT, new_tokens, min_new_tokens=new_tokens)
+            produced += len(out) - prompt_len
+        took += time.perf_counter() - start
+    return {"load_s": load, "tokens_per_s": produced / took, "rss_mb": _rss_mb()}
+
+def _bench_worker(args, out):
+    try:
+        out.put(_bench_backend(*args))
+    except Exception as e:
+        logger.warning("benchmark of %s failed: %s", args[1], e)
+        out.put({"error": 1.0})
+
+def benchmark(model_name: str, gguf: Optional[str] = None, threads: Optional[int] = None,
+              new_tokens: int = 64, runs: int = 3) -> None:
+    """Load time, decode tokens/s and RSS per backend, each in a fresh process."""
+    import multiprocessing as mp
+    ctx = mp.get_context("spawn")
+    jobs = [(model_name, "hf"), (model_name, "int8")] + ([(gguf, "gguf")] if gguf else [])
+    print(f"{'backend':<8}{'load s':>9}{'tokens/s':>11}{'rss MB':>10}")
+    for name, backend in jobs:
+        out = ctx.Queue()
+        proc = ctx.Process(target=_bench_worker, args=((name, backend, threads, new_tokens, runs), out))
+        proc.start()
+        res = out.get()
+        proc.join()
+        if "error" in res:
+            print(f"{backend:<8}{'unavailable':>30}")
+        else:
+            print(f"{backend:<8}{res['load_s']:>9.2f}{res['tokens_per_s']:>11.1f}{res['rss_mb']:>10.1f}")
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Offline LLM backend benchmark (hf vs int8 vs gguf on CPU).")
+    ap.add_argument("--model", default="hf-internal-testing/tiny-random-LlamaForCausalLM")
+    ap.add_argument("--gguf", default=None, help="local .gguf file (or org/repo/file.gguf) for the gguf backend")
+    ap.add_argument("--threads", type=int, default=LLM_THREADS)
+    ap.add_argument("--tokens", type=int, default=64)
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    benchmark(args.model, args.gguf, args.threads, args.tokens, args.runs)
@@ -0,0 +1,288 @@
+# llm_router.py
+import time, queue, threading, logging
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RouterError(RuntimeError):
+    """No provider produced an answer (all failed, were skipped, or the turn deadline passed)."""
+
+
+class LatencyTracker:
+    """EWMA plus a p95 over the last `window` samples (seconds)."""
+    def __init__(self, alpha: float = 0.2, window: int = 100):
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+        self._samples: deque = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self.ewma = seconds if self.ewma is None else self.alpha * seconds + (1 - self.alpha) * self.ewma
+        self._samples.append(seconds)
+
+    def count(self) -> int:
+        return len(self._samples)
+
+    def p95(self) -> Optional[float]:
+        if not self._samples:
+            return None
+        s = sorted(self._samples)
+        return s[min(len(s) - 1, int(0.95 * len(s)))]
+
+
+class Provider:
+    """
+    One way of answering a prompt. generate(prompt, cancel) returns the full
+    text; stream(prompt, cancel) yields pieces. Either may be omitted (the
+    router derives one from the other). cancel is a threading.Event set when
+    the attempt lost a hedge or the turn deadline passed; implementations
+    should stop work when it is set.
+
+    The circuit opens after failure_threshold consecutive failures; after
+    reset_after seconds one trial request is let through (half-open).
+    """
+    def __init__(self, name: str, generate: Optional[Callable[[str, threading.Event], str]] = None,
+                 stream: Optional[Callable[[str, threading.Event], Iterator[str]]] = None,
+                 failure_threshold: int = 3, reset_after: float = 30.0):
+        if generate is None and stream is None:
+            raise ValueError("provider needs generate or stream")
+        self.name = name
+        self._generate = generate
+        self._stream = stream
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.latency = {"generate": LatencyTracker(), "stream": LatencyTracker()}   # full answer / first piece
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"calls": 0, "wins": 0, "failures": 0, "lost": 0, "skipped": 0}
+
+    def generate(self, prompt: str, cancel: threading.Event) -> str:
+        if self._generate is not None:
+            return self._generate(prompt, cancel)
+        return "".join(self.stream(prompt, cancel))
+
+    def stream(self, prompt: str, cancel: threading.Event) -> Iterator[str]:
+        if self._stream is not None:
+            return self._stream(prompt, cancel)
+        return iter([self._generate(prompt, cancel)])
+
+    # ---- circuit breaker ----
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            self.stats["skipped"] += 1
+            return False
+
+    def record_success(self, mode: str, seconds: float) -> None:
+        with self._lock:
+            self.latency[mode].add(seconds)
+            self.failures, self.opened_at, self._trial = 0, None, False
+            self.stats["wins"] += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.stats["failures"] += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial:
+                    logger.warning("LLM provider %s circuit open after %d failures", self.name, self.failures)
+                self.opened_at, self._trial = time.monotonic(), False
+
+    def record_lost(self, mode: str, seconds: float) -> None:
+        """
+        Lost a hedge after `seconds`: its answer time if it had one, else a
+        lower bound. Kept as a latency sample so a provider that never wins
+        still gets a measured hedge delay.
+        """
+        with self._lock:
+            self.latency[mode].add(seconds)
+            self.stats["lost"] += 1
+            self._trial = False
+
+
+class _Attempt:
+    __slots__ = ("provider", "cancel", "start", "first")
+
+    def __init__(self, provider: Provider):
+        self.provider = provider
+        self.cancel = threading.Event()
+        self.start = time.monotonic()
+        self.first: Optional[float] = None     # when the answer / first piece arrived
+
+
+class LLMRouter:
+    """
+    Runs a prompt on providers in preference order. If the current attempt
+    has not answered (generate) or produced its first piece (stream) within
+    the hedge delay, the next provider is started alongside it; the first
+    to answer wins and the others are cancelled. A failed attempt starts
+    the next provider at once. The hedge delay is the provider's recent p95
+    latency, counting hedges it lost (hedge_after until min_samples are
+    recorded, never below min_hedge); deadline bounds the time to an answer
+    for the whole turn.
+    With by_latency, healthy providers are tried fastest (EWMA) first.
+    """
+    def __init__(self, providers: List[Provider], hedge_after: float = 2.0, min_hedge: float = 0.2,
+                 min_samples: int = 5, deadline: Optional[float] = 30.0, max_parallel: int = 2,
+                 by_latency: bool = False):
+        self.providers = providers
+        self.hedge_after = hedge_after
+        self.min_hedge = min_hedge
+        self.min_samples = min_samples
+        self.deadline = deadline
+        self.max_parallel = max_parallel
+        self.by_latency = by_latency
+        self.stats: Dict[str, int] = {"turns": 0, "hedged": 0, "timeouts": 0, "failed": 0}
+
+    def hedge_delay(self, provider: Provider, mode: str) -> float:
+        lat = provider.latency[mode]
+        if lat.count() < self.min_samples:
+            return self.hedge_after
+        return max(self.min_hedge, lat.p95())
+
+    def _candidates(self, mode: str) -> List[Provider]:
+        order = list(self.providers)
+        if self.by_latency:
+            order.sort(key=lambda p: p.latency[mode].ewma if p.latency[mode].ewma is not None else float("inf"))
+        return order
+
+    def _run(self, att: _Attempt, prompt: str, mode: str, events: queue.Queue) -> None:
+        """Attempt thread: ("piece", att, text)... then ("end", att, None), or ("error", att, exc)."""
+        try:
+            if mode == "generate":
+                text = att.provider.generate(prompt, att.cancel)
+                if not text:
+                    raise RouterError(f"{att.provider.name} returned nothing")
+                att.first = time.monotonic()
+                events.put(("piece", att, text))
+            else:
+                it = att.provider.stream(prompt, att.cancel)
+                try:
+                    for piece in it:
+                        if att.cancel.is_set():
+                            break
+                        if piece:
+                            if att.first is None:
+                                att.first = time.monotonic()
+                            events.put(("piece", att, piece))
+                finally:
+                    close = getattr(it, "close", None)
+                    if close is not None:
+                        close()
+            events.put(("end", att, None))
+        except Exception as e:
+            events.put(("error", att, e))
+
+    def _race(self, prompt: str, mode: str, deadline: Optional[float]) -> Iterator[str]:
+        self.stats["turns"] += 1
+        events: queue.Queue = queue.Queue()
+        pending = self._candidates(mode)
+        running: List[_Attempt] = []
+        end = time.monotonic() + deadline if deadline else float("inf")
+        next_hedge = float("inf")
+        winner: Optional[_Attempt] = None
+        errors: List[str] = []
+
+        def launch() -> bool:
+            nonlocal next_hedge
+            while pending:
+                p = pending.pop(0)
+                if not p.allow():
+                    continue
+                att = _Attempt(p)
+                p.stats["calls"] += 1
+                running.append(att)
+                threading.Thread(target=self._run, args=(att, prompt, mode, events),
+                                 name=f"llm-{p.name}", daemon=True).start()
+                next_hedge = time.monotonic() + self.hedge_delay(p, mode)
+                return True
+            next_hedge = float("inf")
+            return False
+
+        launch()
+        try:
+            while running:
+                now = time.monotonic()
+                if winner is None:
+                    if now >= end:
+                        self.stats["timeouts"] += 1
+                        for att in running:
+                            att.provider.record_failure()
+                        raise RouterError(f"no answer within {deadline:.1f}s")
+                    if now >= next_hedge and len(running) < self.max_parallel:
+                        if launch():
+                            self.stats["hedged"] += 1
+                            logger.info("Hedging LLM request to %s", running[-1].provider.name)
+                        continue
+                    wait = min(end, next_hedge if len(running) < self.max_parallel else end) - now
+                else:
+                    wait = None
+                try:
+                    kind, att, payload = events.get(timeout=max(0.0, wait) if wait is not None else None)
+                except queue.Empty:
+                    continue
+                if att not in running:
+                    continue                                        # a cancelled loser still reporting
+                if kind == "piece":
+                    if winner is None:
+                        winner = att
+                        now = time.monotonic()
+                        att.provider.record_success(mode, (att.first or now) - att.start)
+                        for other in running:
+                            if other is not att:
+                                other.cancel.set()
+                                other.provider.record_lost(mode, (other.first or now) - other.start)
+                        running[:] = [att]
+                    yield payload
+                elif kind == "end":
+                    running.remove(att)
+                    if winner is None:                              # stream ended without a piece
+                        att.provider.record_failure()
+                        errors.append(f"{att.provider.name}: empty")
+                        if len(running) < self.max_parallel:
+                            launch()
+                else:
+                    running.remove(att)
+                    if winner is not None:
+                        raise payload                               # failed mid-stream
+                    logger.warning("LLM provider %s failed: %s", att.provider.name, payload)
+                    att.provider.record_failure()
+                    errors.append(f"{att.provider.name}: {payload}")
+                    if len(running) < self.max_parallel:
+                        launch()
+            if winner is None:
+                self.stats["failed"] += 1
+                raise RouterError("; ".join(errors) or "no provider available")
+        finally:
+            for att in running:
+                att.cancel.set()
+
+    def generate(self, prompt: str, deadline: Optional[float] = None) -> str:
+        """Full answer from the first provider to complete; RouterError if none does."""
+        return "".join(self._race(prompt, "generate", deadline if deadline is not None else self.deadline))
+
+    def stream(self, prompt: str, deadline: Optional[float] = None) -> Iterator[str]:
+        """Pieces from the first provider to start answering; RouterError before the first piece if none does."""
+        return self._race(prompt, "stream", deadline if deadline is not None else self.deadline)
+
+    def report(self) -> Dict[str, Dict[str, object]]:
+        out: Dict[str, Dict[str, object]] = {"router": dict(self.stats)}
+        for p in self.providers:
+            out[p.name] = dict(p.stats, state=p.state,
+                               **{f"{m}_ewma": t.ewma for m, t in p.latency.items()},
+                               **{f"{m}_p95": t.p95() for m, t in p.latency.items()})
+        return out
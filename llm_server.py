@@ -0,0 +1,240 @@
+# llm_server.py
+import time, queue, asyncio, threading, logging
+from collections import deque
+from concurrent.futures import Future, CancelledError
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    __slots__ = ("prompt", "max_new_tokens", "streamer", "future", "cancelled")
+
+    def __init__(self, prompt: str, max_new_tokens: int, streamer=None, cancelled: Optional[threading.Event] = None):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.streamer = streamer
+        self.future: Future = Future()
+        self.cancelled = cancelled or threading.Event()
+
+    def cancel(self) -> None:
+        """Drop the request if queued, or stop its row at the next decoding step if running."""
+        self.cancelled.set()
+        self.future.cancel()
+
+
+class _TextQueue:
+    """Streamer for backends without an HF streamer (gguf): put() pieces, iterate until end()."""
+    def __init__(self):
+        self._q: "queue.Queue[Optional[str]]" = queue.Queue()
+
+    def put(self, text: str) -> None:
+        self._q.put(text)
+
+    def end(self) -> None:
+        self._q.put(None)
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            text = self._q.get()
+            if text is None:
+                return
+            yield text
+
+
+def _batch_stop(batch: List[_Request], prompt_len: int):
+    """StoppingCriteria finishing each row at its own max_new_tokens or on cancel."""
+    import torch
+    from transformers import StoppingCriteria
+
+    class BatchStop(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            generated = input_ids.shape[1] - prompt_len
+            return torch.tensor([generated >= r.max_new_tokens or r.cancelled.is_set() for r in batch],
+                                dtype=torch.bool, device=input_ids.device)
+    return BatchStop()
+
+
+class InferenceServer:
+    """
+    In-process scheduler in front of one OfflineLLM.
+
+    Callers on any thread (submit / generate / stream) or event loop
+    (agenerate) enqueue requests; a dedicated worker thread owns all model
+    execution. Requests arriving within max_wait of each other are run as
+    one left-padded batch of up to max_batch prompts, each row stopping at
+    its own max_new_tokens or when cancelled. Streaming requests run alone
+    (HF streamers are single-sequence) and single prompts go through
+    OfflineLLM's prefix cache. A gguf (llama.cpp) model runs one request
+    at a time.
+    """
+    def __init__(self, llm, max_batch: int = 8, max_wait: float = 0.01):
+        self.llm = llm
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._held: deque = deque()        # streaming requests met while filling a batch
+        self.stats: Dict[str, float] = {"requests": 0, "batches": 0, "batched_requests": 0,
+                                        "cancelled": 0, "new_tokens": 0, "seconds": 0.0}
+        self._worker = threading.Thread(target=self._loop, name="llm-worker", daemon=True)
+        self._worker.start()
+
+    # ---- client API ----
+    def submit(self, prompt: str, max_new_tokens: int = 256, streamer=None,
+               cancelled: Optional[threading.Event] = None) -> _Request:
+        """Queue a request; setting the optional cancelled event stops it like req.cancel()."""
+        req = _Request(prompt, max_new_tokens, streamer, cancelled)
+        self.stats["requests"] += 1
+        self._queue.put(req)
+        return req
+
+    def generate(self, prompt: str, max_new_tokens: int = 256, timeout: Optional[float] = None,
+                 cancelled: Optional[threading.Event] = None) -> str:
+        """Blocking call with OfflineLLM.generate's result."""
+        return self.submit(prompt, max_new_tokens, cancelled=cancelled).future.result(timeout)
+
+    async def agenerate(self, prompt: str, max_new_tokens: int = 256) -> str:
+        """Awaitable generate; cancelling the awaiting task cancels the request."""
+        req = self.submit(prompt, max_new_tokens)
+        try:
+            return await asyncio.wrap_future(req.future)
+        except asyncio.CancelledError:
+            req.cancel()
+            raise
+
+    def stream(self, prompt: str, max_new_tokens: int = 256,
+               cancelled: Optional[threading.Event] = None) -> Iterator[str]:
+        """Completion text as it is generated; closing the iterator early cancels the request."""
+        if getattr(self.llm, "backend", None) == "gguf":
+            streamer = _TextQueue()
+        else:
+            from transformers import TextIteratorStreamer
+            streamer = TextIteratorStreamer(self.llm.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        req = self.submit(prompt, max_new_tokens, streamer, cancelled)
+        try:
+            yield from streamer
+            req.future.result()                 # surface generation errors
+        finally:
+            if not req.future.done():
+                req.cancel()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._worker.join(timeout=5)
+
+    def mean_batch_size(self) -> float:
+        return self.stats["batched_requests"] / self.stats["batches"] if self.stats["batches"] else 0.0
+
+    # ---- worker thread ----
+    def _next(self, timeout: Optional[float] = None) -> Optional[_Request]:
+        if self._held:
+            return self._held.popleft()
+        return self._queue.get(timeout=timeout) if timeout is not None else self._queue.get()
+
+    def _collect(self) -> Optional[List[_Request]]:
+        first = self._next()
+        if first is None:
+            return None
+        batch = [first]
+        if first.streamer is not None:
+            return batch
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if req is None:
+                self._queue.put(None)
+                break
+            if req.streamer is not None:
+                self._held.append(req)
+            else:
+                batch.append(req)
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            live = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            self.stats["cancelled"] += len(batch) - len(live)
+            if not live:
+                continue
+            start = time.perf_counter()
+            try:
+                if len(live) == 1:
+                    self._run_one(live[0])
+                else:
+                    self._run_batch(live)
+            except Exception as e:
+                logger.exception("LLM batch failed: %s", e)
+                for r in live:
+                    if r.streamer is not None:
+                        r.streamer.end()
+                    if not r.future.done():
+                        r.future.set_exception(e)
+            self.stats["seconds"] += time.perf_counter() - start
+            self.stats["batches"] += 1
+            self.stats["batched_requests"] += len(live)
+
+    def _finish(self, req: _Request, text: str, new_tokens: int) -> None:
+        self.stats["new_tokens"] += new_tokens
+        if req.cancelled.is_set():
+            req.future.set_exception(CancelledError())
+        else:
+            req.future.set_result(text)
+
+    def _run_one(self, req: _Request) -> None:
+        if getattr(self.llm, "backend", None) == "gguf":
+            return self._run_gguf(req)
+        from transformers import StoppingCriteriaList
+        tok = self.llm.tokenizer
+        prompt_len = len(tok(req.prompt).input_ids)
+        seq = self.llm._run(req.prompt, req.max_new_tokens, req.streamer,
+                            stopping_criteria=StoppingCriteriaList([_batch_stop([req], prompt_len)]))
+        self._finish(req, tok.decode(seq, skip_special_tokens=True), len(seq) - prompt_len)
+
+    def _run_gguf(self, req: _Request) -> None:
+        parts = []
+        for piece in self.llm._gguf_tokens(req.prompt, req.max_new_tokens, req.cancelled.is_set):
+            parts.append(piece)
+            if req.streamer is not None:
+                req.streamer.put(piece)
+        if req.streamer is not None:
+            req.streamer.end()
+        self._finish(req, req.prompt + "".join(parts), len(parts))
+
+    def _run_batch(self, batch: List[_Request]) -> None:
+        from transformers import StoppingCriteriaList
+        tok, model = self.llm.tokenizer, self.llm.model
+        if tok.pad_token is None:
+            tok.pad_token = tok.eos_token
+        tok.padding_side = "left"               # decoder-only: pad before the prompt
+        enc = tok([r.prompt for r in batch], return_tensors="pt", padding=True).to(model.device)
+        prompt_len = enc.input_ids.shape[1]
+        out = model.generate(**enc, max_new_tokens=max(r.max_new_tokens for r in batch),
+                             pad_token_id=tok.pad_token_id,
+                             stopping_criteria=StoppingCriteriaList([_batch_stop(batch, prompt_len)]))
+        for i, req in enumerate(batch):
+            row = out[i, :prompt_len + req.max_new_tokens]
+            new = int((row[prompt_len:] != tok.pad_token_id).sum())
+            self._finish(req, tok.decode(row, skip_special_tokens=True), new)
+
+
+_SERVER: Optional[InferenceServer] = None
+_SERVER_LOCK = threading.Lock()
+
+def get_server(llm) -> Optional[InferenceServer]:
+    """Shared server for llm (one model instance for every caller); None if the model is unavailable."""
+    global _SERVER
+    if llm is None or getattr(llm, "model", None) is None:
+        return None
+    with _SERVER_LOCK:
+        if _SERVER is None or _SERVER.llm is not llm:
+            _SERVER = InferenceServer(llm, max_batch=1 if getattr(llm, "backend", None) == "gguf" else 8)
+    return _SERVER
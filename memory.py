@@ -1,48 +1,406 @@
 # memory.py
-import os, json
-from typing import List
+import os, json, time, logging
+from typing import List, Dict, Any, Tuple, Optional, Callable
+
+logger = logging.getLogger(__name__)
 
 class MemoryManager:
     """
     Handles storing and retrieving text memories.
-    Saves memories in local JSON files.
+    Saves memories in local JSON files: backend="journal" appends each change
+    to memory.log and compacts into memory.json in the background,
+    backend="json" rewrites memory.json on every change.
+
+    mode="keyword" ranks with an incremental BM25 inverted index;
+    mode="vector" keeps embeddings in a VectorIndex (FAISS HNSW or NumPy),
+    or with vector_store="mmap" in a memory-mapped float16/int8 EmbeddingStore
+    that is appended to on disk and opened without loading the vectors.
+    Both indexes are updated in place on add_text and saved by flush().
+
+    dedup="merge" drops near-duplicates at ingest and lets a new text replace
+    older memories it contains; dedup="reject" only drops; None disables.
+
+    max_items / max_bytes / ttl bound the store with a RetentionPolicy that
+    evicts the least important memories (recency, retrieval hits, source).
     """
-    def __init__(self, memory_dir: str = "memories"):
+    def __init__(self, memory_dir: str = "memories", mode: str = "keyword",
+                 embed_fn: Optional[Callable] = None, backend: str = "journal",
+                 fsync: str = "interval", compact_every: int = 1000,
+                 dedup: Optional[str] = "merge", dedup_threshold: float = 0.8,
+                 vector_store: str = "memory", vector_dtype: str = "float16",
+                 max_items: Optional[int] = None, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None):
         self.memory_dir = memory_dir
         os.makedirs(self.memory_dir, exist_ok=True)
         self.memories_file = os.path.join(self.memory_dir, "memory.json")
-        self._memories: List[str] = []
+        self.vector_store = vector_store
+        self.vector_dtype = vector_dtype
+        if vector_store == "mmap":
+            self.index_file = os.path.join(self.memory_dir, "vectors")
+        else:
+            self.index_file = os.path.join(self.memory_dir, "memory.index")
+        self.bm25_file = os.path.join(self.memory_dir, "bm25.json")
+        self.dedup_file = os.path.join(self.memory_dir, "dedup.npz")
+        self.policy_file = os.path.join(self.memory_dir, "retention.json")
+        self._memories: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 0
+        self.mode = mode
+        self.dedup = dedup
+        self.dedup_threshold = dedup_threshold
+        self._embed_fn = embed_fn
+        self._index = None
+        self._bm25 = None
+        self._minhash = None
+        self._journal = None
+        self._policy = None
+        self._listeners: List[Callable] = []
+        if max_items is not None or max_bytes is not None or ttl is not None:
+            from memory_policy import RetentionPolicy
+            self._policy = RetentionPolicy(max_items=max_items, max_bytes=max_bytes, ttl=ttl)
 
         # Load existing memories
-        if os.path.exists(self.memories_file):
+        if backend == "journal":
+            from memory_journal import MemoryJournal
+            self._journal = MemoryJournal(self.memories_file, fsync=fsync, compact_every=compact_every)
+            try:
+                self._journal.load(self._apply)
+            except Exception as e:
+                logger.warning("Memory journal load failed: %s", e)
+        elif os.path.exists(self.memories_file):
             try:
                 with open(self.memories_file, "r", encoding="utf-8") as f:
-                    self._memories = json.load(f)
+                    data = json.load(f)
+                self._apply(dict(data, op="snapshot") if isinstance(data, dict) else {"op": "snapshot", "memories": data})
             except Exception:
-                self._memories = []
+                self._memories = {}
+
+        self._init_bm25()
+        if self.dedup:
+            self._init_dedup()
+        if self.mode == "vector":
+            self._init_vector_index()
+        if self._policy is not None:
+            for rec in self._memories.values():
+                self._policy.add(rec)
+            self._load_policy_state()
+            self._enforce()
 
-    def add_text(self, text: str):
-        """Add text to memory"""
-        self._memories.append(text)
-        self._save()
+    def _load_policy_state(self):
+        """Restore retrieval hits and access times saved by flush()"""
+        if not os.path.exists(self.policy_file):
+            return
+        try:
+            with open(self.policy_file, "r", encoding="utf-8") as f:
+                self._policy.restore(json.load(f))
+        except Exception as e:
+            logger.warning("Loading %s failed: %s", self.policy_file, e)
+
+    def _load_record(self, item):
+        """Accept legacy plain strings as well as {"id", "text", "meta"} records."""
+        if isinstance(item, str):
+            item = {"text": item}
+        rec = {"id": item.get("id", self._next_id), "text": item["text"], "meta": item.get("meta") or {},
+               "ts": item.get("ts") or time.time()}
+        self._memories[rec["id"]] = rec
+        self._next_id = max(self._next_id, rec["id"] + 1)
+        return rec
+
+    def _apply(self, entry: Dict[str, Any]):
+        """Replay one journal op"""
+        op = entry["op"]
+        if op == "snapshot":
+            for item in entry.get("memories", []):
+                self._load_record(item)
+            self._next_id = max(self._next_id, entry.get("next_id", 0))
+        elif op == "add":
+            self._load_record(entry["rec"])
+        elif op == "delete":
+            for mid in entry["ids"]:
+                self._memories.pop(mid, None)
+        elif op == "clear":
+            self._memories = {}
+            self._next_id = 0
+
+    def _missing(self, indexed: List[int]) -> Optional[Tuple[List[Dict[str, Any]], List[int]]]:
+        """
+        (memories missing from a persisted index, indexed ids since deleted),
+        or None if the index does not match this memory file and must be rebuilt.
+        """
+        indexed = set(indexed)
+        if any(i >= self._next_id for i in indexed):
+            return None
+        missing = [rec for mid, rec in self._memories.items() if mid not in indexed]
+        if missing and indexed and missing[0]["id"] < max(indexed):
+            return None
+        return missing, [i for i in indexed if i not in self._memories]
+
+    def _load_index(self, path: str, loader: Callable):
+        """Load a persisted index; returns (index, missing, stale) or (None, all, [])."""
+        if os.path.exists(path):
+            try:
+                index = loader(path)
+                delta = self._missing(index.ids())
+                if delta is not None:
+                    return (index,) + delta
+            except Exception as e:
+                logger.warning("Loading %s failed, rebuilding: %s", path, e)
+        return None, list(self._memories.values()), []
+
+    def _init_bm25(self):
+        """Load the persisted BM25 index and add only memories missing from it."""
+        from bm25_index import BM25Index
+        self._bm25, missing, stale = self._load_index(self.bm25_file, BM25Index.load)
+        if self._bm25 is None:
+            self._bm25 = BM25Index()
+        for mid in stale:
+            self._bm25.remove(mid)
+        for rec in missing:
+            self._bm25.add(rec["id"], rec["text"])
+
+    def _init_dedup(self):
+        """Load persisted MinHash signatures and sign only memories missing from them."""
+        from dedup import MinHashIndex
+        self._minhash, missing, stale = self._load_index(self.dedup_file, MinHashIndex.load)
+        if self._minhash is None:
+            self._minhash = MinHashIndex(threshold=self.dedup_threshold)
+        self._minhash.threshold = self.dedup_threshold
+        for mid in stale:
+            self._minhash.remove(mid)
+        for rec in missing:
+            self._minhash.add(rec["id"], *self._minhash.signature(rec["text"]))
+
+    # ---- embeddings ----
+    def _embed(self, texts: List[str]):
+        if self._embed_fn is None:
+            from embed_service import get_batcher
+            self._embed_fn = get_batcher().embed_sync      # batched with concurrent ingest / retrieval
+        vecs = self._embed_fn(texts)
+        if vecs is None:
+            return None
+        from vector_index import normalize
+        return normalize(vecs)
+
+    def _new_vector_index(self, dim: int):
+        self._drop_file(self.index_file)
+        if self.vector_store == "mmap":
+            from embedding_store import EmbeddingStore
+            return EmbeddingStore(self.index_file, dim=dim, dtype=self.vector_dtype)
+        from vector_index import VectorIndex
+        return VectorIndex(dim)
+
+    def _init_vector_index(self):
+        """Load the persisted index and embed only memories missing from it."""
+        if self.vector_store == "mmap":
+            from embedding_store import EmbeddingStore as loader
+        else:
+            from vector_index import VectorIndex as loader
+        self._index, missing, stale = self._load_index(self.index_file, loader.load)
+        if self._index is not None:
+            self._index.remove(stale)
+        probe = self._embed([rec["text"] for rec in missing] or ["probe"])
+        if probe is None:
+            logger.warning("Embeddings unavailable; falling back to keyword memory search.")
+            self.mode, self._index = "keyword", None
+            return
+        if self._index is None:
+            self._index = self._new_vector_index(probe.shape[1])
+        if missing:
+            self._index.add([rec["id"] for rec in missing], probe)
+
+    def import_corpus(self, index_path: str = "faiss.index", text_path: str = "faiss_text.json") -> int:
+        """Add the shipped faiss.index / faiss_text.json corpus, reusing its vectors."""
+        from vector_index import load_corpus, normalize
+        texts, vecs = load_corpus(index_path, text_path)
+        if self._index is not None and vecs.shape[1] != self._index.dim:
+            logger.warning("Corpus dim %d != index dim %d; re-embedding.", vecs.shape[1], self._index.dim)
+            vecs = None
+        start = self._next_id
+        for pos, text in enumerate(texts):
+            self._add(text, {"source": "faiss_corpus"}, normalize(vecs[pos]) if vecs is not None else None)
+        return self._next_id - start
+
+    def add_text(self, text: str, meta: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Add text to memory, returns its id.
+        A near-duplicate of an existing memory is not stored; that memory's id is returned.
+        """
+        return self._add(text, meta or {})
+
+    def add_texts(self, texts: List[str], metas: Optional[List[Dict[str, Any]]] = None, vecs=None) -> List[int]:
+        """
+        Bulk add_text: embeds all texts in one batch (or takes precomputed vecs
+        from a pipeline), returns their ids in order.
+        """
+        metas = metas or [{} for _ in texts]
+        if self._index is not None:
+            from vector_index import normalize
+            vecs = self._embed(texts) if vecs is None else normalize(vecs)
+        else:
+            vecs = None
+        return [self._add(text, meta or {}, vecs[i:i + 1] if vecs is not None else None)
+                for i, (text, meta) in enumerate(zip(texts, metas))]
+
+    def _add(self, text: str, meta: Dict[str, Any], vec=None) -> int:
+        sig = None
+        if self._minhash is not None:
+            sig = self._minhash.signature(text)
+            verdict, other = self._minhash.match(*sig)
+            if verdict == "duplicate":
+                return other
+            if verdict == "supersedes" and self.dedup == "merge":
+                self._delete([other])
+        rec = self._load_record({"id": self._next_id, "text": text, "meta": meta})
+        if self._index is not None:
+            vec = vec if vec is not None else self._embed([text])
+            if vec is not None:
+                self._index.add([rec["id"]], vec)
+        self._bm25.add(rec["id"], text)
+        if sig is not None:
+            self._minhash.add(rec["id"], *sig)
+        self._persist({"op": "add", "rec": rec})
+        self._notify("add", [rec["id"]], [rec])
+        if self._policy is not None:
+            self._policy.add(rec)
+            self._enforce()
+        return rec["id"]
+
+    def _enforce(self):
+        """Evict expired memories, then the least important ones while over capacity"""
+        ids = self._policy.expired() + self._policy.victims()
+        if ids:
+            self._delete(ids)
+
+    def _delete(self, ids: List[int]):
+        """Drop memories from the store and every index"""
+        ids = [mid for mid in ids if mid in self._memories]
+        if not ids:
+            return
+        recs = [self._memories[mid] for mid in ids]
+        for mid, rec in zip(ids, recs):
+            del self._memories[mid]
+            self._bm25.remove(mid, rec["text"])
+            if self._minhash is not None:
+                self._minhash.remove(mid)
+            if self._policy is not None:
+                self._policy.remove(mid)
+        if self._index is not None:
+            self._index.remove(ids)
+        self._persist({"op": "delete", "ids": ids})
+        self._notify("delete", ids, recs)
+
+    def add_listener(self, fn: Callable[[str, List[int], List[Dict[str, Any]]], None]):
+        """
+        Call fn(op, ids, records) after every change: op is "add", "delete"
+        (including dedup merges and retention evictions) or "clear".
+        """
+        self._listeners.append(fn)
+
+    def _notify(self, op: str, ids: List[int], recs: List[Dict[str, Any]]):
+        for fn in self._listeners:
+            try:
+                fn(op, ids, recs)
+            except Exception as e:
+                logger.warning("Memory listener failed: %s", e)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """Return (text, score) pairs, best first."""
+        return [(rec["text"], s) for rec, s in self.search_records(query, top_k)]
+
+    def search_records(self, query: str, top_k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        """Return (record, score) pairs, best first; records carry id, text and meta."""
+        if self._policy is not None:
+            self._delete(self._policy.expired())
+        hits = None
+        if self._index is not None:
+            qvec = self._embed([query])
+            if qvec is not None:
+                hits = self._index.search(qvec[0], top_k)
+        if hits is None:
+            hits = self._bm25.search(query, top_k)
+        hits = [(i, s) for i, s in hits if i in self._memories]
+        if self._policy is not None:
+            for i, _ in hits:
+                self._policy.touch(i)
+        return [(self._memories[i], s) for i, s in hits]
 
     def retrieve(self, query: str, top_k: int = 5) -> List[str]:
         """
-        Retrieve relevant memories containing query keywords.
-        Simple keyword match for demo purposes.
+        Retrieve relevant memories.
+        Vector similarity in vector mode, BM25 keyword ranking otherwise.
         """
-        results = [m for m in self._memories if query.lower() in m.lower()]
-        return results[:top_k]
+        return [text for text, _ in self.search(query, top_k)]
 
     def clear(self):
         """Clear all memories"""
-        self._memories = []
-        self._save()
+        self._memories = {}
+        self._next_id = 0
+        for path in (self.bm25_file, self.dedup_file, self.policy_file):
+            self._drop_file(path)
+        if self._index is not None:
+            self._index = self._new_vector_index(self._index.dim)
+        else:
+            self._drop_file(self.index_file)
+        from bm25_index import BM25Index
+        self._bm25 = BM25Index(self._bm25.k1, self._bm25.b)
+        if self._minhash is not None:
+            from dedup import MinHashIndex
+            self._minhash = MinHashIndex(threshold=self.dedup_threshold)
+        if self._policy is not None:
+            p = self._policy
+            self._policy = type(p)(p.max_items, p.max_bytes, p.ttl, p.half_life, p.source_weights)
+        self._persist({"op": "clear"})
+        self._notify("clear", [], [])
+
+    @staticmethod
+    def _drop_file(path: str):
+        if os.path.isdir(path):
+            import shutil
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def flush(self):
+        """Persist the search indexes and sync the journal (memories are already saved on every add)"""
+        try:
+            self._bm25.save(self.bm25_file)
+            if self._minhash is not None:
+                self._minhash.save(self.dedup_file)
+            if self._index is not None:
+                self._index.save(self.index_file)
+            if self._policy is not None:
+                with open(self.policy_file, "w", encoding="utf-8") as f:
+                    json.dump(self._policy.state(), f)
+        except Exception as e:
+            print("Error saving memory index:", e)
+        if self._journal is not None:
+            self._journal.sync()
+
+    def close(self):
+        """Flush and release the journal"""
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+
+    def compact(self):
+        """Fold the journal into a fresh memory.json snapshot and drop deleted vectors now"""
+        if self._journal is not None:
+            self._journal.compact(self._snapshot, wait=True)
+        if self._index is not None:
+            self._index.compact()
+
+    def _persist(self, op: Dict[str, Any]):
+        if self._journal is not None:
+            self._journal.append(op, self._snapshot)
+        else:
+            self._save()
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {"next_id": self._next_id, "memories": [dict(r) for r in self._memories.values()]}
 
     def _save(self):
         """Save memories to disk"""
         try:
             with open(self.memories_file, "w", encoding="utf-8") as f:
-                json.dump(self._memories, f, ensure_ascii=False, indent=2)
+                json.dump(self._snapshot(), f, ensure_ascii=False, indent=2)
         except Exception as e:
             print("Error saving memory:", e)
@@ -0,0 +1,137 @@
+# memory_journal.py
+import os, glob, json, time, threading, logging
+from typing import List, Dict, Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+class MemoryJournal:
+    """
+    Append-only JSONL log in front of a JSON snapshot.
+
+    Every change is one appended line, so persisting a turn costs O(1).
+    Once the log grows past compact_every entries it is rotated and folded
+    into a new snapshot on a background thread. Startup loads the snapshot
+    and replays the log tail (entries newer than the snapshot's seq).
+    """
+    def __init__(self, snapshot_path: str, fsync: str = "interval", fsync_interval: float = 1.0,
+                 compact_every: int = 1000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.snapshot_path = snapshot_path
+        self.log_path = os.path.splitext(snapshot_path)[0] + ".log"
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._log_entries = 0
+        self._last_sync = 0.0
+        self._fh = None
+        self._compactor: Optional[threading.Thread] = None
+
+    # ---- startup ----
+    def load(self, apply: Callable[[Dict[str, Any]], None]) -> None:
+        """
+        Feed the snapshot to apply() as one {"op": "snapshot", ...} entry
+        (legacy list files become {"memories": [...]}), then the log tail.
+        """
+        snap_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                data = {"memories": data}
+            snap_seq = data.pop("seq", 0)
+            apply(dict(data, op="snapshot"))
+        self._seq = snap_seq
+        for path in self._rotated_logs() + [self.log_path]:
+            if os.path.exists(path):
+                self._replay(path, snap_seq, apply)
+        self._fh = open(self.log_path, "a", encoding="utf-8")
+
+    def _rotated_logs(self) -> List[str]:
+        """Logs rotated out by compaction (memory.log.<seq>), oldest first."""
+        paths = glob.glob(glob.escape(self.log_path) + ".*")
+        return sorted((p for p in paths if p.rsplit(".", 1)[1].isdigit()), key=lambda p: int(p.rsplit(".", 1)[1]))
+
+    def _replay(self, path: str, snap_seq: int, apply: Callable) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping torn journal line in %s", path)
+                    continue
+                self._seq = max(self._seq, entry["seq"])
+                if entry["seq"] > snap_seq:
+                    apply(entry)
+                    self._log_entries += 1
+
+    # ---- writes ----
+    def append(self, op: Dict[str, Any], snapshot_fn: Optional[Callable[[], Dict[str, Any]]] = None) -> None:
+        """Append one op; may kick off background compaction via snapshot_fn."""
+        with self._lock:
+            self._seq += 1
+            self._fh.write(json.dumps(dict(op, seq=self._seq), ensure_ascii=False) + "\n")
+            self._fh.flush()
+            now = time.monotonic()
+            if self.fsync == "always" or (self.fsync == "interval" and now - self._last_sync >= self.fsync_interval):
+                os.fsync(self._fh.fileno())
+                self._last_sync = now
+            self._log_entries += 1
+            due = snapshot_fn is not None and self._log_entries >= self.compact_every
+        if due:
+            self.compact(snapshot_fn)
+
+    def compact(self, snapshot_fn: Callable[[], Dict[str, Any]], wait: bool = False) -> None:
+        """
+        Rotate the log and write a fresh snapshot in the background.
+        snapshot_fn() runs under the lock and must return a copy of the state.
+        """
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        with self._lock:
+            seq = self._seq
+            self._fh.close()
+            os.replace(self.log_path, f"{self.log_path}.{seq}")
+            self._fh = open(self.log_path, "a", encoding="utf-8")
+            self._log_entries = 0
+            snapshot = snapshot_fn()
+        self._compactor = threading.Thread(target=self._write_snapshot, args=(seq, snapshot), daemon=True)
+        self._compactor.start()
+        if wait:
+            self._compactor.join()
+
+    def _write_snapshot(self, seq: int, snapshot: Dict[str, Any]) -> None:
+        tmp = self.snapshot_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(dict(snapshot, seq=seq), f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+            for path in self._rotated_logs():
+                if int(path.rsplit(".", 1)[1]) <= seq:
+                    os.remove(path)
+        except Exception as e:
+            logger.warning("Memory compaction failed: %s", e)
+
+    def sync(self) -> None:
+        """Force buffered log lines to disk regardless of the fsync policy."""
+        with self._lock:
+            if self._fh and not self._fh.closed:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+                self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        """Wait for compaction and sync the log to disk."""
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._lock:
+            if self._fh and not self._fh.closed:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+                self._fh.close()
@@ -0,0 +1,118 @@
+# memory_policy.py
+import math, time, heapq
+from typing import Dict, Any, List, Optional, Tuple
+
+# relative value of a memory by meta["source"]; unknown sources count as 1.0
+SOURCE_WEIGHTS = {"user": 2.0, "conversation": 1.0, "course": 0.8, "wikipedia": 0.7, "faiss_corpus": 0.5}
+
+class RetentionPolicy:
+    """
+    Capacity-bounded retention for MemoryManager.
+
+    importance = source weight * (1 + ln(1 + hits)) * 0.5 ** (idle time / half_life)
+
+    The decay term is shared by every entry at any given moment, so ordering
+    by log(importance) equals ordering by the time-independent key
+        ln(weight) + ln(1 + ln(1 + hits)) + last_access * ln2 / half_life
+    which lets a plain min-heap pick the least important entry in O(log n).
+    Touches and removals push new heap items and invalidate old ones lazily.
+    A second heap ordered by expiry time implements per-entry TTL
+    (meta["ttl"] seconds, else the policy default).
+    """
+    def __init__(self, max_items: Optional[int] = None, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None, half_life: float = 7 * 86400,
+                 source_weights: Optional[Dict[str, float]] = None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.half_life = half_life
+        self.source_weights = dict(SOURCE_WEIGHTS, **(source_weights or {}))
+        # id -> [weight, hits, last_access, size, version]
+        self._entries: Dict[int, List[float]] = {}
+        self._heap: List[Tuple[float, int, int]] = []
+        self._expiry: List[Tuple[float, int]] = []
+        self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _weight(self, rec: Dict[str, Any]) -> float:
+        meta = rec.get("meta") or {}
+        w = self.source_weights.get(meta.get("source"), 1.0)
+        return max(w * float(meta.get("importance", 1.0)), 1e-9)
+
+    def _push(self, mid: int) -> None:
+        weight, hits, last, _, version = self._entries[mid]
+        key = math.log(weight) + math.log(1.0 + math.log1p(hits)) + last * math.log(2) / self.half_life
+        heapq.heappush(self._heap, (key, version, mid))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        live = [(k, v, mid) for k, v, mid in self._heap
+                if mid in self._entries and self._entries[mid][4] == v]
+        heapq.heapify(live)
+        self._heap = live
+
+    def add(self, rec: Dict[str, Any]) -> None:
+        mid = rec["id"]
+        size = len(rec["text"].encode("utf-8"))
+        self._entries[mid] = [self._weight(rec), 0, rec.get("ts") or time.time(), size, 0]
+        self.total_bytes += size
+        self._push(mid)
+        ttl = (rec.get("meta") or {}).get("ttl", self.ttl)
+        if ttl is not None:
+            heapq.heappush(self._expiry, ((rec.get("ts") or time.time()) + float(ttl), mid))
+
+    def touch(self, mid: int, now: Optional[float] = None) -> None:
+        """Record a retrieval hit."""
+        e = self._entries.get(mid)
+        if e is None:
+            return
+        e[1] += 1
+        e[2] = now or time.time()
+        e[4] += 1
+        self._push(mid)
+
+    def state(self) -> Dict[int, List[float]]:
+        """id -> [hits, last_access] for touched entries, to persist across restarts."""
+        return {mid: [e[1], e[2]] for mid, e in self._entries.items() if e[1]}
+
+    def restore(self, state: Dict[Any, List[float]]) -> None:
+        """Reapply hits and last access times saved by state()."""
+        for mid, (hits, last) in state.items():
+            e = self._entries.get(int(mid))
+            if e is None:
+                continue
+            e[1], e[2] = int(hits), float(last)
+            e[4] += 1
+            self._push(int(mid))
+
+    def remove(self, mid: int) -> None:
+        e = self._entries.pop(mid, None)
+        if e is not None:
+            self.total_bytes -= int(e[3])
+
+    def expired(self, now: Optional[float] = None) -> List[int]:
+        """Pop ids whose TTL has passed."""
+        now = now or time.time()
+        out = []
+        while self._expiry and self._expiry[0][0] <= now:
+            _, mid = heapq.heappop(self._expiry)
+            if mid in self._entries:
+                out.append(mid)
+                self.remove(mid)
+        return out
+
+    def victims(self) -> List[int]:
+        """Pop least important ids until the size and byte limits hold again."""
+        out = []
+        while self._entries and ((self.max_items is not None and len(self._entries) > self.max_items) or
+                                 (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+            _, version, mid = heapq.heappop(self._heap)
+            e = self._entries.get(mid)
+            if e is None or e[4] != version:
+                continue
+            out.append(mid)
+            self.remove(mid)
+        return out
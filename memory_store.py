@@ -1,26 +1,53 @@
 # memory_store.py
-from typing import List, Dict
+import time
+from collections import deque
+from typing import List, Dict, Optional
 
 class ConversationMemory:
     """
     Handles conversational history for a user.
+    History is bounded: the oldest messages are dropped once max_messages,
+    max_bytes or ttl (seconds) is exceeded; each drop is O(1).
     """
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, max_messages: Optional[int] = 200,
+                 max_bytes: Optional[int] = None, ttl: Optional[float] = None):
         self.user_id = user_id
-        self.messages: List[Dict[str, str]] = []
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.messages: deque = deque()
+        self._times: deque = deque()
+        self._bytes = 0
 
     def append_message(self, role: str, content: str):
         """Append a message from user or assistant"""
         self.messages.append({"role": role, "content": content})
+        self._times.append(time.time())
+        self._bytes += len(content.encode("utf-8"))
+        self._trim()
 
     def add_text(self, text: str):
         """Add system/assistant text"""
-        self.messages.append({"role": "system", "content": text})
+        self.append_message("system", text)
+
+    def _trim(self):
+        """Drop oldest messages until within limits"""
+        cutoff = time.time() - self.ttl if self.ttl is not None else None
+        while self.messages and (
+                (self.max_messages is not None and len(self.messages) > self.max_messages) or
+                (self.max_bytes is not None and self._bytes > self.max_bytes) or
+                (cutoff is not None and self._times[0] < cutoff)):
+            msg = self.messages.popleft()
+            self._times.popleft()
+            self._bytes -= len(msg["content"].encode("utf-8"))
 
     def clear(self):
         """Clear all messages"""
-        self.messages = []
+        self.messages = deque()
+        self._times = deque()
+        self._bytes = 0
 
-    def get_messages(self):
-        """Return full conversation history"""
-        return self.messages
+    def get_messages(self) -> List[Dict[str, str]]:
+        """Return retained conversation history"""
+        self._trim()
+        return list(self.messages)
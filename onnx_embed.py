@@ -0,0 +1,160 @@
+# onnx_embed.py
+import os, time, logging, argparse
+from typing import List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ONNX_DIR = os.path.join("models", "onnx")
+
+def _hf_name(model_name: str) -> str:
+    """SentenceTransformer short names live under the sentence-transformers org."""
+    return model_name if "/" in model_name else "sentence-transformers/" + model_name
+
+def model_dir_for(model_name: str, root: str = DEFAULT_ONNX_DIR) -> str:
+    return os.path.join(root, model_name.replace("/", "__"))
+
+
+def export_onnx(model_name: str, out_dir: Optional[str] = None, quantize: bool = True, opset: int = 14) -> str:
+    """
+    Export a transformer encoder to ONNX (model.onnx), save its fast tokenizer
+    (tokenizer.json) and, with quantize, an int8 dynamically quantized graph
+    (model.int8.onnx). Needs torch + transformers once; inference does not.
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+    out_dir = out_dir or model_dir_for(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+    tok = AutoTokenizer.from_pretrained(_hf_name(model_name))
+    model = AutoModel.from_pretrained(_hf_name(model_name)).eval()
+    enc = tok(["export sample"], return_tensors="pt")
+    inputs = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in enc]
+    fp32 = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(enc[n] for n in inputs), fp32,
+            input_names=inputs, output_names=["last_hidden_state"],
+            dynamic_axes={n: {0: "batch", 1: "seq"} for n in inputs + ["last_hidden_state"]},
+            opset_version=opset,
+        )
+    tok.save_pretrained(out_dir)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32, os.path.join(out_dir, "model.int8.onnx"), weight_type=QuantType.QInt8)
+    return out_dir
+
+
+class OnnxEmbedder:
+    """
+    Sentence embeddings through ONNX Runtime on CPU: fast (Rust) tokenizer,
+    encoder graph (int8 quantized by default), masked mean pooling and L2
+    normalization, matching the SentenceTransformer all-MiniLM-L6-v2 pipeline.
+    encode() has the SentenceTransformer signature so utils can swap it in.
+    """
+    def __init__(self, model_dir: str, quantized: bool = True, max_length: int = 256,
+                 threads: Optional[int] = None, normalize: bool = True):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        graph = os.path.join(model_dir, "model.int8.onnx" if quantized else "model.onnx")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(graph, sess_options=opts, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self._counter = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.model_dir = model_dir
+        self.max_length = max_length
+        self.normalize = normalize
+
+    def count_tokens(self, text: str) -> int:
+        """Untruncated token count (chunk budgeting)."""
+        return len(self._counter.encode(text, add_special_tokens=False).ids)
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False, **_) -> np.ndarray:
+        out = []
+        for start in range(0, len(texts), batch_size):
+            encs = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            ids = np.array([e.ids for e in encs], dtype=np.int64)
+            mask = np.array([e.attention_mask for e in encs], dtype=np.int64)
+            feed = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self._inputs:
+                feed["token_type_ids"] = np.zeros_like(ids)
+            hidden = self.session.run(None, feed)[0]
+            m = mask[:, :, None].astype(np.float32)
+            pooled = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out.append(pooled.astype(np.float32))
+        return np.concatenate(out) if out else np.zeros((0, 0), dtype=np.float32)
+
+
+def load_onnx_embedder(model_name: str, model_dir: Optional[str] = None, quantized: bool = True,
+                       threads: Optional[int] = None) -> OnnxEmbedder:
+    """OnnxEmbedder for model_name, exporting it on first use if needed."""
+    model_dir = model_dir or model_dir_for(model_name)
+    graph = os.path.join(model_dir, "model.int8.onnx" if quantized else "model.onnx")
+    if not os.path.exists(graph):
+        logger.info("Exporting %s to ONNX in %s", model_name, model_dir)
+        export_onnx(model_name, model_dir, quantize=quantized)
+    return OnnxEmbedder(model_dir, quantized=quantized, threads=threads)
+
+
+# ---- parity check / benchmark ----
+_SAMPLES = [
+    "tumhara naam kya hai",
+    "What is the weather in Delhi today?",
+    "Q: hello jarvis\nA: Hello, main Jarvis hoon. Boliye.",
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "Open notepad and write a shopping list for tomorrow.",
+] * 40
+
+def _rss_mb() -> float:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except Exception:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+def _bench(name: str, encode, texts: List[str]) -> np.ndarray:
+    encode(texts[:8])                                  # warm-up
+    start = time.perf_counter()
+    vecs = encode(texts)
+    took = time.perf_counter() - start
+    print(f"{name:<14}{len(texts) / took:>10.1f} texts/s   rss {_rss_mb():>8.1f} MB")
+    return np.asarray(vecs, dtype=np.float32)
+
+def parity_and_benchmark(model_name: str, threads: Optional[int] = None) -> None:
+    """Compare ONNX fp32/int8 output against the PyTorch SentenceTransformer and time all three."""
+    texts = list(_SAMPLES)
+    results = {}
+    for quantized in (False, True):
+        emb = load_onnx_embedder(model_name, quantized=quantized, threads=threads)
+        results["onnx-int8" if quantized else "onnx-fp32"] = _bench(
+            "onnx-int8" if quantized else "onnx-fp32", emb.encode, texts)
+    try:
+        from sentence_transformers import SentenceTransformer
+        st = SentenceTransformer(model_name, device="cpu")
+        ref = _bench("pytorch", lambda t: st.encode(t, normalize_embeddings=True, show_progress_bar=False), texts)
+    except Exception as e:
+        print("PyTorch backend unavailable, skipping parity:", e)
+        return
+    for name, vecs in results.items():
+        cos = (vecs * ref).sum(axis=1)
+        print(f"parity {name:<10} cosine vs pytorch: min {cos.min():.4f}  mean {cos.mean():.4f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="ONNX Runtime embedding backend tools.")
+    ap.add_argument("command", choices=["export", "bench"])
+    ap.add_argument("--model", default=os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2"))
+    ap.add_argument("--threads", type=int, default=None)
+    args = ap.parse_args()
+    if args.command == "export":
+        print("Exported to", export_onnx(args.model))
+    else:
+        parity_and_benchmark(args.model, args.threads)
@@ -0,0 +1,306 @@
+# openai_client.py
+import os, json, time, queue, random, asyncio, threading, logging
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except Exception:
+    aiohttp = None
+    AIOHTTP_AVAILABLE = False
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+
+# worth retrying; for 401/403/429 the key pool cools that key down and the retry gets another
+# (401/403 only while some key has not been rejected)
+RETRY_STATUS = {401, 403, 408, 409, 429, 500, 502, 503, 504}
+
+Messages = Union[str, List[Dict[str, str]]]
+
+
+class OpenAIError(RuntimeError):
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _retry_after(headers) -> Optional[float]:
+    """Seconds from Retry-After / retry-after-ms, if the server sent one."""
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("Retry-After"):
+            return float(headers["Retry-After"])
+    except ValueError:
+        pass
+    return None
+
+def _messages(prompt: Messages) -> List[Dict[str, str]]:
+    return [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+
+def _estimate_tokens(payload: Dict[str, Any]) -> int:
+    """Tokens a request may use (prompt at ~4 chars/token + max_tokens), for the key pool's TPM bucket."""
+    chars = sum(len(m.get("content") or "") for m in payload["messages"])
+    return chars // 4 + 8 * len(payload["messages"]) + payload.get("max_tokens", 500)
+
+
+class OpenAIClient:
+    """
+    Chat completions over one keep-alive aiohttp connection pool shared by
+    every key, turn and tool, so calls after the first skip TCP/TLS setup.
+    The pool lives on a private event-loop thread: coroutines on any loop
+    (chat / stream) and plain threads (chat_sync / stream_sync) share it.
+
+    Every request holds a lease from the APIKeyManager pool, which picks
+    the key and learns its limits from the response headers. Connection
+    errors, timeouts and 5xx are retried with full-jitter exponential
+    backoff; 401/403/429 are retried at once on whichever key the pool
+    offers next. Once every key has been rejected (401/403) requests fail
+    at once. Streams are only retried before their first byte.
+    """
+    def __init__(self, key_manager, model: str = OPENAI_MODEL, base_url: str = OPENAI_BASE_URL,
+                 timeout: float = OPENAI_TIMEOUT, connect_timeout: float = 5.0, max_connections: int = 20,
+                 retries: int = 3, backoff: float = 0.5, max_backoff: float = 8.0):
+        self.key_manager = key_manager
+        self.model = model
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._http: Optional["aiohttp.ClientSession"] = None
+        self._lock = threading.Lock()
+        self.stats: Dict[str, float] = {"requests": 0, "retries": 0, "errors": 0, "connections_opened": 0,
+                                        "connections_reused": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    # ---- private loop / pool ----
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                if not AIOHTTP_AVAILABLE:
+                    raise OpenAIError("aiohttp not installed")
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="openai-client", daemon=True).start()
+            return self._loop
+
+    async def _session(self) -> "aiohttp.ClientSession":
+        if self._http is None:
+            trace = aiohttp.TraceConfig()
+
+            async def opened(session, ctx, params):
+                self.stats["connections_opened"] += 1
+
+            async def reused(session, ctx, params):
+                self.stats["connections_reused"] += 1
+            trace.on_connection_create_end.append(opened)
+            trace.on_connection_reuseconn.append(reused)
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=None, connect=self.connect_timeout, sock_read=self.timeout),
+                trace_configs=[trace])
+        return self._http
+
+    def _submit(self, coro) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def _delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Full-jitter exponential backoff, or the server's Retry-After (capped)."""
+        if retry_after is not None:
+            return min(retry_after, 4 * self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def _open(self, payload: Dict[str, Any], total: Optional[float]):
+        """
+        POST payload, retrying transient failures. Returns a 200 response and
+        its key lease; the caller releases both.
+        """
+        session = await self._session()
+        tokens = _estimate_tokens(payload)
+        for attempt in range(self.retries + 1):
+            if not self.key_manager.healthy():
+                self.stats["errors"] += 1
+                raise OpenAIError("every API key was rejected (401/403)", 401)
+            try:
+                lease = await self.key_manager.acquire(tokens, timeout=self.timeout)
+            except TimeoutError as e:
+                self.stats["errors"] += 1
+                raise OpenAIError(str(e))
+            self.stats["requests"] += 1
+            try:
+                resp = await session.post(self.url, json=payload, headers={"Authorization": f"Bearer {lease.key}"},
+                                          timeout=aiohttp.ClientTimeout(total=total, connect=self.connect_timeout,
+                                                                        sock_read=self.timeout))
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                lease.release(-1)
+                err = OpenAIError(f"connection failed: {e!r}")
+            except BaseException:
+                lease.release(-1)
+                raise
+            else:
+                if resp.status == 200:
+                    return resp, lease
+                lease.release(resp.status, resp.headers)
+                body = await resp.text()
+                resp.release()
+                err = OpenAIError(f"HTTP {resp.status}: {body[:200]}", resp.status, _retry_after(resp.headers))
+                rejected = resp.status in (401, 403) and not self.key_manager.healthy()
+                if resp.status not in RETRY_STATUS or rejected:
+                    self.stats["errors"] += 1
+                    raise err
+            if attempt == self.retries:
+                self.stats["errors"] += 1
+                raise err
+            self.stats["retries"] += 1
+            delay = 0.0 if err.status in (401, 403, 429) else self._delay(attempt, err.retry_after)
+            logger.info("OpenAI request failed (%s), retry %d in %.2fs", err, attempt + 1, delay)
+            await asyncio.sleep(delay)
+
+    async def _chat(self, prompt: Messages, max_tokens: int, **params) -> str:
+        payload = dict(params, model=params.get("model", self.model), messages=_messages(prompt), max_tokens=max_tokens)
+        resp, lease = await self._open(payload, total=self.timeout)
+        try:
+            data = await resp.json()
+        except BaseException:
+            lease.release(-1)
+            raise
+        finally:
+            resp.release()
+        usage = data.get("usage") or {}
+        lease.release(resp.status, resp.headers, usage.get("total_tokens"))
+        self.stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        self.stats["completion_tokens"] += usage.get("completion_tokens", 0)
+        return data["choices"][0]["message"]["content"] or ""
+
+    async def _stream(self, prompt: Messages, max_tokens: int, **params) -> AsyncIterator[str]:
+        payload = dict(params, model=params.get("model", self.model), messages=_messages(prompt),
+                       max_tokens=max_tokens, stream=True)
+        resp, lease = await self._open(payload, total=None)
+        status = -1
+        try:
+            async for line in resp.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    status = resp.status
+                    break
+                choices = json.loads(data).get("choices") or []
+                piece = choices[0].get("delta", {}).get("content") if choices else None
+                if piece:
+                    yield piece
+        finally:
+            resp.release()
+            lease.release(status, resp.headers)
+
+    # ---- async API (any event loop) ----
+    async def chat(self, prompt: Messages, max_tokens: int = 500, **params) -> str:
+        """Completion text; cancelling the awaiting task cancels the request."""
+        return await asyncio.wrap_future(self._submit(self._chat(prompt, max_tokens, **params)))
+
+    async def stream(self, prompt: Messages, max_tokens: int = 500, **params) -> AsyncIterator[str]:
+        """Content deltas as they arrive; closing the iterator early cancels the request."""
+        loop = asyncio.get_running_loop()
+        q: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for piece in self._stream(prompt, max_tokens, **params):
+                    loop.call_soon_threadsafe(q.put_nowait, piece)
+            except BaseException as e:
+                loop.call_soon_threadsafe(q.put_nowait, e)
+                raise
+            finally:
+                loop.call_soon_threadsafe(q.put_nowait, done)
+
+        fut = self._submit(pump())
+        try:
+            while True:
+                item = await q.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            fut.cancel()
+
+    # ---- sync API (threads) ----
+    def chat_sync(self, prompt: Messages, max_tokens: int = 500, timeout: Optional[float] = None,
+                  cancel: Optional[threading.Event] = None, **params) -> str:
+        """Blocking chat(); setting cancel abandons the request."""
+        fut = self._submit(self._chat(prompt, max_tokens, **params))
+        end = time.monotonic() + timeout if timeout else None
+        while True:
+            try:
+                return fut.result(timeout=0.05)
+            except FutureTimeout:
+                if (cancel is not None and cancel.is_set()) or (end and time.monotonic() > end):
+                    fut.cancel()
+                    raise OpenAIError("cancelled" if cancel is not None and cancel.is_set() else "timed out")
+
+    def stream_sync(self, prompt: Messages, max_tokens: int = 500, cancel: Optional[threading.Event] = None,
+                    **params) -> Iterator[str]:
+        """Blocking stream(); setting cancel or closing the iterator stops the request."""
+        q: "queue.Queue" = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for piece in self._stream(prompt, max_tokens, **params):
+                    q.put(piece)
+            except Exception as e:
+                q.put(e)
+            finally:
+                q.put(done)
+
+        fut = self._submit(pump())
+        try:
+            while True:
+                try:
+                    item = q.get(timeout=0.05)
+                except queue.Empty:
+                    if cancel is not None and cancel.is_set():
+                        return
+                    continue
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            fut.cancel()
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        if self._http is not None:
+            try:
+                self._submit(self._http.close()).result(timeout=5)
+            except Exception as e:
+                logger.warning("OpenAI client close failed: %s", e)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+        self._http = None
+
+
+_CLIENT: Optional[OpenAIClient] = None
+
+def get_openai_client(key_manager) -> Optional[OpenAIClient]:
+    """Shared client (one connection pool per process); None without aiohttp."""
+    global _CLIENT
+    if not AIOHTTP_AVAILABLE:
+        return None
+    if _CLIENT is None:
+        _CLIENT = OpenAIClient(key_manager)
+    return _CLIENT
@@ -0,0 +1,89 @@
+# prefix_cache.py
+import copy, threading, logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def cache_bytes(cache) -> int:
+    """Memory held by a transformers KV cache (DynamicCache or legacy tuples)."""
+    layers = cache.to_legacy_cache() if hasattr(cache, "to_legacy_cache") else cache
+    return sum(t.numel() * t.element_size() for layer in layers for t in layer[:2])
+
+
+class PrefixCache:
+    """
+    LRU of past key/values keyed by the token ids they were computed for,
+    bounded by bytes. lookup() finds the cached sequence sharing the longest
+    prefix with a new prompt and returns a private copy cropped to that
+    prefix, so only the remaining tokens need a forward pass.
+    """
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, min_reuse: int = 16):
+        self.max_bytes = max_bytes
+        self.min_reuse = min_reuse
+        self._entries: "OrderedDict[int, Tuple[np.ndarray, Any, int]]" = OrderedDict()   # key -> (ids, cache, bytes)
+        self._next = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, float] = {"hits": 0, "misses": 0, "prompt_tokens": 0, "reused_tokens": 0,
+                                        "prefill_tokens": 0, "prefill_seconds": 0.0}
+
+    def lookup(self, ids: List[int]) -> Tuple[Optional[Any], int]:
+        """(copy of the best cache cropped to the shared prefix, prefix length) or (None, 0)."""
+        q = np.asarray(ids, dtype=np.int64)
+        limit = len(q) - 1                      # the last prompt token must still be fed to generate
+        best, best_len = None, 0
+        with self._lock:
+            for key, (k, cache, _) in self._entries.items():
+                m = min(len(k), limit)
+                diff = np.nonzero(k[:m] != q[:m])[0]
+                n = int(diff[0]) if len(diff) else m
+                if n > best_len:
+                    best, best_len = key, n
+            self.stats["prompt_tokens"] += len(q)
+            if best is None or best_len < self.min_reuse:
+                self.stats["misses"] += 1
+                return None, 0
+            self._entries.move_to_end(best)
+            cache = copy.deepcopy(self._entries[best][1])
+            self.stats["hits"] += 1
+            self.stats["reused_tokens"] += best_len
+        cache.crop(best_len)
+        return cache, best_len
+
+    def store(self, ids: List[int], cache) -> None:
+        """Keep cache (covering exactly ids) for later prompts; drops entries it extends."""
+        k = np.asarray(ids, dtype=np.int64)
+        size = cache_bytes(cache)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            for key, (other, _, other_size) in list(self._entries.items()):
+                if len(other) <= len(k) and np.array_equal(other, k[:len(other)]):
+                    del self._entries[key]
+                    self._bytes -= other_size
+            self._entries[self._next] = (k, cache, size)
+            self._next += 1
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, _, old) = self._entries.popitem(last=False)
+                self._bytes -= old
+
+    def record_prefill(self, tokens: int, seconds: float) -> None:
+        with self._lock:
+            self.stats["prefill_tokens"] += tokens
+            self.stats["prefill_seconds"] += seconds
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def reuse_ratio(self) -> float:
+        """Fraction of prompt tokens served from cache."""
+        return self.stats["reused_tokens"] / self.stats["prompt_tokens"] if self.stats["prompt_tokens"] else 0.0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
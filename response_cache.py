@@ -0,0 +1,199 @@
+# response_cache.py
+import os, re, json, time, threading, logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(text: str) -> str:
+    """Case, whitespace and trailing-punctuation insensitive form for exact hits."""
+    return re.sub(r"[\s?!.।,]+$", "", " ".join(text.lower().split()))
+
+
+class ResponseCache:
+    """
+    Answers keyed by question: an exact hit on the normalized query first,
+    then the nearest cached question by embedding cosine above threshold.
+
+    Entries expire after ttl seconds and the least recently used are evicted
+    beyond max_items. Each entry remembers the memory ids its answer was
+    built from; on_memory_change() drops entries whose memories were deleted,
+    and entries whose question is close to newly added knowledge.
+    """
+    def __init__(self, embed_fn: Optional[Callable] = None, max_items: int = 1000, ttl: float = 24 * 3600,
+                 threshold: float = 0.92, invalidate_threshold: float = 0.6, path: Optional[str] = None):
+        self.embed_fn = embed_fn
+        self.max_items = max_items
+        self.ttl = ttl
+        self.threshold = threshold
+        self.invalidate_threshold = invalidate_threshold
+        self.path = path
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None       # rows follow _keys; rebuilt lazily
+        self._keys: List[str] = []
+        self._pending: List[str] = []                  # loaded entries still without a vector
+        self._lock = threading.RLock()
+        self.stats: Dict[str, int] = {"exact_hits": 0, "semantic_hits": 0, "misses": 0,
+                                      "invalidated": 0, "evicted": 0, "expired": 0}
+        if path and os.path.exists(path):
+            self.load()
+
+    # ---- embeddings ----
+    def _embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        if self.embed_fn is None or not texts:
+            return None
+        try:
+            vecs = self.embed_fn(texts)
+        except Exception as e:
+            logger.warning("Response cache embedding failed: %s", e)
+            return None
+        if vecs is None:
+            return None
+        v = np.asarray(vecs, dtype=np.float32).reshape(len(texts), -1)
+        norms = np.linalg.norm(v, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return v / norms
+
+    def _embed_pending(self) -> None:
+        if not self._pending:
+            return
+        keys, self._pending = self._pending, []
+        with self._lock:
+            keys = [k for k in keys if k in self._entries]
+            queries = [self._entries[k]["query"] for k in keys]
+        vecs = self._embed(queries)
+        if vecs is None:
+            return
+        with self._lock:
+            for k, v in zip(keys, vecs):
+                if k in self._entries:
+                    self._entries[k]["vec"] = v
+            self._matrix = None
+
+    def _rows(self) -> Optional[np.ndarray]:
+        if self._matrix is None:
+            self._keys = [k for k, e in self._entries.items() if e.get("vec") is not None]
+            self._matrix = np.stack([self._entries[k]["vec"] for k in self._keys]) if self._keys else None
+        return self._matrix
+
+    def _drop(self, key: str, reason: str) -> None:
+        if self._entries.pop(key, None) is not None:
+            self._matrix = None
+            self.stats[reason] += 1
+
+    def _expire(self, now: float) -> None:
+        for key in [k for k, e in self._entries.items() if now - e["ts"] > self.ttl]:
+            self._drop(key, "expired")
+
+    # ---- lookups ----
+    def get(self, query: str, vec: Optional[np.ndarray] = None) -> Optional[str]:
+        """Cached answer for query (exact, then semantic), or None."""
+        key = normalize_query(query)
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry["answer"]
+        self._embed_pending()
+        with self._lock:
+            if self._rows() is None:
+                self.stats["misses"] += 1
+                return None
+        vec = vec if vec is not None else self._embed([query])
+        with self._lock:
+            rows = self._rows()
+            if vec is not None and rows is not None and rows.shape[1] == vec.shape[-1]:
+                sims = rows @ vec.reshape(-1)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    hit = self._keys[best]
+                    self._entries.move_to_end(hit)
+                    self.stats["semantic_hits"] += 1
+                    return self._entries[hit]["answer"]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, query: str, answer: str, deps: Iterable[int] = ()) -> None:
+        """Cache answer for query; deps are the memory ids it was built from."""
+        key = normalize_query(query)
+        vec = self._embed([query])
+        with self._lock:
+            self._entries[key] = {"query": query, "answer": answer, "ts": time.time(), "deps": set(deps),
+                                  "vec": vec[0] if vec is not None else None}
+            self._entries.move_to_end(key)
+            self._matrix = None
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    # ---- invalidation ----
+    def on_memory_change(self, op: str, ids: List[int], recs: List[Dict[str, Any]]) -> None:
+        """MemoryManager listener: clear / delete / add."""
+        self._embed_pending()
+        with self._lock:
+            if op == "clear":
+                for key in list(self._entries):
+                    self._drop(key, "invalidated")
+                return
+            if op == "delete":
+                gone: Set[int] = set(ids)
+                for key in [k for k, e in self._entries.items() if e["deps"] & gone]:
+                    self._drop(key, "invalidated")
+                return
+        if op != "add":
+            return
+        # our own Q/A turns are stored as conversation memories; they must not evict themselves
+        texts = [r["text"] for r in recs if (r.get("meta") or {}).get("source") != "conversation"]
+        if not texts:
+            return
+        vecs = self._embed(texts)
+        with self._lock:
+            rows = self._rows()
+            if vecs is not None and rows is not None and rows.shape[1] == vecs.shape[1]:
+                hit = (rows @ vecs.T).max(axis=1) >= self.invalidate_threshold
+                stale = [self._keys[i] for i in np.nonzero(hit)[0]]
+            else:
+                words = [set(re.findall(r"\w+", t.lower())) for t in texts]
+                stale = [k for k in self._entries
+                         if any(len(set(k.split()) & w) >= max(1, len(k.split()) // 2) for w in words)]
+            for key in stale:
+                self._drop(key, "invalidated")
+
+    # ---- persistence / metrics ----
+    def hit_rate(self) -> float:
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            data = [{"query": e["query"], "answer": e["answer"], "ts": e["ts"], "deps": sorted(e["deps"])}
+                    for e in self._entries.values()]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def load(self) -> None:
+        """Load saved answers; question vectors are recomputed on first use (the embedding cache makes this cheap)."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning("Response cache load failed: %s", e)
+            return
+        now = time.time()
+        data = [d for d in data if now - d["ts"] <= self.ttl][-self.max_items:]
+        with self._lock:
+            for d in data:
+                key = normalize_query(d["query"])
+                self._entries[key] = {"query": d["query"], "answer": d["answer"], "ts": d["ts"],
+                                      "deps": set(d["deps"]), "vec": None}
+                self._pending.append(key)
+            self._matrix = None
@@ -0,0 +1,98 @@
+# startup.py
+import os, time, threading, logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Any, List, Tuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# "background": load heavy resources on worker threads right away
+# "lazy":       load each resource on first use
+# "eager":      load synchronously at definition time (old behaviour)
+STARTUP_MODE = os.getenv("JARVIS_STARTUP", "background")
+
+_T0 = time.perf_counter()
+_TIMINGS: List[Tuple[str, float, float, str]] = []   # name, start offset, seconds, thread
+_TIMINGS_LOCK = threading.Lock()
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="jarvis-load")
+
+@contextmanager
+def timed(name: str):
+    """Record how long the wrapped block takes for the startup report."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        with _TIMINGS_LOCK:
+            _TIMINGS.append((name, start - _T0, end - start, threading.current_thread().name))
+
+
+class LazyResource:
+    """
+    A heavy object behind a readiness future.
+    Attribute access is forwarded to the loaded object, blocking only if it
+    is not ready yet, so callers can use it like the object itself.
+    If loading failed, get() returns None and attribute access raises
+    RuntimeError chained to the loader's exception.
+    """
+    def __init__(self, name: str, loader: Callable[[], Any], mode: Optional[str] = None):
+        self._name = name
+        self._loader = loader
+        self._future: Optional[Future] = None
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        mode = mode or STARTUP_MODE
+        if mode == "background":
+            self.start()
+        elif mode == "eager":
+            self.start(background=False)
+
+    def _load(self):
+        with timed(self._name):
+            try:
+                return self._loader()
+            except Exception as e:
+                logger.warning("%s failed to load: %s", self._name, e)
+                self._error = e
+                return None
+
+    def start(self, background: bool = True) -> "LazyResource":
+        """Begin loading (no-op if already started)."""
+        with self._lock:
+            if self._future is None:
+                if background:
+                    self._future = _EXECUTOR.submit(self._load)
+                else:
+                    self._future = Future()
+                    self._future.set_result(self._load())
+        return self
+
+    def ready(self) -> bool:
+        return self._future is not None and self._future.done()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """The loaded object (None if loading failed); loads inline if never started."""
+        if self._future is None:
+            self.start(background=False)
+        return self._future.result(timeout)
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        obj = self.get()
+        if obj is None:
+            reason = f": {self._error}" if self._error is not None else ""
+            raise RuntimeError(f"{self._name} is unavailable{reason}") from self._error
+        return getattr(obj, attr)
+
+
+def report() -> str:
+    """Per-component import/init timings, in start order."""
+    with _TIMINGS_LOCK:
+        rows = sorted(_TIMINGS, key=lambda r: r[1])
+    lines = [f"{'component':<28}{'start(s)':>10}{'took(s)':>10}  thread"]
+    for name, start, took, thread in rows:
+        lines.append(f"{name:<28}{start:>10.3f}{took:>10.3f}  {thread}")
+    lines.append(f"{'total since import':<28}{'':>10}{time.perf_counter() - _T0:>10.3f}")
+    return "\n".join(lines)
@@ -0,0 +1,95 @@
+# streaming.py
+import re, time, asyncio, threading, logging
+from typing import Callable, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# sentence end: ., !, ?, Devanagari danda or newline, followed by whitespace
+_SENTENCE_END = re.compile(r'(?<=[.!?।])["\'\)\]]*\s+|\n+')
+
+def sentences(tokens: Iterable[str], min_chars: int = 20, max_chars: int = 300) -> Iterator[str]:
+    """
+    Regroup a token stream into speakable sentences as soon as each one ends.
+    Fragments shorter than min_chars are held back and joined to the next
+    sentence ("Dr.", "1."); runs longer than max_chars are cut at a comma or
+    space so TTS never waits on a very long sentence.
+    """
+    buf = ""
+    for tok in tokens:
+        buf += tok
+        while True:
+            cut = None
+            for m in _SENTENCE_END.finditer(buf):
+                if m.start() >= min_chars:
+                    cut = m
+                    break
+            if cut is not None:
+                out, buf = buf[:cut.start()].strip(), buf[cut.end():]
+            elif len(buf) > max_chars:
+                pos = max(buf.rfind(", ", 0, max_chars), buf.rfind(" ", 0, max_chars))
+                pos = pos if pos > min_chars else max_chars
+                out, buf = buf[:pos + 1].strip(), buf[pos + 1:]
+            else:
+                break
+            if out:
+                yield out
+    if buf.strip():
+        yield buf.strip()
+
+
+async def apipelined(items: Iterable[str], consume: Callable[[str], None], maxsize: int = 8) -> str:
+    """
+    Produce items on a background thread while consume() handles them on the
+    event loop's (main) thread, since TTS engines are bound to the thread that
+    created them. Generation keeps running while earlier sentences are spoken,
+    and other tasks run while the answer is awaited. Returns the items joined
+    with spaces; producer errors are re-raised after draining.
+    """
+    loop = asyncio.get_running_loop()
+    q: "asyncio.Queue" = asyncio.Queue(maxsize)
+    done = object()
+    error = []
+
+    def produce():
+        try:
+            for item in items:
+                asyncio.run_coroutine_threadsafe(q.put(item), loop).result()
+        except Exception as e:
+            error.append(e)
+        finally:
+            asyncio.run_coroutine_threadsafe(q.put(done), loop).result()
+
+    threading.Thread(target=produce, name="stream-producer", daemon=True).start()
+    parts = []
+    start = time.perf_counter()
+    while True:
+        item = await q.get()
+        if item is done:
+            break
+        if not parts:
+            logger.debug("first sentence ready after %.2fs", time.perf_counter() - start)
+        parts.append(item)
+        consume(item)
+    if error:
+        raise error[0]
+    return " ".join(parts)
+
+
+def first_nonempty(*streams: Callable[[], Iterable[str]]) -> Iterator[str]:
+    """
+    Yield from the first stream factory that produces any text; a stream that
+    fails before its first token falls through to the next one.
+    """
+    for make in streams:
+        started = False
+        try:
+            for tok in make():
+                if tok:
+                    started = True
+                    yield tok
+        except Exception as e:
+            if started:
+                raise
+            logger.warning("stream failed, trying next: %s", e)
+        if started:
+            return
@@ -0,0 +1,39 @@
+# tests/conftest.py
+import os, sys, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        srv = self.server
+        srv.requests.append((self.path, dict(self.headers)))
+        route = srv.routes.get(self.path.split("?")[0])
+        if route is None:
+            self.send_error(404)
+            return
+        status, headers, body = route(self) if callable(route) else route
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """Local HTTP server; set server.routes[path] = (status, headers, body) or fn(handler) -> that tuple."""
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    srv.routes, srv.requests = {}, []
+    srv.url = f"http://127.0.0.1:{srv.server_address[1]}"
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
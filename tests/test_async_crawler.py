@@ -0,0 +1,143 @@
+# tests/test_async_crawler.py
+import asyncio, threading, time
+
+import pytest
+
+from async_crawler import AsyncCrawler, HostLimiter, normalize_url
+from http_cache import HTTPCache
+
+HTML = {"Content-Type": "text/html; charset=utf-8"}
+
+
+def _page(*links, text="Some page text."):
+    body = "".join(f'<a href="{l}">l</a>' for l in links)
+    return 200, HTML, f"<html><body><p>{text}</p>{body}</body></html>".encode()
+
+
+def _crawl(crawler):
+    async def run():
+        return [p async for p in crawler.crawl()]
+    return asyncio.run(run())
+
+
+def test_normalize_url():
+    assert normalize_url("HTTP://Example.com:80//a//b?z=1&a=2#frag") == "http://example.com/a/b?a=2&z=1"
+    assert normalize_url("/x", "https://example.com/dir/") == "https://example.com/x"
+    assert normalize_url("mailto:someone@example.com") is None
+
+
+def test_follows_links_once_within_depth(http_server):
+    http_server.routes["/"] = _page("/a", "/a#top", "/b", "http://elsewhere.invalid/")
+    http_server.routes["/a"] = _page("/", "/c")
+    http_server.routes["/b"] = _page()
+    http_server.routes["/c"] = _page()
+    pages = _crawl(AsyncCrawler([http_server.url + "/"], max_depth=1, delay=0, respect_robots=False))
+    paths = sorted(p.url[len(http_server.url):] for p in pages)
+    assert paths == ["/", "/a", "/b"]
+    assert [path for path, _ in http_server.requests].count("/a") == 1
+
+
+def test_robots_disallow_and_crawl_delay(http_server):
+    http_server.routes["/robots.txt"] = (200, {"Content-Type": "text/plain"},
+                                         b"User-agent: *\nDisallow: /private\nCrawl-delay: 1\n")
+    http_server.routes["/"] = _page("/private/x", "/a")
+    http_server.routes["/a"] = _page()
+    http_server.routes["/private/x"] = _page()
+    crawler = AsyncCrawler([http_server.url + "/"], delay=0)
+    pages = _crawl(crawler)
+    assert sorted(p.url[len(http_server.url):] for p in pages) == ["/", "/a"]
+    assert crawler.stats["robots_blocked"] == 1
+    assert "/private/x" not in [path for path, _ in http_server.requests]
+    assert [path for path, _ in http_server.requests].count("/robots.txt") == 1
+    assert crawler.limiter._delays[crawler.start_urls[0].split("/")[2]] == 1
+
+
+def test_per_host_concurrency_and_delay(http_server):
+    lock, state = threading.Lock(), {"now": 0, "max": 0, "starts": []}
+
+    def slow(handler):
+        with lock:
+            state["now"] += 1
+            state["max"] = max(state["max"], state["now"])
+            state["starts"].append(time.monotonic())
+        time.sleep(0.1)
+        with lock:
+            state["now"] -= 1
+        return _page()
+
+    http_server.routes["/"] = _page(*[f"/p{i}" for i in range(6)])
+    for i in range(6):
+        http_server.routes[f"/p{i}"] = slow
+    _crawl(AsyncCrawler([http_server.url + "/"], per_host=2, delay=0.05, respect_robots=False))
+    assert state["max"] <= 2
+    starts = sorted(state["starts"])
+    assert all(b - a >= 0.04 for a, b in zip(starts, starts[1:]))
+
+
+def test_host_limiter_spaces_request_starts():
+    async def run():
+        limiter, starts = HostLimiter(per_host=4, delay=0.05), []
+        for _ in range(4):
+            sem = await limiter.acquire("h")
+            starts.append(time.monotonic())
+            sem.release()
+        return starts
+    starts = asyncio.run(run())
+    assert all(b - a >= 0.045 for a, b in zip(starts, starts[1:]))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = HTTPCache(str(tmp_path / "http.sqlite"))
+    yield c
+    c.close()
+
+
+def test_large_page_is_cached_whole(http_server, cache):
+    body = b"<html><body>" + b"<p>paragraph of text</p>" * 20000 + b"</body></html>"
+    http_server.routes["/big"] = (200, dict(HTML, **{"Cache-Control": "max-age=600"}), body)
+    crawler = AsyncCrawler([http_server.url + "/big"], respect_robots=False, delay=0, cache=cache)
+    first = _crawl(crawler)
+    assert cache.lookup(crawler.start_urls[0]).body == body
+    again = AsyncCrawler([http_server.url + "/big"], respect_robots=False, delay=0, cache=cache)
+    second = _crawl(again)
+    assert again.stats["cached"] == 1 and second[0].text == first[0].text
+
+
+def test_page_over_max_bytes_is_not_cached(http_server, cache):
+    body = b"<html><body>" + b"<p>paragraph of text</p>" * 2000 + b"</body></html>"
+    http_server.routes["/big"] = (200, dict(HTML, **{"Cache-Control": "max-age=600"}), body)
+    crawler = AsyncCrawler([http_server.url + "/big"], respect_robots=False, delay=0, cache=cache,
+                           max_bytes=1000)
+    pages = _crawl(crawler)
+    assert pages and pages[0].text
+    assert cache.lookup(crawler.start_urls[0]) is None
+
+
+def test_offline_cache_serves_without_network(http_server, cache):
+    http_server.routes["/"] = _page(text="Cached text.")
+    _crawl(AsyncCrawler([http_server.url + "/"], respect_robots=False, delay=0, cache=cache))
+    n = len(http_server.requests)
+    cache.offline = True
+    crawler = AsyncCrawler([http_server.url + "/", http_server.url + "/missing"], respect_robots=False,
+                           delay=0, cache=cache)
+    pages = _crawl(crawler)
+    assert [p.text for p in pages] == ["Cached text."]
+    assert crawler.stats["skipped"] == 1 and len(http_server.requests) == n
+
+
+def test_recrawl_keeps_header_charset(http_server, cache):
+    body = "<html><body><p>café naïve</p></body></html>".encode("utf-8")
+    headers = {"Content-Type": "text/html; charset=utf-8", "ETag": '"v1"', "Cache-Control": "max-age=0"}
+
+    def page(handler):
+        if handler.headers.get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"'}, b""
+        return 200, headers, body
+    http_server.routes["/"] = page
+    texts = []
+    for offline in (False, False, True):           # fetch, 304 revalidation, cached copy
+        cache.offline = offline
+        pages = _crawl(AsyncCrawler([http_server.url + "/"], respect_robots=False, delay=0, cache=cache))
+        texts.append(pages[0].text)
+    assert texts == ["café naïve"] * 3
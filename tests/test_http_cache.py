@@ -0,0 +1,88 @@
+# tests/test_http_cache.py
+import pytest
+import requests
+
+from html_extract import extract_stream
+from http_cache import HTTPCache
+
+PAGE = b"<html><body><p>Hello cached world.</p></body></html>"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = HTTPCache(str(tmp_path / "http.sqlite"), max_body=1024)
+    yield c
+    c.close()
+
+
+def _etag_route(handler):
+    if handler.headers.get("If-None-Match") == '"v1"':
+        return 304, {"ETag": '"v1"', "Cache-Control": "max-age=0"}, b""
+    return 200, {"Content-Type": "text/html", "ETag": '"v1"', "Cache-Control": "max-age=0"}, PAGE
+
+
+def test_stale_entry_is_revalidated_with_304(cache, http_server):
+    http_server.routes["/page"] = _etag_route
+    url = http_server.url + "/page"
+    first = cache.get(url)
+    assert first.content == PAGE and not first.from_cache
+    second = cache.get(url)
+    assert second.revalidated and second.content == PAGE
+    assert http_server.requests[-1][1].get("If-None-Match") == '"v1"'
+    assert cache.stats["fetched"] == 1 and cache.stats["revalidated"] == 1
+
+
+def test_fresh_entry_skips_network(cache, http_server):
+    http_server.routes["/fresh"] = (200, {"Content-Type": "text/html", "Cache-Control": "max-age=600"}, PAGE)
+    url = http_server.url + "/fresh"
+    cache.get(url)
+    r = cache.get(url)
+    assert r.from_cache and not r.stale and len(http_server.requests) == 1
+
+
+def test_offline_serves_stale_and_refuses_uncached(cache, http_server):
+    http_server.routes["/page"] = _etag_route
+    url = http_server.url + "/page"
+    cache.get(url)
+    cache.offline = True
+    r = cache.get(url)
+    assert r.from_cache and r.stale and r.content == PAGE
+    with pytest.raises(requests.ConnectionError):
+        cache.get(http_server.url + "/other")
+    assert len(http_server.requests) == 1
+
+
+def test_network_error_serves_stale(cache, http_server):
+    http_server.routes["/page"] = _etag_route
+    url = http_server.url + "/page"
+    cache.get(url)
+    http_server.shutdown()
+    http_server.server_close()
+    r = cache.get(url, timeout=1)
+    assert r.stale and r.content == PAGE
+
+
+def test_streamed_body_feeds_extractor_and_cache(cache, http_server):
+    http_server.routes["/page"] = (200, {"Content-Type": "text/html", "Cache-Control": "max-age=600"}, PAGE)
+    url = http_server.url + "/page"
+    with cache.get(url, stream=True) as r:
+        text, _ = extract_stream(r.iter_content(8))
+    assert text == "Hello cached world."
+    assert cache.lookup(url).body == PAGE
+
+
+def test_partially_read_body_is_not_cached(cache, http_server):
+    big = b"<html><body>" + b"<p>word</p>" * 80 + b"</body></html>"
+    http_server.routes["/big"] = (200, {"Content-Type": "text/html", "Cache-Control": "max-age=600"}, big)
+    url = http_server.url + "/big"
+    with cache.get(url, stream=True) as r:
+        extract_stream(r.iter_content(64), max_bytes=200)
+    assert cache.lookup(url) is None
+
+
+def test_oversized_body_is_returned_but_not_cached(cache, http_server):
+    big = b"x" * 4096
+    http_server.routes["/big"] = (200, {"Content-Type": "text/plain", "Cache-Control": "max-age=600"}, big)
+    url = http_server.url + "/big"
+    assert cache.get(url).content == big
+    assert cache.lookup(url) is None
@@ -0,0 +1,128 @@
+# tests/test_llm_router.py
+import threading, time
+
+import pytest
+
+from llm_router import LLMRouter, Provider, RouterError
+
+
+def sleeper(delay, text="answer", log=None):
+    """generate() that answers after delay unless cancelled first."""
+    def generate(prompt, cancel):
+        if log is not None:
+            log.append(time.monotonic())
+        if cancel.wait(delay):
+            raise RuntimeError("cancelled")
+        return text
+    return generate
+
+
+def failing(prompt, cancel):
+    raise RuntimeError("down")
+
+
+def test_fast_primary_is_not_hedged():
+    slow_calls = []
+    router = LLMRouter([Provider("a", sleeper(0.01, "A")), Provider("b", sleeper(0.01, "B", slow_calls))],
+                       hedge_after=0.5)
+    assert router.generate("q") == "A"
+    assert router.stats["hedged"] == 0 and not slow_calls
+
+
+def test_hedge_wins_and_loser_is_cancelled():
+    cancelled = threading.Event()
+
+    def slow(prompt, cancel):
+        if cancel.wait(5):
+            cancelled.set()
+            raise RuntimeError("cancelled")
+        return "slow"
+    a, b = Provider("a", slow), Provider("b", sleeper(0.02, "fast"))
+    router = LLMRouter([a, b], hedge_after=0.1)
+    start = time.monotonic()
+    assert router.generate("q") == "fast"
+    assert time.monotonic() - start < 1
+    assert cancelled.wait(1)
+    assert router.stats["hedged"] == 1 and a.stats["lost"] == 1 and b.stats["wins"] == 1
+
+
+def test_losing_provider_still_gets_a_hedge_delay():
+    a, b = Provider("a", sleeper(5)), Provider("b", sleeper(0.01))
+    router = LLMRouter([a, b], hedge_after=0.05, min_samples=3)
+    for _ in range(3):
+        router.generate("q")
+    assert a.stats["wins"] == 0 and a.latency["generate"].count() == 3
+    assert router.hedge_delay(a, "generate") >= 0.05 and router.hedge_delay(a, "generate") != router.hedge_after
+
+
+def test_failure_starts_next_provider_at_once():
+    router = LLMRouter([Provider("a", failing), Provider("b", sleeper(0.01, "B"))], hedge_after=5)
+    start = time.monotonic()
+    assert router.generate("q") == "B"
+    assert time.monotonic() - start < 1
+
+
+def test_all_failing_raises():
+    router = LLMRouter([Provider("a", failing), Provider("b", failing)])
+    with pytest.raises(RouterError, match="a: down; b: down"):
+        router.generate("q")
+    assert router.stats["failed"] == 1
+
+
+def test_deadline():
+    router = LLMRouter([Provider("a", sleeper(5))], hedge_after=5)
+    with pytest.raises(RouterError, match="no answer within"):
+        router.generate("q", deadline=0.1)
+    assert router.stats["timeouts"] == 1
+
+
+def test_circuit_breaker_opens_and_recovers():
+    healthy = {"ok": False}
+
+    def flaky(prompt, cancel):
+        if not healthy["ok"]:
+            raise RuntimeError("down")
+        return "A"
+    a = Provider("a", flaky, failure_threshold=2, reset_after=0.1)
+    router = LLMRouter([a, Provider("b", sleeper(0.0, "B"))])
+    for _ in range(2):
+        assert router.generate("q") == "B"
+    assert a.state == "open"
+    calls = a.stats["calls"]
+    assert router.generate("q") == "B" and a.stats["calls"] == calls and a.stats["skipped"] == 1
+    time.sleep(0.15)
+    assert a.state == "half-open"
+    healthy["ok"] = True
+    assert router.generate("q") == "A" and a.state == "closed"
+
+
+def test_failed_half_open_trial_reopens():
+    a = Provider("a", failing, failure_threshold=1, reset_after=0.05)
+    router = LLMRouter([a, Provider("b", sleeper(0.0, "B"))])
+    router.generate("q")
+    time.sleep(0.08)
+    router.generate("q")
+    assert a.state == "open"
+
+
+def test_stream_takes_first_to_start():
+    def slow_stream(prompt, cancel):
+        cancel.wait(5)
+        yield "late"
+
+    def fast_stream(prompt, cancel):
+        for piece in ("a", "b", "c"):
+            yield piece
+    router = LLMRouter([Provider("a", stream=slow_stream), Provider("b", stream=fast_stream)], hedge_after=0.05)
+    assert list(router.stream("q")) == ["a", "b", "c"]
+
+
+def test_stream_failure_after_first_piece_raises():
+    def broken(prompt, cancel):
+        yield "partial"
+        raise RuntimeError("dropped")
+    router = LLMRouter([Provider("a", stream=broken), Provider("b", sleeper(0.0, "B"))])
+    it = router.stream("q")
+    assert next(it) == "partial"
+    with pytest.raises(RuntimeError, match="dropped"):
+        list(it)
@@ -0,0 +1,181 @@
+# tests/test_openai_client.py
+import asyncio, json, threading, time
+
+import pytest
+from aiohttp import web
+
+from key_manager import APIKeyManager
+from openai_client import OpenAIClient, OpenAIError
+
+
+class FakeAPI:
+    """Chat completions endpoint; `script` is a list of statuses to return before answering 200."""
+    def __init__(self):
+        self.script = []
+        self.calls = []
+        self.reject = set()            # keys answered with 401
+        self.loop = asyncio.new_event_loop()
+        self.url = None
+
+    async def chat(self, request):
+        key = request.headers["Authorization"].split()[-1]
+        payload = await request.json()
+        self.calls.append((key, payload))
+        if key in self.reject:
+            return web.json_response({"error": "bad key"}, status=401)
+        if self.script:
+            status = self.script.pop(0)
+            return web.json_response({"error": "nope"}, status=status, headers={"retry-after-ms": "10"})
+        if payload.get("stream"):
+            resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await resp.prepare(request)
+            for piece in ("Hel", "lo", "!"):
+                chunk = {"choices": [{"delta": {"content": piece}}]}
+                await resp.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await resp.write(b"data: [DONE]\n\n")
+            return resp
+        return web.json_response({"choices": [{"message": {"content": "Hello!"}}],
+                                  "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}},
+                                 headers={"x-ratelimit-remaining-requests": "99"})
+
+    def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat)
+        runner = web.AppRunner(app)
+        self.loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        self.loop.run_until_complete(site.start())
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1"
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self._runner = runner
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+@pytest.fixture
+def api():
+    srv = FakeAPI()
+    srv.start()
+    yield srv
+    srv.stop()
+
+
+def _client(api, monkeypatch, keys=("k1",), **kwargs):
+    for i in range(1, 16):
+        monkeypatch.delenv(f"OPENAI_KEY_{i}", raising=False)
+    for i, key in enumerate(keys, 1):
+        monkeypatch.setenv(f"OPENAI_KEY_{i}", key)
+    kwargs.setdefault("backoff", 0.01)
+    return OpenAIClient(APIKeyManager(), base_url=api.url, timeout=5, **kwargs)
+
+
+def test_chat_reuses_one_connection(api, monkeypatch):
+    client = _client(api, monkeypatch)
+    try:
+        assert [client.chat_sync("hi") for _ in range(3)] == ["Hello!"] * 3
+        assert client.stats["connections_opened"] == 1 and client.stats["connections_reused"] == 2
+        assert client.stats["completion_tokens"] == 6
+        assert api.calls[0][1]["messages"] == [{"role": "user", "content": "hi"}]
+    finally:
+        client.close()
+
+
+def test_server_errors_are_retried(api, monkeypatch):
+    client = _client(api, monkeypatch)
+    api.script = [500, 503]
+    try:
+        assert client.chat_sync("hi") == "Hello!"
+        assert client.stats["retries"] == 2 and len(api.calls) == 3
+    finally:
+        client.close()
+
+
+def test_retries_are_bounded(api, monkeypatch):
+    client = _client(api, monkeypatch, retries=1)
+    api.script = [502, 502, 502]
+    try:
+        with pytest.raises(OpenAIError) as e:
+            client.chat_sync("hi")
+        assert e.value.status == 502 and len(api.calls) == 2
+    finally:
+        client.close()
+
+
+def test_client_errors_are_not_retried(api, monkeypatch):
+    client = _client(api, monkeypatch)
+    api.script = [400]
+    try:
+        with pytest.raises(OpenAIError) as e:
+            client.chat_sync("hi")
+        assert e.value.status == 400 and len(api.calls) == 1
+    finally:
+        client.close()
+
+
+def test_rate_limited_key_is_skipped(api, monkeypatch):
+    client = _client(api, monkeypatch, keys=("k1", "k2"))
+    api.script = [429]
+    try:
+        assert client.chat_sync("hi") == "Hello!"
+        assert {key for key, _ in api.calls} == {"k1", "k2"}
+    finally:
+        client.close()
+
+
+def test_rejected_key_falls_back_to_another(api, monkeypatch):
+    client = _client(api, monkeypatch, keys=("bad", "good"))
+    api.reject = {"bad"}
+    try:
+        for _ in range(3):
+            assert client.chat_sync("hi") == "Hello!"
+        assert [key for key, _ in api.calls].count("bad") == 1
+    finally:
+        client.close()
+
+
+def test_single_rejected_key_fails_fast(api, monkeypatch):
+    client = _client(api, monkeypatch, keys=("bad",))
+    api.reject = {"bad"}
+    try:
+        start = time.monotonic()
+        with pytest.raises(OpenAIError) as e:
+            client.chat_sync("hi")
+        assert e.value.status == 401
+        with pytest.raises(OpenAIError):
+            client.chat_sync("hi")
+        assert time.monotonic() - start < 1 and len(api.calls) == 1
+    finally:
+        client.close()
+
+
+def test_stream_sync(api, monkeypatch):
+    client = _client(api, monkeypatch)
+    try:
+        assert list(client.stream_sync("hi")) == ["Hel", "lo", "!"]
+        assert api.calls[0][1]["stream"] is True
+    finally:
+        client.close()
+
+
+def test_async_stream_and_chat(api, monkeypatch):
+    client = _client(api, monkeypatch)
+
+    async def run():
+        pieces = [p async for p in client.stream("hi")]
+        return pieces, await client.chat("hi")
+    try:
+        assert asyncio.run(run()) == (["Hel", "lo", "!"], "Hello!")
+    finally:
+        client.close()
+
+
+def test_stream_retried_before_first_byte(api, monkeypatch):
+    client = _client(api, monkeypatch)
+    api.script = [503]
+    try:
+        assert "".join(client.stream_sync("hi")) == "Hello!"
+        assert client.stats["retries"] == 1
+    finally:
+        client.close()
@@ -0,0 +1,60 @@
+# tests/test_transcripts.py
+import io, os
+
+from transcripts import (Segment, chunk_by_time, cite, collapse_rolling, parse_captions, parse_timestamp,
+                         synthetic_autosub_vtt)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _lines(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return list(parse_captions(f))
+
+
+def test_parse_timestamp():
+    assert parse_timestamp("01:02:03.456") == 3723.456
+    assert parse_timestamp("02:03,5") == 123.5
+
+
+def test_rolling_vtt_collapses_to_new_words():
+    segs = _lines("rolling.vtt")
+    assert " ".join(s.text for s in segs) == "so today we talk about caching and more"
+    assert segs[0].start == 0.0
+
+
+def test_srt_keeps_words_and_real_repeats():
+    segs = _lines("speech.srt")
+    assert [s.text for s in segs] == ["So", "Something happened here.", "Yes.", "Yes.", "Yes & no."]
+    assert [s.start for s in segs] == [1.0, 1.8, 5.0, 6.5, 7.0]
+
+
+def test_json3_from_small_chunks():
+    with open(os.path.join(FIXTURES, "captions.json3"), encoding="utf-8") as f:
+        body = f.read()
+    segs = list(parse_captions(body[i:i + 7] for i in range(0, len(body), 7)))
+    assert [(s.start, s.text) for s in segs] == [(0.0, "hello world"), (3.0, "how are you"), (9.0, "hello world")]
+
+
+def test_prefix_must_end_on_a_word():
+    cues = [Segment(0, 1, "So"), Segment(1, 2, "So we go"), Segment(2, 3, "So we gone")]
+    assert [s.text for s in collapse_rolling(cues)] == ["So", "we go", "So we gone"]
+
+
+def test_repeat_after_a_gap_is_kept():
+    cues = [Segment(0, 1, "Yes."), Segment(1.05, 2, "Yes."), Segment(3, 4, "Yes.")]
+    assert [s.text for s in collapse_rolling(cues)] == ["Yes.", "Yes."]
+
+
+def test_synthetic_autosubs_yield_each_word_once():
+    segs = list(parse_captions(io.StringIO("".join(synthetic_autosub_vtt(0.02)))))
+    words = " ".join(s.text for s in segs).split()
+    assert words == [f"word{i}" for i in range(len(words))] and len(words) > 100
+
+
+def test_chunk_by_time_and_cite():
+    segs = [Segment(t, t + 5, f"w{t}") for t in range(0, 150, 10)]
+    chunks = list(chunk_by_time(segs, window=60))
+    assert [(c.start, c.end) for c in chunks] == [(0, 55), (60, 115), (120, 145)]
+    assert cite("https://youtu.be/x", 61.7) == "https://youtu.be/x?t=61s"
+    assert cite("https://youtube.com/watch?v=x", 5) == "https://youtube.com/watch?v=x&t=5s"
@@ -0,0 +1,214 @@
+# transcripts.py
+import re, json, html, time, logging
+from collections import deque
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+_TIMING = re.compile(r"((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})")
+_TAG = re.compile(r"<[^>]*>")
+
+class Segment(NamedTuple):
+    start: float        # seconds
+    end: float
+    text: str
+
+
+def parse_timestamp(ts: str) -> float:
+    """'01:02:03.456', '02:03,456' or '1:02:03.4' -> seconds"""
+    parts = ts.replace(",", ".").split(":")
+    secs = 0.0
+    for p in parts:
+        secs = secs * 60 + float(p)
+    return secs
+
+def format_timestamp(seconds: float) -> str:
+    s = int(seconds)
+    return f"{s // 3600:d}:{s // 60 % 60:02d}:{s % 60:02d}" if s >= 3600 else f"{s // 60:d}:{s % 60:02d}"
+
+def _clean(line: str) -> str:
+    return " ".join(html.unescape(_TAG.sub("", line)).split())
+
+
+# ---- parsers: each yields raw cues, one text line per "\n" ----
+def parse_cues(lines: Iterable[str]) -> Iterator[Segment]:
+    """
+    WebVTT or SRT cues from an iterable of lines (a file object or
+    requests' iter_lines). Headers, NOTE/STYLE/REGION blocks, cue ids and
+    inline timing/style tags are dropped; only the current cue is buffered.
+    """
+    start = end = None
+    text: List[str] = []
+    skipping = False
+    for raw in lines:
+        line = raw.rstrip("\r\n").lstrip("\ufeff")
+        if not line:                                        # only a truly empty line ends a cue
+            if start is not None and text:
+                yield Segment(start, end, "\n".join(text))
+            start, text, skipping = None, [], False
+            continue
+        if skipping:
+            continue
+        m = _TIMING.search(line)
+        if m:
+            if start is not None:                           # cue without an empty line before
+                if text and text[-1].isdigit():
+                    text.pop()                              # SRT counter after a whitespace-only line
+                if text:
+                    yield Segment(start, end, "\n".join(text))
+            start, end, text = parse_timestamp(m.group(1)), parse_timestamp(m.group(2)), []
+        elif start is None:
+            # WEBVTT header, cue identifiers / SRT counters, NOTE / STYLE / REGION blocks
+            if line.startswith(("NOTE", "STYLE", "REGION")):
+                skipping = True
+        else:
+            cleaned = _clean(line)
+            if cleaned:
+                text.append(cleaned)
+    if start is not None and text:
+        yield Segment(start, end, "\n".join(text))
+
+def _json_events(chunks: Iterable[str]) -> Iterator[dict]:
+    """Objects of the top-level "events" array, decoded one at a time from text chunks."""
+    decoder = json.JSONDecoder()
+    buf, in_array = "", False
+    for piece in chunks:
+        buf += piece
+        if not in_array:
+            i = buf.find('"events"')
+            j = buf.find("[", i) if i >= 0 else -1
+            if j < 0:
+                buf = buf[-32:] if i < 0 else buf
+                continue
+            buf, in_array = buf[j + 1:], True
+        while True:
+            buf = buf.lstrip(" \t\r\n,")
+            if buf.startswith("]"):
+                return
+            try:
+                obj, end = decoder.raw_decode(buf)
+            except ValueError:
+                break                                       # object continues in the next chunk
+            yield obj
+            buf = buf[end:]
+
+def parse_json3(chunks: Iterable[str]) -> Iterator[Segment]:
+    """YouTube json3 captions ({"events": [{"tStartMs", "dDurationMs", "segs": [{"utf8"}]}]})."""
+    for ev in _json_events(chunks):
+        segs = ev.get("segs")
+        if not segs:
+            continue
+        text = "".join(s.get("utf8", "") for s in segs)
+        lines = [_clean(l) for l in text.split("\n")]
+        lines = [l for l in lines if l]
+        if lines:
+            start = ev.get("tStartMs", 0) / 1000.0
+            yield Segment(start, start + ev.get("dDurationMs", 0) / 1000.0, "\n".join(lines))
+
+
+def collapse_rolling(cues: Iterable[Segment], window: int = 4, max_gap: float = 0.1) -> Iterator[Segment]:
+    """
+    Drop the repeated lines of rolling auto-captions: lines already emitted
+    in the last `window` lines are skipped, and a line that extends the
+    previous one by whole words only contributes its new words. Both apply
+    only while cues overlap or follow within max_gap seconds, so a phrase
+    that is really said twice is kept.
+    """
+    recent: deque = deque(maxlen=window)        # [line, end of the last cue showing it]
+    for cue in cues:
+        new = []
+        for line in cue.text.split("\n"):
+            seen = next((r for r in recent if r[0] == line and cue.start <= r[1] + max_gap), None)
+            if seen is not None:
+                seen[1] = max(seen[1], cue.end)
+                continue
+            if recent and cue.start <= recent[-1][1] + max_gap and line.startswith(recent[-1][0] + " "):
+                new.append(line[len(recent[-1][0]):].strip())
+            else:
+                new.append(line)
+            recent.append([line, cue.end])
+        if new:
+            yield Segment(cue.start, cue.end, " ".join(new))
+
+def parse_captions(source: Iterable[str], fmt: Optional[str] = None) -> Iterator[Segment]:
+    """
+    Deduplicated, time-aligned segments from captions in vtt, srt or json3.
+    source yields lines (vtt/srt) or arbitrary text chunks (json3); fmt is
+    sniffed from the first chunk when not given.
+    """
+    it = iter(source)
+    first = next(it, None)
+    if first is None:
+        return
+    if fmt is None:
+        head = first.lstrip("\ufeff \r\n")
+        fmt = "json3" if head.startswith("{") else "vtt"
+    def chained():
+        yield first
+        yield from it
+    if fmt == "json3":
+        yield from collapse_rolling(parse_json3(chained()))
+    elif fmt in ("vtt", "srt"):
+        yield from collapse_rolling(parse_cues(chained()))
+    else:
+        raise ValueError(f"unsupported caption format: {fmt}")
+
+
+class TimedChunk(NamedTuple):
+    start: float
+    end: float
+    text: str
+
+def chunk_by_time(segments: Iterable[Segment], window: float = 60.0, max_words: int = 400) -> Iterator[TimedChunk]:
+    """Group segments into chunks spanning at most `window` seconds (and max_words words)."""
+    texts: List[str] = []
+    start = end = None
+    words = 0
+    for seg in segments:
+        n = len(seg.text.split())
+        if texts and (seg.start - start >= window or words + n > max_words):
+            yield TimedChunk(start, end, " ".join(texts))
+            texts, words = [], 0
+        if not texts:
+            start = seg.start
+        texts.append(seg.text)
+        end = max(seg.end, end or 0.0)
+        words += n
+    if texts:
+        yield TimedChunk(start, end, " ".join(texts))
+
+def cite(url: str, seconds: float) -> str:
+    """Link to a position in a YouTube video."""
+    return f"{url}{'&' if '?' in url else '?'}t={int(seconds)}s"
+
+
+# ---- benchmark: python transcripts.py [--hours N] ----
+def synthetic_autosub_vtt(hours: float = 1.0) -> Iterator[str]:
+    """Rolling auto-caption VTT like YouTube's: each 2-line cue repeats the previous line."""
+    yield "WEBVTT\nKind: captions\nLanguage: en\n\n"
+    t, prev, n = 0.0, " ", 0
+    while t < hours * 3600:
+        words = [f"word{n + i}" for i in range(6)]
+        n += 6
+        tagged = "".join(f"<{format_vtt(t + 0.3 * i)}><c> {w}</c>" for i, w in enumerate(words[1:], 1))
+        yield f"{format_vtt(t)} --> {format_vtt(t + 2.0)} align:start position:0%\n{prev}\n{words[0]}{tagged}\n\n"
+        yield f"{format_vtt(t + 2.0)} --> {format_vtt(t + 2.01)} align:start position:0%\n{prev}\n{' '.join(words)}\n\n"
+        prev = " ".join(words)
+        t += 2.0
+
+def format_vtt(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+if __name__ == "__main__":
+    import io, argparse
+    ap = argparse.ArgumentParser(description="Caption parser throughput on synthetic auto-subs.")
+    ap.add_argument("--hours", type=float, default=1.0)
+    args = ap.parse_args()
+    body = "".join(synthetic_autosub_vtt(args.hours))
+    start = time.perf_counter()
+    segs = list(parse_captions(io.StringIO(body)))
+    took = time.perf_counter() - start
+    chunks = list(chunk_by_time(segs))
+    print(f"{len(body) / 1e6:.1f} MB, {len(segs)} segments, {len(chunks)} chunks in {took:.2f}s "
+          f"({len(body) / 1e6 / took:.1f} MB/s, {args.hours * 3600 / took:.0f}x realtime)")
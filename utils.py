@@ -1,48 +1,134 @@
 # utils.py
-import os, re, json, logging
-from typing import List, Optional
+import os, re, json, logging, threading
+from typing import Callable, Iterable, List, Optional, Tuple
+from chunker import Chunk, Source, iter_chunks
 
 logger = logging.getLogger(__name__)
 
-# try sentence-transformers
-_HAS_ST = False
-try:
-    from sentence_transformers import SentenceTransformer
-    _HAS_ST = True
-except Exception:
-    _HAS_ST = False
-
+# sentence-transformers is imported and loaded on first use (see get_embed_model),
+# so importing utils stays cheap
+EMBED_MODEL_NAME = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+# "torch": SentenceTransformer, "onnx": int8 ONNX Runtime graph (see onnx_embed.py),
+# "onnx-fp32": unquantized ONNX graph
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").lower()
 EMBED_MODEL = None
-if _HAS_ST:
-    try:
-        EMBED_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
-    except Exception as e:
-        logger.warning("SentenceTransformer load failed: %s", e)
-        EMBED_MODEL = None
-        _HAS_ST = False
+_EMBED_LOADED = False
+_EMBED_LOCK = threading.Lock()
+
+def get_embed_model():
+    """Load the embedding model for EMBED_BACKEND once (thread-safe); None if unavailable."""
+    global EMBED_MODEL, _EMBED_LOADED
+    if _EMBED_LOADED:
+        return EMBED_MODEL
+    with _EMBED_LOCK:
+        if not _EMBED_LOADED:
+            try:
+                if EMBED_BACKEND.startswith("onnx"):
+                    from onnx_embed import load_onnx_embedder
+                    EMBED_MODEL = load_onnx_embedder(EMBED_MODEL_NAME, quantized=EMBED_BACKEND != "onnx-fp32")
+                else:
+                    from sentence_transformers import SentenceTransformer
+                    EMBED_MODEL = SentenceTransformer(EMBED_MODEL_NAME)
+            except Exception as e:
+                logger.warning("Embedding model load failed (%s backend): %s", EMBED_BACKEND, e)
+                EMBED_MODEL = None
+            _EMBED_LOADED = True
+    return EMBED_MODEL
+
+# persistent embedding cache; set EMBED_CACHE=off to disable
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE", os.path.join("cache", "embeddings.sqlite"))
+_EMBED_CACHE = None
+
+def get_embed_cache():
+    """Shared EmbeddingCache, or None when disabled / unavailable."""
+    global _EMBED_CACHE
+    if _EMBED_CACHE is None and EMBED_CACHE_PATH.lower() not in ("off", "0", "none", ""):
+        with _EMBED_LOCK:
+            if _EMBED_CACHE is None:
+                try:
+                    from embed_cache import EmbeddingCache
+                    _EMBED_CACHE = EmbeddingCache(EMBED_CACHE_PATH)
+                except Exception as e:
+                    logger.warning("Embedding cache unavailable: %s", e)
+                    _EMBED_CACHE = False
+    return _EMBED_CACHE or None
 
 def clean_text(text: str) -> str:
     text = re.sub(r'\s+', ' ', text)
     text = re.sub(r'<.*?>', ' ', text)
     return text.strip()
 
-def chunk_text(text: str, max_words: int = 400) -> List[str]:
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), max_words):
-        chunks.append(" ".join(words[i:i+max_words]))
-    return chunks
+def chunk_text(text: str, max_words: int = 400, overlap: int = 40) -> List[str]:
+    """Sentence-aligned chunks of at most max_words words, overlapping by up to overlap words."""
+    return [c.text for c in iter_chunks(text, max_tokens=max_words, overlap=overlap)]
+
+def embed_token_counter() -> Tuple[Callable[[str], int], Optional[int]]:
+    """
+    Token counter of the embedding model's tokenizer and its max sequence
+    length, for budgeting chunks; (None, None) if the model is unavailable.
+    """
+    model = get_embed_model()
+    if model is None:
+        return None, None
+    if hasattr(model, "count_tokens"):
+        return model.count_tokens, getattr(model, "max_length", None)
+    tok = model.tokenizer
+    return (lambda text: len(tok.encode(text, add_special_tokens=False))), getattr(model, "max_seq_length", None)
+
+def embed_tokenizer_spec() -> Tuple[Optional[str], Optional[int]]:
+    """
+    (tokenizer path, max sequence length) of the loaded embedding model, so
+    worker processes can count tokens with load_token_counter() without
+    loading the model itself; (None, None) if unavailable.
+    """
+    model = get_embed_model()
+    if model is None:
+        return None, None
+    if hasattr(model, "model_dir"):
+        return model.model_dir, getattr(model, "max_length", None)
+    return getattr(model.tokenizer, "name_or_path", None), getattr(model, "max_seq_length", None)
+
+def load_token_counter(path: str) -> Callable[[str], int]:
+    """Token counter from just a tokenizer (a dir with tokenizer.json, or an HF name/path)."""
+    if os.path.exists(os.path.join(path, "tokenizer.json")):
+        from tokenizers import Tokenizer
+        tok = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        tok.no_truncation()
+        return lambda text: len(tok.encode(text, add_special_tokens=False).ids)
+    from transformers import AutoTokenizer
+    hf = AutoTokenizer.from_pretrained(path)
+    return lambda text: len(hf.encode(text, add_special_tokens=False))
+
+def iter_model_chunks(source: Source, overlap: int = 32) -> Iterable[Chunk]:
+    """Stream chunks sized to the embedding model's sequence length (words if unavailable)."""
+    count, max_len = embed_token_counter()
+    max_tokens = (max_len - 2) if max_len else 256   # room for [CLS]/[SEP]
+    return iter_chunks(source, max_tokens=max_tokens, overlap=overlap, count_tokens=count)
 
-def save_chunked_content(chunks: List[str], outpath: str):
+def save_chunked_content(chunks: Iterable[str], outpath: str):
+    """Write chunks as a JSON list, one at a time (chunks may be a generator)."""
     os.makedirs(os.path.dirname(outpath) or ".", exist_ok=True)
     with open(outpath, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, ensure_ascii=False, indent=2)
+        f.write("[")
+        for i, chunk in enumerate(chunks):
+            f.write(",\n  " if i else "\n  ")
+            f.write(json.dumps(chunk, ensure_ascii=False))
+        f.write("\n]" if f.tell() > 1 else "]")
 
 def embed_text(texts: List[str]):
     """
     Returns list of vectors. If sentence-transformers not available, returns None.
+    Texts already embedded by this model are served from the embedding cache.
     """
-    if EMBED_MODEL is None:
-        logger.warning("Embed model not available (sentence-transformers missing).")
+    model = get_embed_model()
+    if model is None:
+        logger.warning("Embed model not available (%s backend).", EMBED_BACKEND)
         return None
-    return EMBED_MODEL.encode(texts, show_progress_bar=False)
+    encode = lambda batch: model.encode(batch, show_progress_bar=False)
+    cache = get_embed_cache()
+    if cache is None:
+        return encode(texts)
+    from embed_cache import cached_encode
+    # quantized vectors differ slightly, so each backend gets its own cache namespace
+    name = EMBED_MODEL_NAME if EMBED_BACKEND == "torch" else f"{EMBED_MODEL_NAME}@{EMBED_BACKEND}"
+    return cached_encode(cache, name, encode, texts)
@@ -0,0 +1,225 @@
+# vector_index.py
+import os, json, struct, logging
+from typing import List, Tuple, Iterable, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# try faiss (faiss-cpu); fall back to a brute-force NumPy index
+_HAS_FAISS = False
+try:
+    import faiss
+    _HAS_FAISS = True
+except Exception:
+    _HAS_FAISS = False
+
+
+def normalize(vectors) -> np.ndarray:
+    """L2-normalize rows so inner product == cosine similarity."""
+    v = np.asarray(vectors, dtype=np.float32)
+    if v.ndim == 1:
+        v = v.reshape(1, -1)
+    norms = np.linalg.norm(v, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return v / norms
+
+
+class VectorIndex:
+    """
+    Cosine-similarity ANN index keyed by integer ids.
+    Uses FAISS HNSW when installed, otherwise a growable NumPy matrix.
+    Vectors are expected to be L2-normalized (see normalize()).
+    HNSW cannot delete, so removed FAISS ids are tombstoned and the graph is
+    rebuilt without them once they pass compact_ratio of the stored vectors
+    (and always before save()).
+    """
+    def __init__(self, dim: int, hnsw_m: int = 32, ef_search: int = 64, use_faiss: Optional[bool] = None,
+                 compact_ratio: float = 0.2):
+        self.dim = dim
+        self.use_faiss = _HAS_FAISS if use_faiss is None else (use_faiss and _HAS_FAISS)
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.compact_ratio = compact_ratio
+        self._count = 0
+        self._deleted = set()
+        self._live = set()          # FAISS ids not tombstoned
+        if self.use_faiss:
+            self._index = self._new_hnsw()
+        else:
+            # preallocated matrix, doubled on demand so add() stays amortized O(1)
+            self._vecs = np.zeros((1024, dim), dtype=np.float32)
+            self._ids = np.zeros(1024, dtype=np.int64)
+            self._rows = {}
+
+    def __len__(self):
+        return self._count - len(self._deleted)
+
+    def _new_hnsw(self):
+        base = faiss.IndexHNSWFlat(self.dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        base.hnsw.efSearch = self.ef_search
+        return faiss.IndexIDMap(base)
+
+    def compact(self) -> None:
+        """Rebuild the FAISS graph from the live vectors, dropping tombstones."""
+        if not self.use_faiss or not self._deleted:
+            return
+        ids = faiss.vector_to_array(self._index.id_map)
+        keep = np.fromiter((i not in self._deleted for i in ids.tolist()), dtype=bool, count=len(ids))
+        vecs = self._index.index.reconstruct_n(0, self._count)
+        logger.info("Compacting HNSW index: dropping %d of %d vectors", len(ids) - int(keep.sum()), len(ids))
+        self._index = self._new_hnsw()
+        self._count = 0
+        self._deleted = set()
+        if keep.any():
+            self._index.add_with_ids(np.ascontiguousarray(vecs[keep]), ids[keep])
+            self._count = int(keep.sum())
+
+    def add(self, ids: Iterable[int], vectors) -> None:
+        """Add vectors in place under the given ids."""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        vecs = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        if not len(ids):
+            return
+        if self.use_faiss:
+            self._index.add_with_ids(vecs, ids)
+            self._live.update(ids.tolist())
+        else:
+            need = self._count + len(ids)
+            if need > len(self._ids):
+                cap = max(need, 2 * len(self._ids))
+                vbuf = np.zeros((cap, self.dim), dtype=np.float32)
+                ibuf = np.zeros(cap, dtype=np.int64)
+                vbuf[:self._count] = self._vecs[:self._count]
+                ibuf[:self._count] = self._ids[:self._count]
+                self._vecs, self._ids = vbuf, ibuf
+            self._vecs[self._count:need] = vecs
+            self._ids[self._count:need] = ids
+            self._rows.update((int(i), self._count + n) for n, i in enumerate(ids))
+        self._count += len(ids)
+
+    def remove(self, ids: Iterable[int]) -> None:
+        """
+        Drop ids. The NumPy index moves its last row into the hole (O(1));
+        FAISS ids are tombstoned and filtered at search until compact().
+        """
+        if self.use_faiss:
+            for i in ids:
+                if int(i) in self._live:
+                    self._live.discard(int(i))
+                    self._deleted.add(int(i))
+            if len(self._deleted) > self.compact_ratio * self._count:
+                self.compact()
+            return
+        for i in ids:
+            row = self._rows.pop(int(i), None)
+            if row is None:
+                continue
+            last = self._count - 1
+            if row != last:
+                self._vecs[row] = self._vecs[last]
+                self._ids[row] = self._ids[last]
+                self._rows[int(self._ids[row])] = row
+            self._count -= 1
+
+    def search(self, vector, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Return up to top_k (id, cosine score) pairs, best first."""
+        if len(self) == 0 or top_k <= 0:
+            return []
+        q = np.asarray(vector, dtype=np.float32).reshape(1, self.dim)
+        if self.use_faiss:
+            k = min(top_k + len(self._deleted), self._count)
+            scores, ids = self._index.search(q, k)
+            hits = [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i != -1 and i not in self._deleted]
+            return hits[:top_k]
+        k = min(top_k, self._count)
+        sims = self._vecs[:self._count] @ q[0]
+        if k < self._count:
+            top = np.argpartition(-sims, k - 1)[:k]
+        else:
+            top = np.arange(self._count)
+        top = top[np.argsort(-sims[top])]
+        return [(int(self._ids[i]), float(sims[i])) for i in top]
+
+    def ids(self) -> List[int]:
+        """All ids currently stored."""
+        if self.use_faiss:
+            return [i for i in faiss.vector_to_array(self._index.id_map).tolist() if i not in self._deleted]
+        return self._ids[:self._count].tolist()
+
+    def save(self, path: str) -> None:
+        """Persist index (faiss file, or .npz for the NumPy fallback)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        if self.use_faiss:
+            self.compact()
+            faiss.write_index(self._index, tmp)
+        else:
+            with open(tmp, "wb") as f:
+                np.savez(f, dim=self.dim, ids=self._ids[:self._count], vecs=self._vecs[:self._count])
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "VectorIndex":
+        """Load an index written by save()."""
+        with open(path, "rb") as f:
+            magic = f.read(4)
+        if magic.startswith(b"PK"):
+            data = np.load(path)
+            idx = cls(int(data["dim"]), use_faiss=False)
+            idx.add(data["ids"].tolist(), data["vecs"])
+            return idx
+        if not _HAS_FAISS:
+            raise RuntimeError("faiss not installed; cannot read %s" % path)
+        raw = faiss.read_index(path)
+        idx = cls.__new__(cls)
+        idx.dim, idx.use_faiss, idx._index, idx._count = raw.d, True, raw, raw.ntotal
+        idx._deleted = set()
+        idx._live = set(faiss.vector_to_array(raw.id_map).tolist())
+        hnsw = faiss.downcast_index(raw.index).hnsw
+        idx.hnsw_m, idx.ef_search, idx.compact_ratio = hnsw.nb_neighbors(1), hnsw.efSearch, 0.2
+        return idx
+
+
+def read_flat_index(path: str) -> np.ndarray:
+    """
+    Read the raw vectors of a flat faiss index file (IndexFlatL2 / IndexFlatIP).
+    Works without faiss installed, so the shipped faiss.index is always usable.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(4)
+        if magic not in (b"IxF2", b"IxFI"):
+            raise ValueError("Unsupported faiss index type %r in %s" % (magic, path))
+        d, ntotal = struct.unpack("<iq", f.read(12))
+        f.read(16)                                   # two unused header fields
+        f.read(1)                                    # is_trained
+        metric = struct.unpack("<i", f.read(4))[0]
+        if metric > 1:
+            f.read(4)                                # metric_arg
+        size = struct.unpack("<Q", f.read(8))[0]
+        vecs = np.frombuffer(f.read(size * 4), dtype=np.float32)
+    return vecs.reshape(ntotal, d)
+
+
+def load_corpus(index_path: str = "faiss.index", text_path: str = "faiss_text.json") -> Tuple[List[str], np.ndarray]:
+    """Load the shipped (texts, vectors) corpus; vectors row i belongs to texts[i]."""
+    with open(text_path, "r", encoding="utf-8") as f:
+        texts = json.load(f)
+    vecs = read_flat_index(index_path)
+    if len(texts) != len(vecs):
+        logger.warning("Corpus size mismatch: %d texts vs %d vectors", len(texts), len(vecs))
+        n = min(len(texts), len(vecs))
+        texts, vecs = texts[:n], vecs[:n]
+    return texts, vecs
+
+
+def write_flat_index(path: str, vectors) -> None:
+    """Write vectors as a faiss IndexFlatL2 file (readable by faiss.read_index)."""
+    vecs = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, d = vecs.shape
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"IxF2")
+        f.write(struct.pack("<iqqqBi", d, n, 1 << 20, 1 << 20, 1, 1))
+        f.write(struct.pack("<Q", vecs.size))
+        f.write(vecs.tobytes())
+    os.replace(tmp, path)